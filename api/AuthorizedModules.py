@@ -1,14 +1,115 @@
 import time
+import base64
+import logging
 import requests
-import easyocr
+from contextlib import contextmanager
 from  datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from fake_useragent import UserAgent
+from os import getenv
+from ocr import read_captcha_detailed
+from ocr.corpus import record_attempt
+from utils.metrics import registry
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+# Point both at tests/fake_einvoice_server.py for offline load/regression runs
+WEB_BASE = getenv("EINVOICE_WEB_BASE", "https://www.einvoice.nat.gov.tw")
+SERVICE_BASE = getenv("EINVOICE_SERVICE_BASE", "https://service-mc.einvoice.nat.gov.tw")
+
+# Browser-free login endpoints. These are our reading of what the login page's
+# scripts call and have NOT been verified against the live platform (the fake
+# server implements the same paths), so the HTTP strategy is opt-in: it sends
+# real credentials to them. Override them once the actual endpoints are known.
+LOGIN_PAGE_URL = getenv("EINVOICE_LOGIN_PAGE_URL", f"{WEB_BASE}/accounts/login/mw")
+CAPTCHA_URL = getenv("EINVOICE_CAPTCHA_URL", f"{SERVICE_BASE}/btc/cloud/api/common/getCaptcha")
+LOGIN_API_URL = getenv("EINVOICE_LOGIN_API_URL", f"{SERVICE_BASE}/btc/cloud/api/common/login")
+
+HTTP_TIMEOUT = float(getenv("EINVOICE_HTTP_TIMEOUT", "15"))
+# Longest Retry-After (seconds) honoured when the platform throttles with 429
+MAX_RETRY_AFTER = float(getenv("EINVOICE_MAX_RETRY_AFTER", "10"))
+
+# Browser login waits (seconds): redirect after submit, token in sessionStorage
+SUBMIT_TIMEOUT = float(getenv("EINVOICE_SUBMIT_TIMEOUT", "5"))
+TOKEN_TIMEOUT = float(getenv("EINVOICE_TOKEN_TIMEOUT", "20"))
+
+# Requests the lean browser profile never makes (Chrome URL patterns)
+BLOCKED_URL_PATTERNS = [p for p in getenv("EINVOICE_BLOCKED_URLS", ",".join([
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.ico",
+    "*.mp4", "*.webm", "*.mp3",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*facebook.com/tr*",
+])).split(",") if p]
+
+upstream_requests = registry.counter(
+    "hmeicr_einvoice_upstream_requests_total", "E-invoice platform API calls by HTTP status", ("operation", "outcome"))
+upstream_latency = registry.histogram(
+    "hmeicr_einvoice_upstream_duration_seconds", "E-invoice platform API call latency", ("operation",))
+einvoice_logins = registry.counter(
+    "hmeicr_einvoice_logins_total", "E-invoice platform logins", ("method", "outcome"))
+einvoice_login_latency = registry.histogram(
+    "hmeicr_einvoice_login_duration_seconds", "Duration of successful e-invoice logins", ("method",))
+captcha_attempts = registry.counter(
+    "hmeicr_captcha_attempts_total", "Login captcha attempts", ("method", "recognizer", "outcome"))
+
+class EInvoiceLoginError(Exception):
+    """Logging in to the e-invoice platform failed"""
+
+class PhaseTimer:
+    """Accumulates wall-clock seconds per named phase of a login"""
+
+    def __init__(self):
+        self.phases = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def finish(self, **extra) -> dict:
+        self.phases["total"] = time.perf_counter() - self._start
+        self.phases.update(extra)
+        return self.phases
+
+@contextmanager
+def login_metrics(method: str):
+    """Count a login attempt by outcome, time it when it succeeds, and trace it"""
+    start = time.perf_counter()
+    with tracing.span("einvoice.login", method=method) as trace_span:
+        try:
+            yield trace_span
+        except Exception:
+            einvoice_logins.inc(method=method, outcome="failure")
+            raise
+    einvoice_logins.inc(method=method, outcome="success")
+    einvoice_login_latency.observe(time.perf_counter() - start, method=method)
+
+def record_captcha(method: str, image: bytes, ocr_result: dict, accepted: bool):
+    """Save the attempt to the captcha corpus and count its outcome"""
+    record_attempt(image, ocr_result, accepted=accepted)
+    outcome = "accepted" if accepted else ("rejected" if ocr_result["text"] else "unreadable")
+    captcha_attempts.inc(method=method, recognizer=ocr_result.get("recognizer") or "none", outcome=outcome)
+
+# selenium, easyocr (and through it torch) and fake_useragent are imported on
+# first use only: most web workers never log in to the e-invoice platform and
+# should not pay hundreds of MB and seconds of startup for them.
+
+def preload_einvoice_stack(load_model: bool = True):
+    """
+    Eagerly import the browser/OCR stack, for dedicated e-invoice workers
+    that would rather pay the cost at startup than on the first login.
+    """
+    import selenium.webdriver  # noqa: F401
+    import fake_useragent  # noqa: F401
+    if load_model:
+        from ocr.reader import get_reader
+        get_reader()
+    else:
+        import easyocr  # noqa: F401
 
 class EInvoiceAuthenticator:
     def __init__(self, user:str, password:str):
@@ -16,12 +117,43 @@ class EInvoiceAuthenticator:
         self.__password = password
         self.authToken = None
         self.session = None
-        self.ua = UserAgent().random
+        self.loginTimings = None
+        self._ua = None
         pass
 
+    @property
+    def ua(self) -> str:
+        if self._ua is None:
+            from fake_useragent import UserAgent
+            self._ua = UserAgent().random
+        return self._ua
+
     def getAuthRequestsSession(self) -> requests.Session:
-        selenium_cookies, token = self.pesAuth()
-        requests_cookies = {cookie['name']: cookie['value'] for cookie in selenium_cookies}
+        """
+        Log in and build an authenticated requests session.
+
+        EINVOICE_LOGIN_STRATEGY selects how: "selenium" (default), "http"
+        (no browser) or "auto", which tries HTTP first and falls back to
+        Selenium. The HTTP endpoints are unverified, see LOGIN_API_URL.
+        """
+        strategy = getenv("EINVOICE_LOGIN_STRATEGY", "selenium").lower()
+        requests_cookies, token = None, None
+        if strategy in ("auto", "http"):
+            try:
+                with login_metrics("http") as trace_span:
+                    requests_cookies, token = self.httpAuth()
+                    if trace_span:
+                        trace_span.set(**self.loginTimings)
+            except EInvoiceLoginError as e:
+                if strategy == "http":
+                    raise
+                logger.warning(f"{e}; falling back to browser login")
+        if token is None:
+            with login_metrics("browser") as trace_span:
+                selenium_cookies, token = self.pesAuth()
+                if trace_span:
+                    trace_span.set(**self.loginTimings)
+            requests_cookies = {cookie['name']: cookie['value'] for cookie in selenium_cookies}
         session = requests.Session()
         session.cookies.update(requests_cookies)
         headers = {
@@ -34,100 +166,273 @@ class EInvoiceAuthenticator:
         self.session = session
         return session
 
-    def pesAuth(self):
-        # Setup Chrome driver
+    def httpAuth(self, max_attempts: int = 5):
+        """
+        Log in with plain HTTP requests: load the login page for its cookies,
+        fetch the captcha image directly, submit the form and read the token.
 
-        options = Options()
-        options.add_argument('--headless')  # Run in headless mode
-        options.add_argument('--window-size=1280,1024') # The Button is diffrent from moble page!
-        options.add_argument("user-agent={self.ua}")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        driver = driver = webdriver.Chrome(options=options) #uc.Chrome() you may need it in some env
-        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
-        "source": """
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            })
+        Returns:
+            Tuple of (cookies dict, token)
+
+        Raises:
+            EInvoiceLoginError: when no token could be obtained
+        """
+        session = requests.Session()
+        session.headers['User-Agent'] = self.ua
+        timer = PhaseTimer()
+        try:
+            with timer.phase("login_page"):
+                page = session.get(LOGIN_PAGE_URL, timeout=HTTP_TIMEOUT)
+                page.raise_for_status()
+
+            for attempt in range(max_attempts):
+                with timer.phase("captcha"):
+                    captcha_png, captcha_key = self._fetchCaptcha(session)
+                    ocr_result = read_captcha_detailed(captcha_png)
+                if not ocr_result["text"]:
+                    record_captcha("http", captcha_png, ocr_result, accepted=False)
+                    continue
+
+                payload = {
+                    "mobile_phone": self.__user,
+                    "password": self.__password,
+                    "captcha": ocr_result["text"],
+                }
+                if captcha_key:
+                    payload["captchaKey"] = captcha_key
+                with timer.phase("submit"):
+                    response = session.post(LOGIN_API_URL, json=payload, timeout=HTTP_TIMEOUT)
+                token = self._extractToken(response)
+                record_captcha("http", captcha_png, ocr_result, accepted=token is not None)
+                if token:
+                    self.loginTimings = timer.finish(captcha_attempts=attempt + 1, profile="http")
+                    logger.info(f"HTTP login timings: {self.loginTimings}")
+                    return session.cookies.get_dict(), token
+        except (requests.RequestException, ValueError) as e:
+            raise EInvoiceLoginError(f"HTTP login failed: {e}") from e
+        raise EInvoiceLoginError(f"HTTP login failed after {max_attempts} captcha attempts")
+
+    @staticmethod
+    def _fetchCaptcha(session: requests.Session):
         """
-        })
-        driver.get("https://www.einvoice.nat.gov.tw/")
-        element = WebDriverWait(driver, 10).until(
-            EC.visibility_of_element_located((By.CSS_SELECTOR, 'a[title="登入"]'))
-        )
-        element.click()
+        Download a captcha. Accepts either a raw image response (key in a
+        header) or JSON carrying a base64 image and its key.
+
+        Returns:
+            Tuple of (image bytes, captcha key or None)
+        """
+        response = session.get(CAPTCHA_URL, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        if response.headers.get('Content-Type', '').startswith('image/'):
+            return response.content, response.headers.get('X-Captcha-Key')
+        data = response.json()
+        image = data.get('image') or data.get('captchaImage') or ''
+        if ',' in image:  # data:image/png;base64,....
+            image = image.split(',', 1)[1]
+        key = data.get('captchaKey') or data.get('key') or data.get('uuid')
+        return base64.b64decode(image), key
+
+    @staticmethod
+    def _extractToken(response: requests.Response):
+        """Pull the auth token out of a login response, or None if login failed"""
+        if response.status_code != 200:
+            return None
+        try:
+            data = response.json()
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        nested = data.get('data') if isinstance(data.get('data'), dict) else {}
+        for source in (data, nested):
+            for field in ('token', 'saveToken', 'accessToken'):
+                if source.get(field):
+                    return source[field]
+        return None
+
+    def pesAuth(self, max_attempts: int = 5):
+        """
+        Log in by driving headless Chrome through the login form.
+
+        EINVOICE_BROWSER_PROFILE=lean (default) opens the login URL directly
+        with eager page loading and blocks fonts, media, non-PNG images and
+        analytics. Stylesheets are kept because the visibility waits depend
+        on them, and PNGs are kept for the captcha. "full" loads the homepage
+        and clicks through as a real visitor would.
+        Per-phase durations are left in self.loginTimings.
+
+        Args:
+            max_attempts: Captchas to try (unreadable ones included) before giving up
+
+        Raises:
+            EInvoiceLoginError: when no captcha was accepted within max_attempts
+        """
+        from selenium import webdriver
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        lean = getenv("EINVOICE_BROWSER_PROFILE", "lean").lower() == "lean"
+        timer = PhaseTimer()
 
-        element = WebDriverWait(driver, 10).until(
-            EC.visibility_of_element_located((By.ID, 'mobile_phone'))
-        )
-        # Enter username and password
-        element.send_keys(self.__user)
-        driver.find_element(By.ID, "password").send_keys(self.__password)
+        # Setup Chrome driver
+        with timer.phase("browser_start"):
+            options = Options()
+            options.add_argument('--headless')  # Run in headless mode
+            options.add_argument('--window-size=1280,1024') # The Button is diffrent from moble page!
+            options.add_argument(f"user-agent={self.ua}")
+            options.add_argument("--disable-blink-features=AutomationControlled")
+            if lean:
+                # Hand control back once the DOM is ready instead of after every subresource
+                options.page_load_strategy = "eager"
+                options.add_argument("--disable-extensions")
+                options.add_argument("--disable-background-networking")
+            driver = webdriver.Chrome(options=options) #uc.Chrome() you may need it in some env
 
-        while(True):
-        # Screenshot captcha image element
-            captcha_element = WebDriverWait(driver, 10).until(
-                EC.visibility_of_element_located((By.CSS_SELECTOR, '.input-group-text.code_num'))
-            )
+        try:
+            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+            "source": """
+                Object.defineProperty(navigator, 'webdriver', {
+                    get: () => undefined
+                })
+            """
+            })
+            if lean:
+                driver.execute_cdp_cmd("Network.enable", {})
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
 
-            captcha_element.screenshot("dataCaptcha.png")
+            with timer.phase("login_page"):
+                if lean:
+                    driver.get(LOGIN_PAGE_URL)
+                else:
+                    driver.get(f"{WEB_BASE}/")
+                    element = WebDriverWait(driver, 10).until(
+                        EC.visibility_of_element_located((By.CSS_SELECTOR, 'a[title="登入"]'))
+                    )
+                    element.click()
 
-            # Read captcha using EasyOCR
-            reader = easyocr.Reader(['en'], gpu=False)
-            result = reader.readtext("dataCaptcha.png", allowlist='0123456789')
+                element = WebDriverWait(driver, 10).until(
+                    EC.visibility_of_element_located((By.ID, 'mobile_phone'))
+                )
+            # Enter username and password
+            element.send_keys(self.__user)
+            driver.find_element(By.ID, "password").send_keys(self.__password)
 
-            # Print OCR results for verification
-            for detection in result:
-                print(detection)
+            for attempts in range(1, max_attempts + 1):
+                # Screenshot captcha image element
+                with timer.phase("captcha"):
+                    captcha_element = WebDriverWait(driver, 10).until(
+                        EC.visibility_of_element_located((By.CSS_SELECTOR, '.input-group-text.code_num'))
+                    )
 
-            # Assuming first result is correct
-            captcha_text = result[0][1]
+                    # Digit classifier first, then EasyOCR (OCR service when running)
+                    captcha_png = captcha_element.screenshot_as_png
+                    ocr_result = read_captcha_detailed(captcha_png)
+                captcha_text = ocr_result["text"]
+                logger.debug(f"Captcha OCR: {captcha_text!r} ({ocr_result['confidence']:.2f}, {ocr_result['recognizer']})")
+                if not captcha_text:
+                    record_captcha("browser", captcha_png, ocr_result, accepted=False)
+                    driver.find_element(By.CSS_SELECTOR, ".btn.btn-outline-secondary.icon").click()
+                    continue
 
-            old_url = driver.current_url
+                old_url = driver.current_url
 
-            driver.find_element(By.ID, "captcha").send_keys(captcha_text)
-            driver.find_element(By.ID, "submitBtn").click()
+                captcha_input = driver.find_element(By.ID, "captcha")
+                captcha_input.clear()
+                captcha_input.send_keys(captcha_text)
 
-            time.sleep(3)
+                # Wait for the redirect instead of a fixed sleep; no redirect means rejected
+                with timer.phase("submit"):
+                    driver.find_element(By.ID, "submitBtn").click()
+                    try:
+                        WebDriverWait(driver, SUBMIT_TIMEOUT, poll_frequency=0.1).until(EC.url_changes(old_url))
+                        accepted = True
+                    except TimeoutException:
+                        accepted = False
 
-            new_url = driver.current_url
-            if new_url != old_url:
-                break
+                record_captcha("browser", captcha_png, ocr_result, accepted=accepted)
+                if accepted:
+                    break
+                else:
+                    driver.find_element(By.CSS_SELECTOR, ".btn.btn-outline-secondary.icon").click()
             else:
-                driver.find_element(By.CSS_SELECTOR, ".btn.btn-outline-secondary.icon").click()
+                raise EInvoiceLoginError(f"Browser login failed after {max_attempts} captcha attempts")
+
+            # The token appears in sessionStorage shortly after the redirect
+            with timer.phase("token"):
+                token = WebDriverWait(driver, TOKEN_TIMEOUT, poll_frequency=0.1).until(
+                    lambda d: d.execute_script("return sessionStorage.getItem('saveToken');")
+                )
 
-        # Wait to observe result before closing
-        token = None
-        while token == None: #in some case the driver will close before it even get the token.
-            token = driver.execute_script("return sessionStorage.getItem('saveToken');")
-            time.sleep(2)
+            selenium_cookies = driver.get_cookies()
+        finally:
+            driver.quit()
 
-        selenium_cookies = driver.get_cookies()
-        driver.quit()
+        self.loginTimings = timer.finish(captcha_attempts=attempts, profile="lean" if lean else "full")
+        logger.info(f"Browser login timings: {self.loginTimings}")
 
         return selenium_cookies, token
 
-    def getCarrierList(self, max_retries:int=2) -> dict:
-        url = "https://service-mc.einvoice.nat.gov.tw/btc/cloud/api/btc502w/getCarrierList"
+    def _call(self, method:str, url:str, max_retries:int=2, **kwargs):
+        """
+        Send an authenticated request, retrying up to max_retries times.
+        A 429 waits for Retry-After (capped) and retries on the same session;
+        any other failure re-authenticates first, as before.
+
+        Returns:
+            The 200 response, or None when every attempt failed
+        """
         if self.session is None:
             self.getAuthRequestsSession()
+        operation = url.split("?")[0].rsplit("/", 1)[-1]
         for attempt in range(max_retries):
-            response = self.session.get(url)
+            start = time.perf_counter()
+            with tracing.span(f"einvoice.{operation}", attempt=attempt) as trace_span:
+                try:
+                    response = self.session.request(method, url, timeout=HTTP_TIMEOUT, **kwargs)
+                except requests.RequestException as e:
+                    upstream_latency.observe(time.perf_counter() - start, operation=operation)
+                    upstream_requests.inc(operation=operation, outcome="error")
+                    if trace_span:
+                        trace_span.error = str(e)
+                    logger.warning(f"E-invoice request failed: {e}")
+                    continue
+                if trace_span:
+                    trace_span.set(status=response.status_code)
+            upstream_latency.observe(time.perf_counter() - start, operation=operation)
+            upstream_requests.inc(operation=operation, outcome=response.status_code)
             if response.status_code == 200:
-                return response.json()
+                return response
+            if response.status_code == 429:
+                time.sleep(self._retryAfter(response))
             else:
                 # Re-authenticate and retry
                 self.session = self.getAuthRequestsSession()
+        return None
+
+    @staticmethod
+    def _retryAfter(response: requests.Response) -> float:
+        try:
+            delay = float(response.headers.get('Retry-After', 1))
+        except ValueError:
+            delay = 1.0
+        return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+    def getCarrierList(self, max_retries:int=2) -> dict:
+        url = f"{SERVICE_BASE}/btc/cloud/api/btc502w/getCarrierList"
+        response = self._call("GET", url, max_retries)
+        if response is not None:
+            return response.json()
         return {'Failed': 'Failed to retrieve carrier list after retries.'}
 
     def getSearchCarrierInvoiceListJWT(self, searchStartDate:datetime, searchEndDate:datetime, max_retries:int=2) -> str: #returns JWT token
-        url = "https://service-mc.einvoice.nat.gov.tw/btc/cloud/api/btc502w/getSearchCarrierInvoiceListJWT"
-        print("Try to Searching. Start at"+searchStartDate.isoformat()+" end at"+searchStartDate.isoformat())
+        url = f"{SERVICE_BASE}/btc/cloud/api/btc502w/getSearchCarrierInvoiceListJWT"
+        print("Try to Searching. Start at"+searchStartDate.isoformat()+" end at"+searchEndDate.isoformat())
 
         searchStartDate = searchStartDate.replace(hour=15, minute=5, second=23, microsecond=222000) #if not the api may fail
         searchEndDate = searchEndDate.replace(hour=15, minute=5, second=23, microsecond=222000)
-        
-        if self.session is None:
-            self.getAuthRequestsSession()
 
         data = {
             "cardCode": "",
@@ -137,68 +442,33 @@ class EInvoiceAuthenticator:
             "invoiceStatus": "all",
             "isSearchAll": "true"
         }
-        for attempt in range(max_retries):
-            response = self.session.post(
-                url,
-                json=data
-            )
-            if response.status_code == 200:
-                return response.text
-            else:
-                # Re-authenticate and retry
-                self.session = self.getAuthRequestsSession()
+        response = self._call("POST", url, max_retries, json=data)
+        if response is not None:
+            return response.text
         return ''
         
     def searchCarrierInvoice(self, token:str,page=0,size=10, max_retries:int=2) -> dict:
-        url = f"https://service-mc.einvoice.nat.gov.tw/btc/cloud/api/btc502w/searchCarrierInvoice?page={page}&size={size}"
-        if self.session is None:
-            self.getAuthRequestsSession()
+        url = f"{SERVICE_BASE}/btc/cloud/api/btc502w/searchCarrierInvoice?page={page}&size={size}"
         payload = {
             "token": token
         }
-        for attempt in range(max_retries): 
-            response = self.session.post(
-                url,
-                json=payload
-            )
-            if response.status_code == 200:
-                return response.json()
-            else:
-                # Re-authenticate and retry
-                self.session = self.getAuthRequestsSession()
+        response = self._call("POST", url, max_retries, json=payload)
+        if response is not None:
+            return response.json()
         return {'Failed': 'Failed to search carrier invoice after retries.'}
     
     def getCarrierInvoiceData(self, token:str, max_retries:int=2) -> dict:
-        url = "https://service-mc.einvoice.nat.gov.tw/btc/cloud/api/common/getCarrierInvoiceData"
-        if self.session is None:
-            self.getAuthRequestsSession()
-
-        for attempt in range(max_retries):
-            response = self.session.post(
-                url,
-                data = token # Yes it is a string, not json or dict
-            )
-            print(response.text)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                self.session = self.getAuthRequestsSession()
+        url = f"{SERVICE_BASE}/btc/cloud/api/common/getCarrierInvoiceData"
+        response = self._call("POST", url, max_retries,
+                              data = token) # Yes it is a string, not json or dict
+        if response is not None:
+            return response.json()
         return {'Failed:getCarrierInvoiceData()': 'Failed to retrieve carrier invoice data after retries.'}
 
     def getCarrierInvoiceDetail(self, token:str,page:int=0,size:int=10, max_retries:int=2) -> dict:
-        url = f"https://service-mc.einvoice.nat.gov.tw/btc/cloud/api/common/getCarrierInvoiceDetail?page={page}&size={size}"
-        if self.session is None:
-            self.getAuthRequestsSession()
-        
-        for attempt in range(max_retries):
-            response = self.session.post(
-                url,
-                data = token # Yes it is a string, not json or dict
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                self.session = self.getAuthRequestsSession()
+        url = f"{SERVICE_BASE}/btc/cloud/api/common/getCarrierInvoiceDetail?page={page}&size={size}"
+        response = self._call("POST", url, max_retries,
+                              data = token) # Yes it is a string, not json or dict
+        if response is not None:
+            return response.json()
         return {'Failed:getCarrierInvoiceDetail()': 'Failed to retrieve carrier invoice detail after retries.'}
-
@@ -7,6 +7,7 @@ import { setTextSafely, sanitizeCurrency, sanitizeAmount } from './xss-protectio
 // State
 let currentUser = null;
 let csrfToken = null;
+let eventSource = null;
 
 // Fetch CSRF token on page load
 async function fetchCSRFToken() {
@@ -116,6 +117,7 @@ async function login(email, password) {
             clearAllValidationErrors();
             showView('dashboard');
             loadReceipts();
+            subscribeEvents();
         } else {
             alert(data.message || 'Login failed');
         }
@@ -183,6 +185,7 @@ async function logout() {
     } finally {
         // Clear sensitive data from memory
         currentUser = null;
+        unsubscribeEvents();
 
         // Clear all form fields that might contain sensitive data
         document.querySelectorAll('input[type="password"]').forEach(input => {
@@ -200,6 +203,29 @@ async function logout() {
     }
 }
 
+// Push Events (receipt changes from other tabs/devices)
+function subscribeEvents() {
+    if (eventSource || !window.EventSource) return;
+    eventSource = new EventSource('/api/events');
+    // ETag revalidation keeps these refreshes cheap when nothing changed
+    eventSource.addEventListener('receipt_changed', () => loadReceipts());
+    eventSource.addEventListener('resync', () => loadReceipts());
+    // A refused stream (503 when the worker is busy) is not retried by the browser
+    eventSource.onerror = () => {
+        if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+            eventSource = null;
+            setTimeout(() => { if (currentUser) subscribeEvents(); }, 10000);
+        }
+    };
+}
+
+function unsubscribeEvents() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
+
 // Receipt Functions
 async function loadReceipts() {
     try {
@@ -0,0 +1,85 @@
+"""
+Gunicorn configuration for production (pre-fork) serving.
+
+Usage:
+    gunicorn -c gunicorn.conf.py "server:create_app()"
+
+The master imports the heavy, fork-safe modules once so workers share those
+pages copy-on-write; the app itself (MongoClient, limiter storage, background
+threads) is built inside each worker after the fork.
+"""
+
+import importlib
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Per-worker pools (QR decoding) size themselves to their share of the host
+os.environ["WEB_CONCURRENCY"] = str(workers)
+# Threaded workers keep long-lived SSE streams from pinning a whole process;
+# each stream still holds a thread, so streams are capped per worker
+# (EVENT_MAX_STREAMS_PER_WORKER, default half of WEB_THREADS)
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "0"))
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+
+# Workers write metric snapshots here so /metrics can aggregate all of them
+os.environ.setdefault("METRICS_DIR", "/tmp/hmeicr-metrics")
+
+# Build the app per worker, never in the master
+preload_app = False
+
+PRELOAD_MODULES = [
+    "flask",
+    "flask_login",
+    "flask_limiter",
+    "flask_talisman",
+    "werkzeug.security",
+    "pymongo",
+    "bson",
+    "requests",
+]
+for _name in os.getenv("WEB_PRELOAD_MODULES", ",".join(PRELOAD_MODULES)).split(","):
+    if _name.strip():
+        importlib.import_module(_name.strip())
+
+
+def when_ready(server):
+    """
+    Drop metric snapshots of the previous run, create indexes once from the
+    master, then drop its client before forking
+    """
+    from server import ensure_indexes
+    from utils.db import close_client
+    from utils.metrics import clear_snapshots
+    clear_snapshots()
+    try:
+        ensure_indexes()
+    except Exception as e:
+        server.log.warning(f"Could not ensure indexes: {e}")
+    finally:
+        close_client()
+
+
+def post_fork(server, worker):
+    # Any client inherited from the master belongs to another process
+    from utils.db import close_client
+    close_client()
+
+
+def post_worker_init(worker):
+    # Start per-worker threads (and optional e-invoice preload) before serving
+    from server import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    # Drain the background security log writer before the worker goes away
+    from utils.security_logger import flush_security_log
+    flush_security_log()
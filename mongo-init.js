@@ -19,6 +19,10 @@ db = db.getSiblingDB(DB_NAME);
 // -------------------------------
 db.createCollection("users");
 db.createCollection("notes");
+// Cold tier for old receipts (see utils/receipt_archive.py), zstd-compressed
+db.createCollection("receipt_archive", {
+    storageEngine: { wiredTiger: { configString: "block_compressor=zstd" } }
+});
 
 // -------------------------------
 // Indexes
@@ -32,6 +36,19 @@ db.notes.createIndex(
     { owner_id: 1 }
 );
 
+db.receipt.createIndex(
+    { owner_id: 1, change_seq: 1 }
+);
+
+db.receipt.createIndex(
+    { owner_id: 1, receipt_date: 1 }
+);
+
+db.receipt_archive.createIndex(
+    { owner_id: 1, month: 1 },
+    { unique: true }
+);
+
 // -------------------------------
 // Create app user (least privilege)
 // -------------------------------
@@ -0,0 +1,138 @@
+"""
+OCR entry points for captchas and receipt images.
+
+Captchas are first tried against the NumPy digit classifier (ocr.digits);
+only low-confidence results go to EasyOCR. EasyOCR requests go to the local
+OCR service when OCR_SOCKET points at a running one (python -m ocr.service),
+so web workers never load a torch model; otherwise they fall back to an
+in-process EasyOCR reader.
+"""
+
+import logging
+import os
+import time
+from os import getenv
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def _service_client():
+    """Return an OCRClient when the service socket exists, else None"""
+    global _client
+    socket_path = getenv("OCR_SOCKET")
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+    if _client is None or _client.socket_path != socket_path:
+        from ocr.client import OCRClient
+        _client = OCRClient(socket_path)
+    return _client
+
+
+def read_captcha(image: bytes):
+    """
+    Recognize a digits-only captcha.
+
+    Args:
+        image: PNG/JPEG bytes
+
+    Returns:
+        Tuple of (text, confidence); ("", 0.0) when nothing was read
+    """
+    result = read_captcha_detailed(image)
+    return result["text"], result["confidence"]
+
+
+def read_captcha_detailed(image: bytes) -> dict:
+    """
+    Like read_captcha, also reporting which recognizer answered and how long
+    recognition took (used by the captcha corpus).
+
+    Returns:
+        Dict with text, confidence, recognizer and latency_ms
+    """
+    start = time.perf_counter()
+    text, confidence = read_captcha_fast(image)
+    recognizer = "digits"
+    if not text or confidence < float(getenv("CAPTCHA_MIN_CONFIDENCE", "0.5")):
+        text, confidence = read_captcha_easyocr(image)
+        recognizer = "easyocr"
+    return {
+        "text": text,
+        "confidence": confidence,
+        "recognizer": recognizer,
+        "latency_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def read_captcha_fast(image: bytes):
+    """Digit classifier only; ("", 0.0) when no model is trained or it fails"""
+    try:
+        from ocr.digits import get_classifier
+        classifier = get_classifier()
+        if classifier is None:
+            return "", 0.0
+        return classifier.predict(image)
+    except Exception as e:
+        logger.warning(f"Digit classifier failed: {e}")
+        return "", 0.0
+
+
+def read_captcha_easyocr(image: bytes):
+    """EasyOCR via the OCR service when available, else in-process"""
+    client = _service_client()
+    if client is not None:
+        from ocr.client import OCRServiceError
+        try:
+            return client.read_captcha(image)
+        except OCRServiceError as e:
+            logger.warning(f"{e}; falling back to local OCR")
+    from ocr.reader import read_captchas
+    return read_captchas([image])[0]
+
+
+def read_text(image: bytes):
+    """
+    Run free-text OCR over a receipt image.
+
+    Returns:
+        List of (text, confidence) lines in reading order
+    """
+    client = _service_client()
+    if client is not None:
+        from ocr.client import OCRServiceError
+        try:
+            return client.read_text(image)
+        except OCRServiceError as e:
+            logger.warning(f"{e}; falling back to local OCR")
+    from ocr.reader import read_texts
+    return read_texts([image])[0]
+
+
+def read_texts(images, local_fallback: bool = True):
+    """
+    Free-text OCR over several receipt images, sent to the OCR service (or
+    the in-process reader) as one batch.
+
+    Args:
+        images: JPEG/PNG bytes per image
+        local_fallback: Load the in-process reader when the service is down;
+                        when False an OCRServiceError is raised instead
+
+    Returns:
+        One list of (text, confidence) lines per image
+    """
+    from ocr.client import OCRServiceError
+    client = _service_client()
+    if client is not None:
+        try:
+            return client.read_texts(images)
+        except OCRServiceError as e:
+            if not local_fallback:
+                raise
+            logger.warning(f"{e}; falling back to local OCR")
+    elif not local_fallback:
+        raise OCRServiceError(f"OCR service socket {getenv('OCR_SOCKET')} is not available")
+    from ocr.reader import read_texts as read_texts_local
+    return read_texts_local(images)
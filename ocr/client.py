@@ -0,0 +1,87 @@
+"""
+Client for the local OCR worker service (see ocr/service.py).
+"""
+
+import socket
+import threading
+from os import getenv
+
+from ocr.protocol import MAX_PAYLOAD, pack_images, send_message, recv_message
+
+DEFAULT_SOCKET = "/tmp/hmeicr-ocr.sock"
+
+
+class OCRServiceError(RuntimeError):
+    """The OCR service was unreachable or failed to process a request"""
+
+
+class OCRClient:
+    """
+    Thread-safe client keeping one connection per thread to the service.
+    """
+
+    def __init__(self, socket_path: str = None, timeout: float = 30.0):
+        self.socket_path = socket_path or getenv("OCR_SOCKET", DEFAULT_SOCKET)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _reset(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def request(self, kind: str, image: bytes = b"", sizes=None):
+        header = {"kind": kind, "timeout": self.timeout}
+        if sizes is not None:
+            header["sizes"] = sizes
+        try:
+            sock = self._connection()
+            send_message(sock, header, image)
+            header, _ = recv_message(sock)
+        except (OSError, ValueError) as e:
+            self._reset()
+            raise OCRServiceError(f"OCR service unavailable: {e}") from e
+        if header is None:
+            self._reset()
+            raise OCRServiceError("OCR service closed the connection")
+        if not header.get("ok"):
+            raise OCRServiceError(header.get("error", "OCR failed"))
+        return header["result"]
+
+    def read_captcha(self, image: bytes):
+        """Returns (text, confidence)"""
+        text, confidence = self.request("captcha", image)
+        return text, confidence
+
+    def read_text(self, image: bytes):
+        """Returns a list of (text, confidence) lines"""
+        return [tuple(line) for line in self.request("text", image)]
+
+    def read_texts(self, images):
+        """
+        One list of (text, confidence) lines per image. Images travel in as
+        few requests as the payload limit allows, so the service can batch them.
+        """
+        results, chunk, chunk_bytes = [], [], 0
+        for image in list(images) + [None]:
+            if chunk and (image is None or chunk_bytes + len(image) > MAX_PAYLOAD):
+                payload, sizes = pack_images(chunk)
+                results.extend([tuple(line) for line in lines] for lines in self.request("text", payload, sizes))
+                chunk, chunk_bytes = [], 0
+            if image is not None:
+                chunk.append(image)
+                chunk_bytes += len(image)
+        return results
+
+    def stats(self) -> dict:
+        return self.request("stats")
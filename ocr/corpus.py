@@ -0,0 +1,72 @@
+"""
+Captcha corpus capture.
+
+When CAPTCHA_CORPUS_DIR is set, every captcha the login flow tries to solve
+is saved together with what was read, by which recognizer, how long it took
+and whether the platform accepted it. The attempts.jsonl manifest doubles as
+training data for ocr.digits and as input to scripts/bench_captcha.py.
+A fixed share of captchas, chosen by a hash of the file name, is held out
+of training so the benchmark scores the model on images it has not seen.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from os import getenv
+
+MANIFEST = "attempts.jsonl"
+# Share of the corpus never trained on (stable per file, so train and bench agree)
+HOLDOUT_PERCENT = int(getenv("CAPTCHA_HOLDOUT_PERCENT", "20"))
+
+
+def corpus_dir():
+    """Directory to capture into, or None when capture is off"""
+    path = getenv("CAPTCHA_CORPUS_DIR")
+    if not path:
+        return None
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def record_attempt(image: bytes, result: dict, accepted: bool):
+    """
+    Save one captcha attempt if capture is enabled.
+
+    Args:
+        image: Captcha image bytes as sent to the recognizer
+        result: Output of ocr.read_captcha_detailed
+        accepted: Whether the platform accepted the answer
+    """
+    directory = corpus_dir()
+    if directory is None:
+        return
+    name = f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}.png"
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(image)
+    record = {
+        "file": name,
+        "text": result.get("text", ""),
+        "confidence": result.get("confidence", 0.0),
+        "recognizer": result.get("recognizer"),
+        "latency_ms": result.get("latency_ms"),
+        "accepted": accepted,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+    # One write per line keeps concurrent appends from interleaving
+    with open(os.path.join(directory, MANIFEST), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def load_records(manifest_path: str):
+    """All records of a manifest, in capture order"""
+    with open(manifest_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_holdout(filename: str) -> bool:
+    """Whether a corpus file belongs to the held-out benchmark split"""
+    digest = hashlib.blake2b(filename.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % 100 < HOLDOUT_PERCENT
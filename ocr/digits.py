@@ -0,0 +1,288 @@
+"""
+Lightweight digit recognizer for the e-invoice login captcha.
+
+The captcha is digits only, so instead of a general deep OCR model this
+segments the image into per-digit column runs and classifies each glyph by
+nearest neighbours against labelled templates, in NumPy only (no torch).
+Recognition takes milliseconds; callers fall back to EasyOCR when the
+reported confidence is low.
+
+Training data is a JSON-lines manifest of {"file": ..., "text": ...} records
+(the captcha corpus written by ocr.corpus uses this format). Records in the
+corpus hold-out split (ocr.corpus.is_holdout) are left out of training:
+
+    python -m ocr.digits train logs/captcha_corpus/attempts.jsonl
+    python -m ocr.digits predict some_captcha.png
+"""
+
+import argparse
+import io
+import json
+import os
+from os import getenv
+
+import numpy as np
+
+GLYPH_SIZE = (12, 16)  # width, height every digit is resampled to
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "captcha_digits.npz")
+
+
+def load_gray(image: bytes) -> np.ndarray:
+    """Decode PNG/JPEG bytes into a float32 grayscale array in [0, 1]"""
+    from PIL import Image
+    with Image.open(io.BytesIO(image)) as img:
+        return np.asarray(img.convert("L"), dtype=np.float32) / 255.0
+
+
+def otsu_threshold(gray: np.ndarray) -> float:
+    """Global threshold maximizing between-class variance"""
+    hist, edges = np.histogram(gray, bins=256, range=(0.0, 1.0))
+    hist = hist.astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 0.5
+    centers = (edges[:-1] + edges[1:]) / 2
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    sum_bg = np.cumsum(hist * centers)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return float(centers[int(np.argmax(variance))])
+
+
+def binarize(gray: np.ndarray) -> np.ndarray:
+    """Boolean ink mask; ink is assumed to be the minority class"""
+    mask = gray < otsu_threshold(gray)
+    if mask.mean() > 0.5:
+        mask = ~mask
+    return mask
+
+
+def _runs(active: np.ndarray):
+    """[start, end) index pairs of consecutive True values"""
+    padded = np.concatenate(([False], active, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(changes[::2], changes[1::2]))
+
+
+def segment(mask: np.ndarray, expected: int = 0, min_width: int = 2):
+    """
+    Split an ink mask into per-digit column ranges.
+
+    Args:
+        mask: Boolean ink mask (height x width)
+        expected: Number of digits if known (0 = infer from the image)
+        min_width: Column runs narrower than this are treated as noise
+
+    Returns:
+        List of (start, end) column ranges, left to right
+    """
+    height = mask.shape[0]
+    column_ink = mask.sum(axis=0)
+    active = column_ink > max(1, int(height * 0.05))
+    runs = [(s, e) for s, e in _runs(active) if e - s >= min_width]
+    if not runs:
+        return []
+
+    # Split runs that are clearly several touching digits wide
+    widths = np.array([e - s for s, e in runs])
+    typical = float(np.median(widths))
+    split = []
+    for s, e in runs:
+        parts = max(1, int(round((e - s) / typical))) if typical else 1
+        step = (e - s) / parts
+        split.extend((int(s + i * step), int(s + (i + 1) * step)) for i in range(parts))
+    runs = split
+
+    if expected:
+        while len(runs) > expected:
+            # Merge the narrowest run into its closest neighbour
+            i = min(range(len(runs)), key=lambda k: runs[k][1] - runs[k][0])
+            if i == 0:
+                j = 1
+            elif i == len(runs) - 1:
+                j = i - 1
+            else:
+                j = i - 1 if runs[i][0] - runs[i - 1][1] <= runs[i + 1][0] - runs[i][1] else i + 1
+            a, b = sorted((i, j))
+            runs[a:b + 1] = [(runs[a][0], runs[b][1])]
+        while len(runs) < expected:
+            i = max(range(len(runs)), key=lambda k: runs[k][1] - runs[k][0])
+            s, e = runs[i]
+            if e - s < 2:
+                break
+            mid = (s + e) // 2
+            runs[i:i + 1] = [(s, mid), (mid, e)]
+    return runs
+
+
+def glyph_features(mask: np.ndarray, start: int, end: int) -> np.ndarray:
+    """Crop one digit to its ink bounding box, resample and normalize it"""
+    from PIL import Image
+    glyph = mask[:, start:end]
+    rows = np.flatnonzero(glyph.any(axis=1))
+    if rows.size:
+        glyph = glyph[rows[0]:rows[-1] + 1]
+    img = Image.fromarray((glyph * 255).astype(np.uint8)).resize(GLYPH_SIZE, Image.BILINEAR)
+    vec = np.asarray(img, dtype=np.float32).ravel() / 255.0
+    vec -= vec.mean()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def extract_glyphs(image: bytes, expected: int = 0) -> np.ndarray:
+    """Feature matrix (digits x features) for a captcha image"""
+    mask = binarize(load_gray(image))
+    ranges = segment(mask, expected)
+    if not ranges:
+        return np.zeros((0, GLYPH_SIZE[0] * GLYPH_SIZE[1]), dtype=np.float32)
+    return np.stack([glyph_features(mask, s, e) for s, e in ranges])
+
+
+class DigitClassifier:
+    """k-nearest-neighbour classifier over stored glyph templates"""
+
+    def __init__(self, features: np.ndarray, labels: np.ndarray, digits: int = 0, k: int = 3):
+        self.features = features.astype(np.float32)
+        self.labels = labels.astype(np.int8)
+        self.digits = digits
+        self.k = k
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(data["features"], data["labels"], int(data["digits"]))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(path, features=self.features, labels=self.labels,
+                            digits=np.int32(self.digits))
+
+    def classify(self, glyphs: np.ndarray):
+        """
+        Returns:
+            Tuple of (digit string, per-digit confidence array)
+        """
+        if glyphs.shape[0] == 0:
+            return "", np.zeros(0)
+        similarity = glyphs @ self.features.T  # cosine, both sides are unit length
+        k = min(self.k, similarity.shape[1])
+        nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        digits, confidence = [], []
+        for row, idx in zip(similarity, nearest):
+            votes = np.bincount(self.labels[idx], weights=np.maximum(row[idx], 0), minlength=10)
+            best = int(np.argmax(votes))
+            best_sim = row[self.labels == best].max()
+            other = row[self.labels != best]
+            runner_up = other.max() if other.size else 0.0
+            # High when the match is close and clearly separated from other digits
+            confidence.append(max(0.0, best_sim) * min(1.0, max(0.0, (best_sim - runner_up) * 5)))
+            digits.append(str(best))
+        return "".join(digits), np.array(confidence)
+
+    def predict(self, image: bytes):
+        """
+        Recognize a captcha.
+
+        Returns:
+            Tuple of (text, confidence) where confidence is the weakest digit's
+        """
+        expected = int(getenv("CAPTCHA_DIGITS", "0")) or self.digits
+        glyphs = extract_glyphs(image, expected)
+        if expected and glyphs.shape[0] != expected:
+            return "", 0.0
+        text, confidence = self.classify(glyphs)
+        return text, float(confidence.min()) if confidence.size else 0.0
+
+
+_classifier = None
+_classifier_path = None
+
+
+def get_classifier():
+    """Load the trained model once per process; None if it has not been trained"""
+    global _classifier, _classifier_path
+    path = getenv("CAPTCHA_MODEL_PATH", DEFAULT_MODEL_PATH)
+    if _classifier_path != path:
+        _classifier = DigitClassifier.load(path) if os.path.exists(path) else None
+        _classifier_path = path
+    return _classifier
+
+
+def read_manifest(manifest_path: str, include_holdout: bool = True):
+    """Yield (image bytes, label) for accepted/labelled records of a manifest"""
+    from ocr.corpus import is_holdout
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            label = record.get("label") or (record.get("text") if record.get("accepted", True) else None)
+            if not label or not label.isdigit():
+                continue
+            if not include_holdout and is_holdout(record["file"]):
+                continue
+            path = os.path.join(base, record["file"])
+            if os.path.exists(path):
+                with open(path, "rb") as img:
+                    yield img.read(), label
+
+
+def train(manifest_path: str, max_per_digit: int = 300, seed: int = 0) -> DigitClassifier:
+    """Build a classifier from every correctly segmented labelled captcha outside the hold-out split"""
+    features, labels, lengths = [], [], []
+    skipped = 0
+    for image, label in read_manifest(manifest_path, include_holdout=False):
+        glyphs = extract_glyphs(image, len(label))
+        if glyphs.shape[0] != len(label):
+            skipped += 1
+            continue
+        features.append(glyphs)
+        labels.extend(int(c) for c in label)
+        lengths.append(len(label))
+    if not features:
+        raise ValueError("No usable labelled captchas in manifest")
+
+    features = np.concatenate(features)
+    labels = np.array(labels, dtype=np.int8)
+    rng = np.random.default_rng(seed)
+    keep = []
+    for digit in range(10):
+        idx = np.flatnonzero(labels == digit)
+        if idx.size > max_per_digit:
+            idx = rng.choice(idx, max_per_digit, replace=False)
+        keep.extend(idx.tolist())
+    keep = np.array(sorted(keep))
+    digits = int(np.bincount(lengths).argmax())
+    print(f"Trained on {len(lengths)} captchas ({skipped} skipped), {keep.size} templates, {digits} digits")
+    return DigitClassifier(features[keep], labels[keep], digits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Captcha digit classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_train = sub.add_parser("train", help="train from a labelled manifest")
+    p_train.add_argument("manifest")
+    p_train.add_argument("--out", default=getenv("CAPTCHA_MODEL_PATH", DEFAULT_MODEL_PATH))
+    p_train.add_argument("--max-per-digit", type=int, default=300)
+    p_predict = sub.add_parser("predict", help="recognize captcha image files")
+    p_predict.add_argument("images", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        train(args.manifest, args.max_per_digit).save(args.out)
+        print(f"Saved model to {args.out}")
+    else:
+        classifier = get_classifier()
+        if classifier is None:
+            parser.error("no trained model; run `train` first")
+        for path in args.images:
+            with open(path, "rb") as f:
+                text, confidence = classifier.predict(f.read())
+            print(f"{path}: {text} ({confidence:.2f})")
+
+
+if __name__ == "__main__":
+    main()
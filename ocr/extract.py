@@ -0,0 +1,121 @@
+"""
+Receipt field extraction.
+
+Turns the OCR lines of a receipt photo (ocr.read_text output) into draft
+receipt fields: merchant title, total amount, currency and date. Dates in
+Republic of China years (e.g. 113/05/01, 民國113年5月1日) are converted to
+Gregorian. Every field is a best guess and may be None; the user confirms
+the draft before it becomes a receipt.
+"""
+
+import re
+from datetime import datetime
+
+# Lines naming the amount actually paid, strongest first
+TOTAL_KEYWORDS = ("實付", "應付", "總計", "合計", "總額", "總金額", "TOTAL", "AMOUNT DUE", "金額", "小計", "SUBTOTAL")
+CURRENCY_MARKERS = (
+    (re.compile(r"NT\$|NTD|TWD|新台幣|新臺幣|元"), "TWD"),
+    (re.compile(r"US\$|USD"), "USD"),
+    (re.compile(r"JPY|円|¥"), "JPY"),
+    (re.compile(r"EUR|€"), "EUR"),
+    (re.compile(r"HK\$|HKD"), "HKD"),
+)
+MERCHANT_HINTS = ("有限公司", "股份", "公司", "商店", "商行", "餐廳", "門市", "店", "CO.", "LTD", "INC")
+MERCHANT_SKIP = re.compile(r"電話|TEL|統一編號|統編|地址|發票|收據|RECEIPT|INVOICE|\d{2,}[-/:]\d{2}", re.IGNORECASE)
+
+_NUMBER = re.compile(r"(?<![\d.])(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{1,2}))?(?![\d])")
+_DATE_PATTERNS = (
+    # 2024-05-01, 2024/5/1, 2024.05.01, 2024年5月1日
+    (re.compile(r"(?<!\d)(20\d{2}|19\d{2})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})"), 0),
+    # ROC: 民國113年5月1日, 113/05/01, 113.05.01, 113-05-01
+    (re.compile(r"(?:民國\s*)?(?<!\d)(1[0-4]\d|[89]\d)\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})"), 1911),
+)
+
+
+def _amounts(text):
+    """Numeric values in a line, ignoring thousands separators"""
+    values = []
+    for match in _NUMBER.finditer(text):
+        whole, fraction = match.group(1).replace(",", ""), match.group(2)
+        values.append(f"{whole}.{fraction}" if fraction else whole)
+    return values
+
+
+def find_amount(lines):
+    """
+    The receipt total: the number on (or right after) the strongest total
+    keyword line, else the largest amount written with a currency marker.
+    """
+    upper = [text.upper() for text in lines]
+    for keyword in TOTAL_KEYWORDS:
+        for i, text in enumerate(upper):
+            if keyword not in text:
+                continue
+            after = text.split(keyword, 1)[1]
+            candidates = _amounts(after) or (_amounts(upper[i + 1]) if i + 1 < len(upper) else [])
+            if candidates:
+                return candidates[-1]
+    marked = [value for text in lines if any(p.search(text) for p, _ in CURRENCY_MARKERS)
+              for value in _amounts(text)]
+    if marked:
+        return max(marked, key=float)
+    return None
+
+
+def find_date(lines, today=None):
+    """First plausible date (not in the future), as YYYY-MM-DD"""
+    today = today or datetime.utcnow()
+    for text in lines:
+        for pattern, offset in _DATE_PATTERNS:
+            for match in pattern.finditer(text):
+                year, month, day = (int(g) for g in match.groups())
+                try:
+                    value = datetime(year + offset, month, day)
+                except ValueError:
+                    continue
+                if value.year >= 1990 and value <= today:
+                    return value.strftime("%Y-%m-%d")
+    return None
+
+
+def find_currency(lines):
+    text = " ".join(lines)
+    for pattern, currency in CURRENCY_MARKERS:
+        if pattern.search(text):
+            return currency
+    return None
+
+
+def find_merchant(lines, head=6):
+    """A store-like line near the top, else the first line that is mostly letters"""
+    top = [text.strip() for text in lines[:head] if text.strip()]
+    candidates = [text for text in top if not MERCHANT_SKIP.search(text) and len(text) >= 2]
+    for text in candidates:
+        if any(hint in text.upper() for hint in MERCHANT_HINTS):
+            return text[:200]
+    for text in candidates:
+        letters = sum(ch.isalpha() for ch in text)
+        if letters >= max(2, len(text) // 2):
+            return text[:200]
+    return None
+
+
+def extract_fields(lines, min_confidence: float = 0.2) -> dict:
+    """
+    Extract draft receipt fields from OCR output.
+
+    Args:
+        lines: List of (text, confidence) in reading order
+        min_confidence: Lines read with lower confidence are ignored
+
+    Returns:
+        Dict with title, amount (decimal string), currency and receipt_date
+        (YYYY-MM-DD); each None when not found
+    """
+    texts = [text for text, confidence in lines if confidence >= min_confidence]
+    return {
+        "title": find_merchant(texts),
+        "amount": find_amount(texts),
+        "currency": find_currency(texts),
+        "receipt_date": find_date(texts),
+    }
@@ -0,0 +1,244 @@
+"""
+Receipt photo pipeline.
+
+Uploads only store the photo and enqueue its draft id, so the request
+returns at once. A dispatcher thread per web worker takes ids off a bounded
+queue (a full queue refuses the upload: backpressure instead of an
+ever-growing backlog), groups them into batches and runs each batch on a
+small spawn-based process pool where every process keeps its OCR model
+loaded. At most one batch per pool process is in flight. In the pool a
+photo is thumbnailed, downscaled for OCR, read with ocr.read_texts and
+turned into draft fields by ocr.extract.
+
+With OCR_SOCKET set, the OCR model lives in the OCR service only: batches
+run on threads of the web worker instead of a process pool and never load
+EasyOCR there (a batch fails while the service is down).
+
+Stage timings are recorded in hmeicr_receipt_pipeline_stage_seconds:
+queue (enqueue to batch start, per photo), load and save (per batch, in the
+web worker) and thumbnail, ocr and extract (per batch, in the pool).
+"""
+
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from os import getenv
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+# Phone photos are downscaled before OCR; receipt text stays legible
+OCR_MAX_SIDE = int(getenv("RECEIPT_OCR_MAX_SIDE", "1600"))
+
+stage_latency = metrics.registry.histogram(
+    "hmeicr_receipt_pipeline_stage_seconds", "Receipt photo pipeline stage duration", ("stage",))
+batch_sizes = metrics.registry.histogram(
+    "hmeicr_receipt_pipeline_batch_size", "Photos per pipeline batch", (), buckets=(1, 2, 4, 8, 16, 32))
+photos = metrics.registry.counter(
+    "hmeicr_receipt_pipeline_photos_total", "Receipt photos by pipeline outcome", ("outcome",))
+queue_depth = metrics.registry.gauge(
+    "hmeicr_receipt_pipeline_queue_depth", "Receipt photos waiting for the pipeline")
+
+
+# ----- pool side -----
+def _encode_jpeg(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def prepare_image(data: bytes):
+    """
+    Decode a photo (honouring EXIF rotation) into a JPEG thumbnail and a
+    downscaled JPEG for OCR.
+
+    Raises:
+        ValueError: If the data is not a readable image
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"Unreadable image: {e}")
+    thumbnail = image.copy()
+    thumbnail.thumbnail(THUMBNAIL_SIZE)
+    if max(image.size) > OCR_MAX_SIDE:
+        image.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE))
+    return _encode_jpeg(thumbnail, 80), _encode_jpeg(image, 90)
+
+
+def process_batch(images, local_ocr: bool = True):
+    """
+    Executed inside a pool process (or thread when the OCR service is
+    used): thumbnail, OCR and extraction for a batch. local_ocr=False
+    keeps OCR on the service.
+
+    Returns:
+        (results, timings): one dict per image with thumbnail, lines, fields
+        and error; timings maps stage name to seconds spent on the batch
+    """
+    from ocr import read_texts
+    from ocr.extract import extract_fields
+
+    timings = {}
+    results = [{"thumbnail": None, "lines": [], "fields": {}, "error": None} for _ in images]
+
+    start = time.perf_counter()
+    ocr_inputs = {}
+    for i, data in enumerate(images):
+        try:
+            results[i]["thumbnail"], ocr_inputs[i] = prepare_image(data)
+        except ValueError as e:
+            results[i]["error"] = str(e)
+    timings["thumbnail"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if ocr_inputs:
+        try:
+            for i, lines in zip(ocr_inputs, read_texts(list(ocr_inputs.values()), local_fallback=local_ocr)):
+                results[i]["lines"] = [(text, float(confidence)) for text, confidence in lines]
+        except Exception as e:
+            # No OCR backend (or it failed): keep the thumbnails, fields are typed in by hand
+            for i in ocr_inputs:
+                results[i]["error"] = f"OCR failed: {e}"
+    timings["ocr"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for result in results:
+        if result["lines"]:
+            result["fields"] = extract_fields(result["lines"])
+    timings["extract"] = time.perf_counter() - start
+    return results, timings
+
+
+def _pool_init():
+    from ocr.service import _pool_init as ignore_sigint
+    ignore_sigint()
+
+
+# ----- web worker side -----
+class ReceiptPipeline:
+    """
+    Bounded queue, dispatcher thread and process pool (created per process).
+
+    Args:
+        load: Callable(ids) -> list of (id, image bytes) for the drafts it
+              could claim; drafts claimed elsewhere are left out
+        save: Callable(id, result) storing one process_batch result
+        processes: Pool processes (each loads an OCR model), or threads
+                   when OCR_SOCKET is set
+        queue_size: Photos waiting before uploads are refused
+        max_batch: Maximum photos per batch
+        max_wait: Seconds to wait for a batch to fill
+    """
+
+    def __init__(self, load, save, processes: int = 1, queue_size: int = 64,
+                 max_batch: int = 4, max_wait: float = 0.2):
+        self.load = load
+        self.save = save
+        self.processes = processes
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = None
+        self._pool = None
+        self._slots = None
+        self._pid = None
+        self._remote_ocr = False
+        self._lock = threading.Lock()
+        metrics.registry.register_collector(
+            lambda: queue_depth.set(self._queue.qsize() if self._pid == os.getpid() else 0))
+
+    def _ensure_started(self):
+        # Threads, queues and pools do not survive fork(); start fresh ones per process
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._queue = queue.Queue(self.queue_size)
+                    self._slots = threading.BoundedSemaphore(self.processes)
+                    self._remote_ocr = bool(getenv("OCR_SOCKET"))
+                    self._pool = self._new_pool()
+                    self._pid = pid
+                    threading.Thread(target=self._run, name="receipt-pipeline", daemon=True).start()
+
+    def _new_pool(self):
+        if self._remote_ocr:
+            return ThreadPoolExecutor(self.processes, thread_name_prefix="receipt-pipeline-batch")
+        return ProcessPoolExecutor(self.processes, mp_context=get_context("spawn"), initializer=_pool_init)
+
+    def submit(self, draft_id) -> bool:
+        """Enqueue without blocking; returns False when the pipeline is full"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((draft_id, time.monotonic()))
+            return True
+        except queue.Full:
+            photos.inc(outcome="rejected")
+            return False
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            now = time.monotonic()
+            for _, queued in batch:
+                stage_latency.observe(now - queued, stage="queue")
+            # Wait for a free pool process before loading, so photos are not held in memory while queued
+            self._slots.acquire()
+            try:
+                with stage_latency.time(stage="load"):
+                    items = self.load([draft_id for draft_id, _ in batch])
+            except Exception as e:
+                logger.error(f"Receipt pipeline could not load drafts: {e}")
+                items = []
+            if not items:
+                self._slots.release()
+                continue
+            batch_sizes.observe(len(items))
+            ids = [draft_id for draft_id, _ in items]
+            images = [image for _, image in items]
+            try:
+                future = self._pool.submit(process_batch, images, not self._remote_ocr)
+            except BrokenProcessPool:
+                # A pool process died (e.g. killed for memory); later batches get a fresh pool
+                self._pool = self._new_pool()
+                future = self._pool.submit(process_batch, images, not self._remote_ocr)
+            future.add_done_callback(lambda f, ids=ids: self._finish(ids, f))
+
+    def _finish(self, ids, future):
+        self._slots.release()
+        try:
+            results, timings = future.result()
+        except Exception as e:
+            logger.error(f"Receipt pipeline batch failed: {e}")
+            results = [{"thumbnail": None, "lines": [], "fields": {}, "error": str(e)} for _ in ids]
+            timings = {}
+        for stage, seconds in timings.items():
+            stage_latency.observe(seconds, stage=stage)
+        with stage_latency.time(stage="save"):
+            for draft_id, result in zip(ids, results):
+                try:
+                    self.save(draft_id, result)
+                    photos.inc(outcome="failed" if result["error"] else "ready")
+                except Exception as e:
+                    logger.error(f"Receipt pipeline could not save draft {draft_id}: {e}")
@@ -0,0 +1,75 @@
+"""
+Wire format shared by the OCR service and its clients.
+
+Each message is a length-prefixed JSON header followed by a length-prefixed
+binary payload (the image for requests, empty for responses). A batched
+request carries several images back to back in one payload, with their
+lengths in the header's "sizes" list.
+"""
+
+import json
+import struct
+
+_LEN = struct.Struct("!I")
+MAX_HEADER = 64 * 1024
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+
+def send_message(sock, header: dict, payload: bytes = b""):
+    raw = json.dumps(header).encode("utf-8")
+    sock.sendall(_LEN.pack(len(raw)) + raw + _LEN.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            raise ConnectionError("connection closed mid-message")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock):
+    """
+    Read one message.
+
+    Returns:
+        Tuple of (header dict, payload bytes), or (None, b"") on a clean EOF
+    """
+    first = sock.recv(_LEN.size)
+    if not first:
+        return None, b""
+    if len(first) < _LEN.size:
+        first += _recv_exact(sock, _LEN.size - len(first))
+    (header_len,) = _LEN.unpack(first)
+    if header_len > MAX_HEADER:
+        raise ValueError("header too large")
+    header = json.loads(_recv_exact(sock, header_len))
+    (payload_len,) = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    if payload_len > MAX_PAYLOAD:
+        raise ValueError("payload too large")
+    payload = _recv_exact(sock, payload_len) if payload_len else b""
+    return header, payload
+
+
+def pack_images(images):
+    """Payload and "sizes" header field for a batched request"""
+    return b"".join(images), [len(image) for image in images]
+
+
+def unpack_images(payload: bytes, sizes):
+    """
+    Split a batched payload back into images.
+
+    Raises:
+        ValueError: If the sizes do not add up to the payload length
+    """
+    if sum(sizes) != len(payload) or any(size < 0 for size in sizes):
+        raise ValueError("sizes do not match payload")
+    images, offset = [], 0
+    for size in sizes:
+        images.append(payload[offset:offset + size])
+        offset += size
+    return images
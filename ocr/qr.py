@@ -0,0 +1,184 @@
+"""
+QR-code reading for paper Taiwan uniform invoices (電子發票證明聯).
+
+A printed e-invoice carries two QR codes. The left one starts with a fixed
+77-character header (invoice number, ROC date, random code, untaxed and
+total amount in hex, buyer and seller tax IDs, verification code) followed
+by ":"-separated item fields. The right one starts with "**" and continues
+the item list. Photos are decoded with OpenCV's QR detector on a per-process
+spawn pool. Every web worker has its own pool, so by default each gets its
+share of the host's CPUs (cpu_count / WEB_CONCURRENCY, at least one).
+"""
+
+import base64
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import get_context
+from os import getenv
+
+# Larger photos are downscaled first: QR finder patterns survive, decoding gets much faster
+DECODE_MAX_SIDE = int(getenv("QR_DECODE_MAX_SIDE", "1600"))
+HEADER_LENGTH = 77
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+# ----- decoding (runs in pool processes) -----
+def _detect(image):
+    import cv2
+    detector = cv2.QRCodeDetector()
+    ok, texts, _, _ = detector.detectAndDecodeMulti(image)
+    return [t for t in texts if t] if ok else []
+
+
+def decode_image(data: bytes) -> list:
+    """
+    Decode every QR code in a photo.
+
+    Returns:
+        List of payload strings (empty when none could be read)
+
+    Raises:
+        ValueError: If the data is not a readable image
+    """
+    import numpy as np
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    try:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("L")
+    except (UnidentifiedImageError, OSError):
+        raise ValueError("Unreadable image")
+    full = np.asarray(image)
+    if max(image.size) > DECODE_MAX_SIDE:
+        image.thumbnail((DECODE_MAX_SIDE, DECODE_MAX_SIDE))
+        texts = _detect(np.asarray(image))
+        # Small codes in a large photo may need full resolution
+        if len(texts) < 2:
+            texts = list(dict.fromkeys(texts + _detect(full)))
+        return texts
+    return _detect(full)
+
+
+def _decode_safe(data: bytes):
+    try:
+        return decode_image(data), None
+    except ValueError as e:
+        return [], str(e)
+
+
+def _pool_init():
+    from ocr.service import _pool_init as ignore_sigint
+    ignore_sigint()
+    import cv2
+    cv2.setNumThreads(1)  # one process per core already
+
+
+def pool_size() -> int:
+    """QR_DECODE_PROCESSES, or this worker's share of the host's CPUs"""
+    configured = int(getenv("QR_DECODE_PROCESSES", "0"))
+    if configured:
+        return configured
+    return max(1, (os.cpu_count() or 1) // max(1, int(getenv("WEB_CONCURRENCY", "1"))))
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(pool_size(), mp_context=get_context("spawn"), initializer=_pool_init)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def decode_images(images) -> list:
+    """
+    Decode a batch of photos in parallel.
+
+    Returns:
+        One (payloads, error) tuple per image, in order
+    """
+    global _pool
+    if not images:
+        return []
+    try:
+        return list(_get_pool().map(_decode_safe, images))
+    except BrokenProcessPool:
+        with _pool_lock:
+            _pool = None
+        raise
+
+
+# ----- payload parsing -----
+def _roc_date(value: str) -> datetime:
+    return datetime(int(value[:3]) + 1911, int(value[3:5]), int(value[5:7]))
+
+
+def _decode_items(fields, encoding):
+    """(name, quantity, unit price) triples from the item part of a QR payload"""
+    items = []
+    for i in range(0, len(fields) - 2, 3):
+        name, quantity, price = fields[i:i + 3]
+        if encoding == "2":
+            try:
+                name = base64.b64decode(name).decode("utf-8", "replace")
+            except ValueError:
+                pass
+        items.append({"name": name.strip(), "quantity": quantity.strip(), "unit_price": price.strip()})
+    return items
+
+
+def is_invoice_header(payload: str) -> bool:
+    head = payload[:HEADER_LENGTH]
+    return (len(head) == HEADER_LENGTH and head[:2].isalpha() and head[2:17].isdigit()
+            and all(c in "0123456789abcdefABCDEF" for c in head[21:37]) and head[37:53].isdigit())
+
+
+def parse_invoice_qr(payloads) -> list:
+    """
+    Parse the QR payloads read from one photo into invoices.
+
+    Right-hand ("**") payloads are appended to the left-hand payload of the
+    same photo; unrelated QR codes are ignored.
+
+    Returns:
+        List of dicts with invoice_number, invoice_date (datetime),
+        random_code, sales_amount, total_amount (TWD), buyer_ban, seller_ban
+        and items
+
+    Raises:
+        ValueError: If a payload looks like an invoice but is malformed
+    """
+    lefts = [p for p in payloads if is_invoice_header(p)]
+    continuation = "".join(p[2:] for p in payloads if p.startswith("**"))
+    invoices = []
+    for payload in lefts:
+        head, rest = payload[:HEADER_LENGTH], payload[HEADER_LENGTH:]
+        if len(lefts) == 1:
+            # The right code continues the left one's text where it was cut off
+            rest += continuation
+        # Exactly one separator: an empty seller custom area is itself an empty field
+        rest = rest[1:] if rest.startswith(":") else rest
+        fields = rest.split(":") if rest else []
+        # Seller custom area, items in this code, items in total, encoding, then items
+        encoding = fields[3] if len(fields) > 3 else None
+        try:
+            invoice_date = _roc_date(head[10:17])
+        except ValueError:
+            raise ValueError(f"Invalid invoice date in QR code: {head[10:17]}")
+        invoices.append({
+            "invoice_number": head[:10].upper(),
+            "invoice_date": invoice_date,
+            "random_code": head[17:21],
+            "sales_amount": int(head[21:29], 16),
+            "total_amount": int(head[29:37], 16),
+            "buyer_ban": None if head[37:45] == "00000000" else head[37:45],
+            "seller_ban": head[45:53],
+            "items": _decode_items(fields[4:], encoding) if len(fields) > 4 else [],
+        })
+    return invoices
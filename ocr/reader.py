@@ -0,0 +1,84 @@
+"""
+Local EasyOCR backend.
+Readers are created once per process and reused; easyocr (and torch) is only
+imported when a reader is first needed.
+"""
+
+import threading
+from os import getenv
+
+CAPTCHA_LANGS = ['en']
+CAPTCHA_ALLOWLIST = '0123456789'
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def text_langs():
+    """Languages used for free-text (receipt) OCR"""
+    return [lang.strip() for lang in getenv("OCR_TEXT_LANGS", "ch_tra,en").split(",") if lang.strip()]
+
+
+def get_reader(langs=None):
+    """Return the process-wide EasyOCR reader for langs, loading the model on first use"""
+    key = tuple(langs or CAPTCHA_LANGS)
+    reader = _readers.get(key)
+    if reader is None:
+        with _readers_lock:
+            reader = _readers.get(key)
+            if reader is None:
+                import easyocr
+                reader = easyocr.Reader(list(key), gpu=False)
+                _readers[key] = reader
+    return reader
+
+
+def best_detection(detections):
+    """
+    Pick the captcha answer from EasyOCR detections.
+
+    Returns:
+        Tuple of (text, confidence); ("", 0.0) when nothing was detected
+    """
+    if not detections:
+        return "", 0.0
+    _, text, confidence = detections[0]
+    return text, float(confidence)
+
+
+def read_captchas(images):
+    """
+    Recognize a batch of captcha images (PNG/JPEG bytes) in one inference call.
+
+    Returns:
+        List of (text, confidence), one per image
+    """
+    reader = get_reader(CAPTCHA_LANGS)
+    if len(images) == 1:
+        batches = [reader.readtext(images[0], allowlist=CAPTCHA_ALLOWLIST)]
+    else:
+        batches = reader.readtext_batched(images, allowlist=CAPTCHA_ALLOWLIST)
+    return [best_detection(detections) for detections in batches]
+
+
+def read_texts(images):
+    """
+    Run free-text OCR over receipt images.
+
+    Returns:
+        List (one per image) of lists of (text, confidence) lines in reading order
+    """
+    reader = get_reader(text_langs())
+    results = []
+    for image in images:
+        detections = reader.readtext(image, paragraph=False)
+        # Sort top-to-bottom, then left-to-right by the box's top-left corner
+        detections.sort(key=lambda d: (round(d[0][0][1] / 10), d[0][0][0]))
+        results.append([(text, float(conf)) for _, text, conf in detections])
+    return results
+
+
+READERS = {
+    "captcha": read_captchas,
+    "text": read_texts,
+}
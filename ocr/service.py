@@ -0,0 +1,212 @@
+"""
+Local OCR worker service.
+
+Keeps the EasyOCR/torch models out of the web workers: a pool of OCR
+processes (one loaded model per process) serves requests arriving on a Unix
+socket. Concurrent requests of the same kind are grouped into one batch so
+many simultaneous captcha logins share a single inference call; a client
+may also send several images in one request. A batch that does not finish
+within OCR_BATCH_TIMEOUT (its pool process died) fails and frees its slot.
+
+Usage:
+    python -m ocr.service [--socket /tmp/hmeicr-ocr.sock] [--processes N]
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+
+from ocr.protocol import send_message, recv_message, unpack_images
+
+logger = logging.getLogger("ocr.service")
+
+DEFAULT_SOCKET = "/tmp/hmeicr-ocr.sock"
+
+
+def _pool_init():
+    # Worker processes must not inherit the parent's signal handling for Ctrl+C
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run_batch(kind, images):
+    """Executed inside a pool process; the reader is loaded there once"""
+    from ocr.reader import READERS
+    return READERS[kind](images)
+
+
+class Batcher:
+    """
+    Collects pending requests and dispatches them to the process pool in
+    batches of up to max_batch, waiting at most max_wait for a batch to fill.
+    At most one batch per pool process is in flight, so requests queue up
+    (and batch better) while every model is busy.
+    """
+
+    def __init__(self, processes: int, max_batch: int = 16, max_wait: float = 0.01, batch_timeout: float = 60.0):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batch_timeout = batch_timeout
+        self.pool = multiprocessing.get_context("spawn").Pool(processes, initializer=_pool_init)
+        self._slots = threading.BoundedSemaphore(processes)
+        self._pending = queue.Queue()
+        # In-flight batches: finish callback -> deadline. A pool process that is
+        # killed never calls back, so the reaper fails its batch and frees the slot.
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.expired = 0
+        self._thread = threading.Thread(target=self._loop, name="ocr-batcher", daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._reap, name="ocr-reaper", daemon=True).start()
+
+    def submit(self, kind: str, image: bytes) -> Future:
+        future = Future()
+        self._pending.put((kind, image, future))
+        return future
+
+    def _collect(self):
+        first = self._pending.get()
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._pending.get(timeout=max(remaining, 0)) if remaining > 0 \
+                    else self._pending.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            by_kind = {}
+            for kind, image, future in batch:
+                by_kind.setdefault(kind, []).append((image, future))
+            for kind, items in by_kind.items():
+                self._slots.acquire()
+                self._dispatch(kind, items)
+
+    def _dispatch(self, kind, items):
+        images = [image for image, _ in items]
+        futures = [future for _, future in items]
+        self.batches += 1
+        self.items += len(items)
+
+        def finish(results=None, error=None):
+            # Runs once: from the pool callback or from the reaper, whichever is first
+            with self._inflight_lock:
+                if self._inflight.pop(finish, None) is None:
+                    return
+            self._slots.release()
+            for i, future in enumerate(futures):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(results[i])
+
+        with self._inflight_lock:
+            self._inflight[finish] = time.monotonic() + self.batch_timeout
+        self.pool.apply_async(_run_batch, (kind, images), callback=lambda results: finish(results),
+                              error_callback=lambda error: finish(error=error))
+
+    def _reap(self):
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            with self._inflight_lock:
+                expired = [finish for finish, deadline in self._inflight.items() if deadline < now]
+            for finish in expired:
+                self.expired += 1
+                logger.warning("OCR batch timed out (pool process died?); releasing its slot")
+                finish(error=TimeoutError("OCR batch timed out"))
+
+    def close(self):
+        self.pool.terminate()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        batcher = self.server.batcher
+        while True:
+            try:
+                header, payload = recv_message(self.request)
+            except (ConnectionError, ValueError) as e:
+                logger.debug(f"Dropping connection: {e}")
+                return
+            if header is None:
+                return
+
+            kind = header.get("kind", "captcha")
+            if kind == "stats":
+                send_message(self.request, {"ok": True, "result": {
+                    "batches": batcher.batches,
+                    "items": batcher.items,
+                    "expired": batcher.expired,
+                }})
+                continue
+            if kind not in ("captcha", "text"):
+                send_message(self.request, {"ok": False, "error": f"unknown kind {kind}"})
+                continue
+
+            try:
+                timeout = header.get("timeout", 30)
+                if "sizes" in header:
+                    # Queued together, so they land in the same batch
+                    futures = [batcher.submit(kind, image) for image in unpack_images(payload, header["sizes"])]
+                    deadline = time.monotonic() + timeout
+                    result = [f.result(timeout=max(deadline - time.monotonic(), 0)) for f in futures]
+                else:
+                    result = batcher.submit(kind, payload).result(timeout=timeout)
+                send_message(self.request, {"ok": True, "result": result})
+            except Exception as e:
+                send_message(self.request, {"ok": False, "error": str(e)})
+
+
+class OCRServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, batcher):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+        self.batcher = batcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HMEICR local OCR worker service")
+    parser.add_argument("--socket", default=os.getenv("OCR_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--processes", type=int,
+                        default=int(os.getenv("OCR_PROCESSES", os.cpu_count() or 1)))
+    parser.add_argument("--max-batch", type=int, default=int(os.getenv("OCR_MAX_BATCH", "16")))
+    parser.add_argument("--max-wait-ms", type=float, default=float(os.getenv("OCR_MAX_WAIT_MS", "10")))
+    parser.add_argument("--batch-timeout", type=float, default=float(os.getenv("OCR_BATCH_TIMEOUT", "60")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s: %(message)s')
+    batcher = Batcher(args.processes, args.max_batch, args.max_wait_ms / 1000, args.batch_timeout)
+    server = OCRServer(args.socket, batcher)
+    logger.info(f"Serving OCR on {args.socket} with {args.processes} process(es)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Move receipts older than RECEIPT_ARCHIVE_AFTER_DAYS into the compressed
+month-bucketed `receipt_archive` collection (see utils/receipt_archive.py).
+
+Safe to run next to live traffic and to re-run (e.g. nightly from cron):
+receipts edited while being moved stay in the hot collection, reads merge
+both tiers, and each move is a receipt write that delta sync reports.
+
+Usage:
+    python scripts/archive_receipts.py [--older-than-days 365] [--max-rate 2000] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dotenv  # noqa: E402
+
+from utils.db import get_db  # noqa: E402
+from utils.receipt_archive import (  # noqa: E402
+    ARCHIVE_AFTER_DAYS, LIVE, archive_cutoff, archive_owner, ensure_archive_collection
+)
+
+
+def main():
+    dotenv.load_dotenv()
+    parser = argparse.ArgumentParser(description="Archive old receipts into month buckets")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=500, help="receipts moved per round trip")
+    parser.add_argument("--max-rate", type=float, default=0,
+                        help="maximum receipts moved per second (0 = no limit)")
+    parser.add_argument("--dry-run", action="store_true", help="count without moving")
+    args = parser.parse_args()
+
+    db = get_db()
+    cutoff = archive_cutoff(args.older_than_days)
+    print(f"Archiving receipts dated before {cutoff:%Y-%m-%d}" + (" (dry run)" if args.dry_run else ""))
+    if not args.dry_run:
+        ensure_archive_collection()
+
+    started = time.monotonic()
+    total = 0
+    # Owners with anything to move; each owner is then handled through the (owner_id, receipt_date) index
+    for owner_id in db.receipt.distinct("owner_id", {"receipt_date": {"$lt": cutoff}, **LIVE}):
+        moved = archive_owner(owner_id, cutoff, args.batch_size, args.dry_run)
+        if moved:
+            total += moved
+            print(f"  {owner_id}: {moved}")
+        if args.max_rate > 0:
+            ahead = total / args.max_rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+    print(f"Done: {total} receipts {'to archive' if args.dry_run else 'archived'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Offline captcha OCR benchmark.
+Replays a captured corpus (CAPTCHA_CORPUS_DIR/attempts.jsonl) through each
+available recognizer and reports accuracy, latency and expected login time.
+
+Ground truth is an explicit "label" field, or the text of an attempt the
+platform accepted. Rejected attempts without a label are only used for the
+live acceptance rate. Only the hold-out split (ocr.corpus.is_holdout), which
+`python -m ocr.digits train` never trains on, is scored unless --all is given.
+
+Usage:
+    python scripts/bench_captcha.py logs/captcha_corpus/attempts.jsonl [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr.corpus import HOLDOUT_PERCENT, is_holdout, load_records  # noqa: E402
+
+
+def available_recognizers():
+    """Name -> callable(image bytes) -> (text, confidence), skipping missing backends"""
+    import ocr
+    recognizers = {}
+
+    from ocr.digits import get_classifier
+    if get_classifier() is not None:
+        recognizers["digits"] = ocr.read_captcha_fast
+
+    try:
+        import easyocr  # noqa: F401
+        from ocr.reader import read_captchas
+        recognizers["easyocr (in-process)"] = lambda image: read_captchas([image])[0]
+    except ImportError:
+        pass
+
+    socket_path = os.getenv("OCR_SOCKET")
+    if socket_path and os.path.exists(socket_path):
+        from ocr.client import OCRClient
+        client = OCRClient(socket_path)
+        recognizers["easyocr (service)"] = client.read_captcha
+
+    if "digits" in recognizers and len(recognizers) > 1:
+        recognizers["digits -> easyocr fallback"] = ocr.read_captcha
+    return recognizers
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def expected_login_seconds(accuracy, latency_s, submit_s, refresh_s):
+    """
+    Expected captcha phase duration: 1/p attempts, each paying recognition and
+    the submit wait, plus a captcha refresh for every failed attempt.
+    """
+    if accuracy <= 0:
+        return float("inf")
+    attempts = 1 / accuracy
+    return attempts * (latency_s + submit_s) + (attempts - 1) * refresh_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the captcha corpus through each recognizer")
+    parser.add_argument("manifest", help="attempts.jsonl written by ocr.corpus")
+    parser.add_argument("--submit-cost", type=float, default=3.0,
+                        help="seconds spent waiting for the platform after each submit")
+    parser.add_argument("--refresh-cost", type=float, default=1.0,
+                        help="seconds to fetch a new captcha after a rejection")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured runs per recognizer")
+    parser.add_argument("--all", action="store_true",
+                        help="also score captchas the digit model was trained on (inflates its accuracy)")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    records = load_records(args.manifest)
+    base = os.path.dirname(os.path.abspath(args.manifest))
+    samples = []
+    for record in records:
+        label = record.get("label") or (record.get("text") if record.get("accepted") else None)
+        path = os.path.join(base, record["file"])
+        if not args.all and not is_holdout(record["file"]):
+            continue
+        if label and os.path.exists(path):
+            with open(path, "rb") as f:
+                samples.append((f.read(), label))
+
+    live = [r for r in records if r.get("text")]
+    accepted = sum(1 for r in live if r.get("accepted"))
+    split = "all" if args.all else f"{HOLDOUT_PERCENT}% hold-out"
+    print(f"Corpus: {len(records)} attempts, {len(samples)} labelled ({split})")
+    if live:
+        print(f"Live acceptance rate: {accepted / len(live):.1%} ({accepted}/{len(live)})")
+    if not samples:
+        print("No labelled samples to benchmark")
+        return
+
+    results = {}
+    header = f"{'recognizer':<30}{'accuracy':>10}{'p50 ms':>10}{'p95 ms':>10}{'login s':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, recognize in available_recognizers().items():
+        for image, _ in samples[:args.warmup]:
+            recognize(image)
+        correct, latencies = 0, []
+        for image, label in samples:
+            start = time.perf_counter()
+            text, _ = recognize(image)
+            latencies.append((time.perf_counter() - start) * 1000)
+            correct += text == label
+        accuracy = correct / len(samples)
+        p50, p95 = percentile(latencies, 50), percentile(latencies, 95)
+        login = expected_login_seconds(accuracy, statistics.mean(latencies) / 1000,
+                                       args.submit_cost, args.refresh_cost)
+        results[name] = {"accuracy": accuracy, "p50_ms": p50, "p95_ms": p95,
+                         "expected_login_s": login, "samples": len(samples)}
+        print(f"{name:<30}{accuracy:>10.1%}{p50:>10.1f}{p95:>10.1f}{login:>10.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Startup benchmark for the web worker.
+Measures import/app-creation time and peak resident memory of a fresh
+interpreter, with and without the e-invoice (selenium/EasyOCR/torch) stack.
+
+Usage:
+    python scripts/bench_startup.py [--runs 5] [--json bench_startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each scenario runs in its own interpreter so nothing is already imported
+SCENARIOS = {
+    "web (lazy e-invoice)": "import server; server.create_app()",
+    "web + e-invoice imports": (
+        "import server; server.create_app(); "
+        "from api.AuthorizedModules import preload_einvoice_stack; "
+        "preload_einvoice_stack(load_model=False)"
+    ),
+    "web + e-invoice + OCR model": (
+        "import server; server.create_app(); "
+        "from api.AuthorizedModules import preload_einvoice_stack; "
+        "preload_einvoice_stack(load_model=True)"
+    ),
+}
+
+PROBE = """
+import time, resource, json
+_t0 = time.perf_counter()
+{code}
+_elapsed = time.perf_counter() - _t0
+_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"seconds": _elapsed, "max_rss_mb": _rss_kb / 1024}}))
+"""
+
+
+def run_once(code: str):
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE.format(code=code)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="runs per scenario (median is reported)")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'scenario':<32}{'startup (s)':>14}{'max RSS (MB)':>16}")
+    print("-" * 62)
+    for name, code in SCENARIOS.items():
+        try:
+            samples = [run_once(code) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{name:<32}{'skipped: ' + str(e)}")
+            continue
+        results[name] = {
+            "seconds": statistics.median(s["seconds"] for s in samples),
+            "max_rss_mb": statistics.median(s["max_rss_mb"] for s in samples),
+        }
+        print(f"{name:<32}{results[name]['seconds']:>14.2f}{results[name]['max_rss_mb']:>16.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
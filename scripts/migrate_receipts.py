@@ -0,0 +1,227 @@
+"""
+Rewrite legacy receipts to the current schema (utils.money.RECEIPT_SCHEMA_VERSION).
+
+Legacy documents store `amount` as a float (or not at all) and may carry a
+receipt_date with a time part or as a string. They are rewritten in _id
+order as integer `amount_minor`, a midnight `receipt_date` and
+`schema_version`, in bulk_write batches with an optional rate limit so the
+migration can run next to live traffic. Progress is checkpointed in the
+`migrations` collection after every batch; re-running resumes after the last
+migrated _id. Receipts edited by the app meanwhile already carry the new
+schema and are left alone.
+
+Receipts already moved to `receipt_archive` (utils.receipt_archive) are
+converted in place afterwards, bucket by bucket with their own checkpoint.
+
+Usage:
+    python scripts/migrate_receipts.py [--batch-size 500] [--max-rate 2000] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dotenv  # noqa: E402
+from pymongo import UpdateOne  # noqa: E402
+
+from utils.db import get_db  # noqa: E402
+from utils.money import RECEIPT_SCHEMA_VERSION, to_minor  # noqa: E402
+
+MIGRATION_ID = f"receipts_v{RECEIPT_SCHEMA_VERSION}"
+ARCHIVE_MIGRATION_ID = f"{MIGRATION_ID}_archive"
+LEGACY = {"schema_version": {"$exists": False}, "deleted": {"$ne": True}, "archived": {"$ne": True}}
+
+
+def normalize_date(value):
+    """Midnight datetime for a stored receipt_date (datetime or date string)"""
+    if isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, str) and value.strip():
+        parsed = datetime.fromisoformat(value.strip()[:10])
+        return datetime(parsed.year, parsed.month, parsed.day)
+    return None
+
+
+def migrate_document(doc) -> dict:
+    """
+    The $set/$unset update turning one legacy receipt into the new schema.
+
+    Raises:
+        ValueError: If the stored amount or date cannot be converted
+    """
+    currency = (doc.get("currency") or "").upper() or None
+    fields = {
+        "schema_version": RECEIPT_SCHEMA_VERSION,
+        "amount_minor": to_minor(doc.get("amount") or 0, currency),
+    }
+    if currency:
+        fields["currency"] = currency
+    receipt_date = normalize_date(doc.get("receipt_date"))
+    if receipt_date is not None:
+        fields["receipt_date"] = receipt_date
+    return {"$set": fields, "$unset": {"amount": ""}}
+
+
+def load_checkpoint(db, restart=False, migration_id=MIGRATION_ID):
+    if restart:
+        db.migrations.delete_one({"_id": migration_id})
+        return None, 0
+    state = db.migrations.find_one({"_id": migration_id}) or {}
+    return state.get("last_id"), state.get("migrated", 0)
+
+
+def save_checkpoint(db, last_id, migrated, done=False, migration_id=MIGRATION_ID):
+    db.migrations.update_one(
+        {"_id": migration_id},
+        {"$set": {"last_id": last_id, "migrated": migrated, "done": done,
+                  "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def run(db, batch_size=500, max_rate=0, dry_run=False, restart=False):
+    """
+    Migrate every legacy receipt; returns (migrated, failed ids).
+
+    Args:
+        db: Application database
+        batch_size: Documents per bulk_write
+        max_rate: Upper bound on documents per second (0 = unthrottled)
+        dry_run: Convert and count without writing (checkpoint untouched)
+        restart: Ignore the saved checkpoint and scan from the beginning
+    """
+    last_id, migrated = load_checkpoint(db, restart and not dry_run)
+    if last_id is not None:
+        print(f"Resuming after _id {last_id} ({migrated} already migrated)")
+    failed = []
+    started = time.monotonic()
+    processed = 0
+
+    while True:
+        criteria = dict(LEGACY)
+        if last_id is not None:
+            criteria["_id"] = {"$gt": last_id}
+        docs = list(db.receipt.find(criteria, {"amount": 1, "currency": 1, "receipt_date": 1})
+                    .sort("_id", 1).limit(batch_size))
+        if not docs:
+            break
+
+        ops = []
+        for doc in docs:
+            try:
+                update = migrate_document(doc)
+            except ValueError as e:
+                failed.append(doc["_id"])
+                print(f"  skip {doc['_id']}: {e}")
+                continue
+            # Guard on the legacy shape: a concurrent edit already wrote the new schema
+            ops.append(UpdateOne({"_id": doc["_id"], "schema_version": {"$exists": False}}, update))
+
+        if ops and not dry_run:
+            result = db.receipt.bulk_write(ops, ordered=False)
+            migrated += result.modified_count
+        elif dry_run:
+            migrated += len(ops)
+        last_id = docs[-1]["_id"]
+        processed += len(docs)
+        if not dry_run:
+            save_checkpoint(db, last_id, migrated)
+        print(f"  {processed} scanned, {migrated} migrated, last _id {last_id}")
+
+        if max_rate > 0:
+            # Sleep off whatever the batch finished ahead of the allowed rate
+            ahead = processed / max_rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    if not dry_run:
+        save_checkpoint(db, last_id, migrated, done=True)
+    return migrated, failed
+
+
+def run_archive(db, batch_size=500, max_rate=0, dry_run=False, restart=False):
+    """
+    Migrate the legacy receipts packed in archive buckets; returns
+    (migrated, failed ids). Arguments as for run(), batch_size in buckets.
+    """
+    last_id, migrated = load_checkpoint(db, restart and not dry_run, ARCHIVE_MIGRATION_ID)
+    if last_id is not None:
+        print(f"Resuming archive after bucket {last_id} ({migrated} already migrated)")
+    failed = []
+    started = time.monotonic()
+    processed = 0
+
+    while True:
+        criteria = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        buckets = list(db.receipt_archive.find(criteria).sort("_id", 1).limit(batch_size))
+        if not buckets:
+            break
+
+        ops = []
+        for bucket in buckets:
+            for receipt_id, entry in bucket.get("receipts", {}).items():
+                if "schema_version" in entry:
+                    continue
+                try:
+                    update = migrate_document(entry)
+                except ValueError as e:
+                    failed.append(receipt_id)
+                    print(f"  skip archived {receipt_id}: {e}")
+                    continue
+                field = f"receipts.{receipt_id}"
+                # Guard as in run(): a restore and re-archive may have written the new schema
+                ops.append(UpdateOne(
+                    {"_id": bucket["_id"], f"{field}.schema_version": {"$exists": False}},
+                    {op: {f"{field}.{key}": value for key, value in fields.items()}
+                     for op, fields in update.items()}
+                ))
+                processed += 1
+
+        if ops and not dry_run:
+            result = db.receipt_archive.bulk_write(ops, ordered=False)
+            migrated += result.modified_count
+        elif dry_run:
+            migrated += len(ops)
+        last_id = buckets[-1]["_id"]
+        if not dry_run:
+            save_checkpoint(db, last_id, migrated, migration_id=ARCHIVE_MIGRATION_ID)
+        print(f"  archive: {migrated} migrated, last bucket {last_id}")
+
+        if max_rate > 0:
+            ahead = processed / max_rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    if not dry_run:
+        save_checkpoint(db, last_id, migrated, done=True, migration_id=ARCHIVE_MIGRATION_ID)
+    return migrated, failed
+
+
+def main():
+    dotenv.load_dotenv()
+    parser = argparse.ArgumentParser(description="Migrate receipts to integer minor-unit amounts")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-rate", type=float, default=0,
+                        help="maximum documents per second (0 = no limit)")
+    parser.add_argument("--dry-run", action="store_true", help="report without writing")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args()
+
+    db = get_db()
+    remaining = db.receipt.count_documents(LEGACY)
+    print(f"{remaining} legacy receipts to migrate to schema v{RECEIPT_SCHEMA_VERSION}"
+          + (" (dry run)" if args.dry_run else ""))
+    migrated, failed = run(db, args.batch_size, args.max_rate, args.dry_run, args.restart)
+    print(f"Done: {migrated} migrated, {len(failed)} skipped")
+    archived, archive_failed = run_archive(db, args.batch_size, args.max_rate, args.dry_run, args.restart)
+    print(f"Archive done: {archived} migrated, {len(archive_failed)} skipped")
+    failed += archive_failed
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Query the security log (and its rotated archives) through the block index.
+
+Examples:
+    # Failed logins per IP in the last hour
+    python scripts/query_security_log.py --since 1h --event login_failed --group-by ip
+
+    # Everything a user did in the last week
+    python scripts/query_security_log.py --since 7d --user alice@example.com --limit 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.log_query import FILTER_FIELDS, aggregate, parse_time, query  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the HMEICR security log")
+    parser.add_argument("--log", default=os.getenv("SECURITY_LOG_PATH", "logs/security.log"))
+    parser.add_argument("--since", help="ISO timestamp (UTC) or age such as 15m, 1h, 7d")
+    parser.add_argument("--until", help="ISO timestamp (UTC) or age")
+    for field in FILTER_FIELDS:
+        parser.add_argument(f"--{field}", action="append", help=f"match {field} (repeatable)")
+    parser.add_argument("--group-by", choices=FILTER_FIELDS + ("endpoint",), help="count events per value")
+    parser.add_argument("--top", type=int, default=20, help="groups to show with --group-by")
+    parser.add_argument("--limit", type=int, default=100, help="events to print (0 = all)")
+    args = parser.parse_args()
+
+    criteria = {field: getattr(args, field) for field in FILTER_FIELDS}
+    criteria["since"] = parse_time(args.since)
+    criteria["until"] = parse_time(args.until)
+
+    start = time.perf_counter()
+    if args.group_by:
+        counts = aggregate(args.log, args.group_by, **criteria)
+        for value, count in counts.most_common(args.top):
+            print(f"{count:>8}  {value}")
+        summary = f"{sum(counts.values())} events in {len(counts)} groups"
+    else:
+        n = 0
+        for record in query(args.log, limit=args.limit or None, **criteria):
+            print(json.dumps(record, ensure_ascii=False))
+            n += 1
+        summary = f"{n} events"
+    print(f"{summary} ({(time.perf_counter() - start) * 1000:.1f} ms)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Print a waterfall of the slowest recorded traces.
+
+Reads logs/traces.jsonl written by utils.tracing (and its rotated .gz
+archives with --archives).
+
+Usage:
+    python scripts/trace_view.py [--top 5] [--name carrier/invoices] [--since 1h]
+"""
+import argparse
+import gzip
+import heapq
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.log_query import log_files, parse_time  # noqa: E402
+
+BAR_WIDTH = 40
+
+
+def read_traces(path, archives=False):
+    files = log_files(path) if archives else [path]
+    for file_path in files:
+        opener = gzip.open if file_path.endswith(".gz") else open
+        try:
+            with opener(file_path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
+
+
+def print_waterfall(trace):
+    total = trace["duration_ms"] or 1.0
+    started = datetime.fromtimestamp(trace["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+    print(f"{trace['name']}  {trace['duration_ms']:.1f} ms  trace={trace['trace_id']}  {started}")
+
+    children = {}
+    for s in trace["spans"]:
+        children.setdefault(s["parent"], []).append(s)
+
+    def walk(parent_id, depth):
+        for s in sorted(children.get(parent_id, []), key=lambda s: s["start_ms"]):
+            offset = int(s["start_ms"] / total * BAR_WIDTH)
+            width = max(1, int(round(s["duration_ms"] / total * BAR_WIDTH)))
+            bar = " " * min(offset, BAR_WIDTH - 1) + "█" * min(width, BAR_WIDTH - offset)
+            label = ("  " * depth + s["name"])[:44]
+            attrs = " ".join(f"{k}={v:.3g}" if isinstance(v, float) else f"{k}={v}"
+                             for k, v in (s.get("attrs") or {}).items())
+            if s.get("error"):
+                attrs += f" error={s['error']}"
+            print(f"  {label:<44} |{bar:<{BAR_WIDTH}}| {s['duration_ms']:>9.1f} ms  {attrs}".rstrip())
+            walk(s["id"], depth + 1)
+
+    walk(None, 0)
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the slowest traces as waterfalls")
+    parser.add_argument("--file", default=os.getenv("TRACE_LOG_PATH", "logs/traces.jsonl"))
+    parser.add_argument("--archives", action="store_true", help="include rotated .gz files")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--name", help="only traces whose root name contains this")
+    parser.add_argument("--since", help="ISO timestamp (UTC) or age such as 15m, 1h, 7d")
+    args = parser.parse_args()
+
+    since = parse_time(args.since)
+    since_ts = (since - datetime(1970, 1, 1)).total_seconds() if since else None
+
+    traces = (t for t in read_traces(args.file, args.archives)
+              if (not args.name or args.name in t["name"])
+              and (since_ts is None or t["timestamp"] >= since_ts))
+    slowest = heapq.nlargest(args.top, traces, key=lambda t: t["duration_ms"])
+    if not slowest:
+        print("No traces recorded (set TRACE_SAMPLE_RATE or TRACE_SLOW_MS)")
+        return
+    for trace in slowest:
+        print_waterfall(trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,12 @@
-from flask import Flask, request, redirect, url_for, render_template, flash, jsonify, send_from_directory
+from flask import Flask, Blueprint, current_app, request, redirect, url_for, render_template, flash, jsonify, send_from_directory, Response
 import os
+import hmac
+from functools import wraps
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from pymongo import MongoClient
 from werkzeug.security import generate_password_hash, check_password_hash
 from os import getenv
-from api.AuthorizedModules import EInvoiceAuthenticator
-from bson import ObjectId
+from api.AuthorizedModules import preload_einvoice_stack
+from bson import ObjectId, json_util
 # TEMPORARILY DISABLED - Crypto module causing issues
 # from crypto import encrypt_password, decrypt_password
 from datetime import datetime
@@ -23,12 +24,46 @@ from utils.security_logger import (
     log_auth_attempt,
     log_session_event,
     log_rate_limit_exceeded,
-    get_client_ip
+    log_unauthorized_access,
+    get_client_ip,
+    SECURITY_LOG_PATH
+)
+from utils.log_query import FILTER_FIELDS, parse_time, query as query_security_log, aggregate as aggregate_security_log
+from utils.db import LazyCollection
+from utils.money import RECEIPT_SCHEMA_VERSION, to_minor, from_minor
+from utils.einvoice_accounts import user_accounts, fetch_all, merge_invoices, invalidate as invalidate_einvoice_session
+from utils.einvoice_jobs import (
+    ensure_indexes as ensure_job_indexes, submit as submit_einvoice_job, find_job, serialize_job,
+    register_runner as register_job_runner, on_update as on_job_update, resume_pending as resume_einvoice_jobs
+)
+from utils.receipt_archive import LIVE, ensure_archive_collection, find_receipts, restore_receipt
+from utils.receipt_seq import get_receipt_version, get_receipt_horizon, receipt_write
+from utils.invoice_mirror import (
+    ensure_indexes as ensure_invoice_indexes, mirror_carrier_invoices, record_scanned_invoice,
+    forget_scanned_invoice, link_receipt
+)
+from ocr.qr import decode_images, parse_invoice_qr
+from concurrent.futures.process import BrokenProcessPool
+from utils.receipt_drafts import (
+    UPLOAD_MAX_BYTES, receipt_drafts, sniff_image_type, store_upload, enqueue,
+    delete_images, find_image, serialize_draft, resume_pending, on_finished as on_draft_finished
+)
+from utils import metrics, tracing, profiler
+from utils.identity_cache import IdentityCache
+from utils.event_bus import EventBus, BusFull, stream_events, start_change_stream_relay, start_outbox_relay
+from utils.http_cache import (
+    make_etag,
+    content_digest,
+    is_not_modified,
+    not_modified,
+    with_etag,
+    DigestCache
 )
 
-app = Flask(__name__)
 dotenv.load_dotenv()
-app.secret_key = getenv("secret_key")
+
+# Routes live on a blueprint; create_app() assembles the application
+bp = Blueprint("main", __name__)
 
 # ---------- Security Configuration ----------
 from flask_limiter import Limiter
@@ -37,32 +72,31 @@ from flask_wtf.csrf import CSRFProtect
 from flask_talisman import Talisman
 
 # Rate Limiting
+# Counters live in shared storage so limits hold across worker processes.
+# Defaults to MongoDB (atomic $inc counters expired by a TTL index);
+# any flask-limiter URI works, e.g. redis://localhost:6379 or memory:// for dev.
+ratelimit_storage_uri = getenv("RATELIMIT_STORAGE_URI") or getenv("MONGO_URI", "mongodb://localhost:27017")
+ratelimit_storage_options = {}
+if ratelimit_storage_uri.startswith("mongodb"):
+    ratelimit_storage_options["database_name"] = getenv("RATELIMIT_DB", "limits")
+
 limiter = Limiter(
-    app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    storage_uri=ratelimit_storage_uri,
+    storage_options=ratelimit_storage_options,
+    strategy="fixed-window",
+    # Keep serving (per-process counting) if the shared store is unreachable
+    in_memory_fallback_enabled=True
 )
 
 # CSRF Protection - TEMPORARILY DISABLED for testing
 # csrf = CSRFProtect(app)
 # TODO: Enable CSRF and update frontend to include tokens
 
-# Security Headers (disabled HTTPS enforcement for development)
-Talisman(app, 
-    force_https=False,  # Set to True in production with HTTPS
-    content_security_policy=None  # Can be configured for stricter CSP
-)
-
-# Session Security
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
-
 # Serve React App
-@app.route("/", defaults={'path': ''})
-@app.route("/<path:path>")
+@bp.route("/", defaults={'path': ''})
+@bp.route("/<path:path>")
 def serve(path):
     static_folder = os.path.join(os.getcwd(), 'client/dist')
     if path != "" and os.path.exists(os.path.join(static_folder, path)):
@@ -71,12 +105,148 @@ def serve(path):
 
 
 # ---------- MongoDB ----------
-mongo_uri = getenv("MONGO_URI", "mongodb://localhost:27017")
-client = MongoClient(mongo_uri)
-db = client["myapp"]
-users = db["users"]
-einvoice_login = db["einvoice_login"]
-receipt = db["receipt"]
+# Resolved lazily per process (see utils/db.py), so importing is fork-safe
+users = LazyCollection("users")
+einvoice_login = LazyCollection("einvoice_login")
+receipt = LazyCollection("receipt")
+
+# Digests of recently served e-invoice responses, keyed by (user_id, endpoint, params)
+einvoice_digests = DigestCache(ttl=int(getenv("EINVOICE_ETAG_TTL", "300")))
+
+# Largest upstream page a background fetch may request
+EINVOICE_MAX_PAGE_SIZE = 100
+
+# Paper e-invoice QR imports
+QR_IMPORT_MAX_IMAGES = int(getenv("QR_IMPORT_MAX_IMAGES", "100"))
+QR_IMPORT_MAX_BYTES = int(getenv("QR_IMPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+qr_images = metrics.registry.counter(
+    "hmeicr_qr_images_total", "Paper e-invoice photos by QR decode outcome", ("outcome",))
+qr_decode_latency = metrics.registry.histogram(
+    "hmeicr_qr_decode_batch_seconds", "QR decoding time per import request")
+
+# ---------- Push Events ----------
+event_bus = EventBus(
+    queue_size=int(getenv("EVENT_QUEUE_SIZE", "100")),
+    max_subscriptions_per_user=int(getenv("EVENT_MAX_STREAMS_PER_USER", "5")),
+    # Each open stream holds a gthread worker thread; keep half of them for requests
+    max_subscriptions=int(getenv("EVENT_MAX_STREAMS_PER_WORKER", "0")) or max(1, int(getenv("WEB_THREADS", "4")) // 2)
+)
+# Non-receipt events written here reach every worker while the relay runs
+event_outbox = LazyCollection("event_outbox")
+
+def publish_receipt_event(user_id, receipt_id, seq, deleted=False):
+    """Notify the user's open event streams that a receipt changed"""
+    if event_bus.relay_active:
+        return  # the change stream relay publishes every write
+    event_bus.publish(user_id, "receipt_changed", {
+        "id": str(receipt_id),
+        "seq": seq,
+        "deleted": deleted
+    })
+
+def publish_draft_event(draft):
+    """Tell the owner's event streams that an uploaded photo has been read"""
+    event_bus.broadcast(str(draft["owner_id"]), "receipt_draft_ready", {
+        "id": str(draft["_id"]),
+        "status": draft["status"]
+    })
+
+on_draft_finished(publish_draft_event)
+
+def serialize_receipt(r):
+    """Convert a receipt document into its JSON-safe API shape"""
+    r["_id"] = str(r["_id"])
+    r["owner_id"] = str(r["owner_id"])
+    for field in ("image_id", "thumbnail_id"):
+        if r.get(field) is not None:
+            r[field] = str(r[field])
+    if "amount_minor" in r:
+        r["amount"] = from_minor(r["amount_minor"], r.get("currency"))
+    elif "amount" not in r:
+        # Legacy document not yet rewritten by scripts/migrate_receipts.py
+        r["amount"] = 0
+    return r
+
+def read_receipt_form(form, defaults=None):
+    """
+    Validate the title/amount/currency/receipt_date fields of a receipt form.
+
+    Args:
+        form: Submitted form (request.form)
+        defaults: Values used for fields missing from the form (e.g. OCR draft fields)
+
+    Returns:
+        Tuple of (fields, error_message); fields are in the stored (minor unit) shape
+    """
+    defaults = defaults or {}
+    def field(name, default=""):
+        value = form.get(name)
+        if value is None:
+            value = defaults.get(name) or default
+        return str(value).strip()
+
+    title = field("title")
+    currency = field("currency")
+    amount_str = field("amount", "0")
+    receipt_date = field("receipt_date")
+    
+    # Validate amount
+    is_valid, error_msg = validate_amount(amount_str, currency)
+    if not is_valid:
+        return None, error_msg
+    
+    # Validate currency
+    is_valid, error_msg = validate_currency(currency)
+    if not is_valid:
+        return None, error_msg
+    
+    # Validate date format
+    is_valid, error_msg = validate_date_format(receipt_date)
+    if not is_valid:
+        return None, error_msg
+    
+    # Sanitize title
+    title = sanitize_string(title, max_length=200)
+    if not title:
+        return None, "Title is required"
+    
+    try:
+        receipt_date = datetime.strptime(receipt_date, "%Y-%m-%d")
+    except ValueError:
+        return None, "Invalid date format"
+    currency = currency.upper()
+    return {
+        "title": title,
+        "schema_version": RECEIPT_SCHEMA_VERSION,
+        "currency": currency,
+        "amount_minor": to_minor(amount_str, currency),
+        "receipt_date": receipt_date
+    }, None
+
+def insert_receipt(user_id, fields, **extra):
+    """Store a new receipt for a user and announce it; returns its id"""
+    with receipt_write(user_id) as seq:
+        inserted = receipt.insert_one({
+            "owner_id": ObjectId(user_id),
+            **fields,
+            **extra,
+            "change_seq": seq,
+            "updated_at": datetime.utcnow()
+        })
+    publish_receipt_event(user_id, inserted.inserted_id, seq)
+    return inserted.inserted_id
+
+def ensure_indexes():
+    """Create the indexes the receipt queries rely on (idempotent)"""
+    receipt.create_index([("owner_id", 1), ("change_seq", 1)])
+    receipt.create_index([("owner_id", 1), ("receipt_date", 1)])
+    receipt_drafts.create_index([("owner_id", 1), ("created_at", -1)])
+    receipt_drafts.create_index([("status", 1)])
+    # Relayed events are only needed until every worker's change stream has seen them
+    event_outbox.create_index([("created_at", 1)], expireAfterSeconds=3600)
+    ensure_invoice_indexes()
+    ensure_job_indexes()
+    ensure_archive_collection()
 
 # ---------- Password Hashing ----------
 
@@ -88,21 +258,57 @@ def verify_password(password: str, hashed: str) -> bool:
 
 # ---------- Flask-Login ----------
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = "login"
+login_manager.login_view = "main.login"
 
 class User(UserMixin):
     def __init__(self, user_data):
         self.id = str(user_data["_id"])
         self.email = user_data["email"]
 
+# Worker-local identity cache; USER_CACHE_ENABLED=false (or app.testing) bypasses it
+user_cache = IdentityCache(
+    maxsize=int(getenv("USER_CACHE_SIZE", "1024")),
+    ttl=float(getenv("USER_CACHE_TTL", "60")),
+    enabled=getenv("USER_CACHE_ENABLED", "true").lower() == "true"
+)
+
+user_cache_gauge = metrics.registry.gauge(
+    "hmeicr_user_cache", "Identity cache entries and lookups (per live worker, summed)", ("stat",))
+
+def _collect_user_cache():
+    stats = user_cache.stats()
+    for stat in ("size", "hits", "misses", "evictions"):
+        user_cache_gauge.set(stats[stat], stat=stat)
+
+metrics.registry.register_collector(_collect_user_cache)
+
+def fetch_user(user_id):
+    user = users.find_one({"_id": ObjectId(user_id)}, {"email": 1})
+    return User(user) if user else None
+
 @login_manager.user_loader
 def load_user(user_id):
-    user = users.find_one({"_id": ObjectId(user_id)})
-    return User(user) if user else None
+    if current_app.testing:
+        return fetch_user(user_id)
+    return user_cache.get_or_load(user_id, fetch_user)
+
+# Accounts allowed to use the /api/admin endpoints (comma-separated emails),
+# normalized the same way register/login store emails
+ADMIN_EMAILS = {sanitize_string(e, max_length=254).lower() for e in getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+def admin_required(f):
+    """Like login_required, but also requires the user to be listed in ADMIN_EMAILS"""
+    @wraps(f)
+    @login_required
+    def decorated_function(*args, **kwargs):
+        if current_user.email.lower() not in ADMIN_EMAILS:
+            log_unauthorized_access(user=current_user.email, resource=request.path)
+            return jsonify({"success": False, "message": "Forbidden"}), 403
+        return f(*args, **kwargs)
+    return decorated_function
 
 # ---------- Routes ----------
-@app.route("/api/register", methods=["POST"])
+@bp.route("/api/register", methods=["POST"])
 @limiter.limit("3 per minute")  # Strict limit for registration
 def register():
     email = request.form.get("email", "").strip()
@@ -135,7 +341,7 @@ def register():
 
     return jsonify({"success": True, "message": "Registered successfully"}), 201
 
-@app.route("/api/login", methods=["POST"])
+@bp.route("/api/login", methods=["POST"])
 @limiter.limit("5 per minute")  # Prevent brute-force attacks
 def login():
     email = request.form.get("email", "").strip()
@@ -160,26 +366,28 @@ def login():
                           details={'reason': 'invalid_password'})
         return jsonify({"success": False, "message": "Invalid credentials"}), 401
 
+    user_cache.invalidate(str(user["_id"]))
     login_user(User(user))
     log_session_event('login', user=email)
     
     return jsonify({"success": True, "message": "Login successful"}), 200
 
-@app.route("/api/dashboard")
+@bp.route("/api/dashboard")
 @login_required
 def dashboard():
     return jsonify({"success": True, "message": "You are logged in 🎉"}), 200
 
-@app.route("/api/logout")
+@bp.route("/api/logout")
 @login_required
 def logout():
     user_email = current_user.email if current_user.is_authenticated else 'unknown'
+    user_cache.invalidate(current_user.id)
     logout_user()
     log_session_event('logout', user=user_email)
     return jsonify({"success": True, "message": "Logged out successfully"}), 200
 
 # ---------- E-Invoice  ----------
-@app.route("/api/einvoice_login/create", methods=["POST"])
+@bp.route("/api/einvoice_login/create", methods=["POST"])
 @login_required
 def create_einvoice_login():
     username = request.form.get("einvoice_username", "").strip()
@@ -196,9 +404,10 @@ def create_einvoice_login():
         "einvoice_username": username,
         "einvoice_password": password  # TEMPORARILY storing plain text - crypto disabled
     })
+    einvoice_digests.invalidate_prefix((current_user.id,))
     return jsonify({"success": True, "message": "E-Invoice credentials saved"}), 201
 
-@app.route("/api/einvoice_login/<einvoice_id>/edit", methods=["POST"])
+@bp.route("/api/einvoice_login/<einvoice_id>/edit", methods=["POST"])
 @login_required
 def edit_einvoice_login(einvoice_id):
     username = request.form.get("einvoice_username", "").strip()
@@ -224,49 +433,20 @@ def edit_einvoice_login(einvoice_id):
     )
     
     if result.modified_count > 0:
+        invalidate_einvoice_session(einvoice_id)
+        einvoice_digests.invalidate_prefix((current_user.id,))
         return jsonify({"success": True, "message": "E-Invoice credentials updated"}), 200
     else:
         return jsonify({"success": False, "message": "Credentials not found"}), 404
 
-@app.route("/api/receipt/create", methods=["POST"])
+@bp.route("/api/receipt/create", methods=["POST"])
 @login_required
 def create_note():
     try:
-        # Get and validate inputs
-        title = request.form.get("title", "").strip()
-        currency = request.form.get("currency", "").strip()
-        amount_str = request.form.get("amount", "0")
-        receipt_date = request.form.get("receipt_date", "").strip()
-        
-        # Validate amount
-        is_valid, error_msg = validate_amount(amount_str)
-        if not is_valid:
-            return jsonify({"success": False, "message": error_msg}), 400
-        
-        # Validate currency
-        is_valid, error_msg = validate_currency(currency)
-        if not is_valid:
-            return jsonify({"success": False, "message": error_msg}), 400
-        
-        # Validate date format
-        is_valid, error_msg = validate_date_format(receipt_date)
-        if not is_valid:
+        fields, error_msg = read_receipt_form(request.form)
+        if error_msg:
             return jsonify({"success": False, "message": error_msg}), 400
-        
-        # Sanitize title
-        title = sanitize_string(title, max_length=200)
-        if not title:
-            return jsonify({"success": False, "message": "Title is required"}), 400
-        
-        amount = float(amount_str)
-        
-        receipt.insert_one({
-            "owner_id": ObjectId(current_user.id),
-            "title": title,
-            "currency": currency.upper(),
-            "amount": amount,
-            "receipt_date": datetime.strptime(receipt_date, "%Y-%m-%d")
-        })
+        insert_receipt(current_user.id, fields)
         
         return jsonify({"success": True, "message": "Receipt created"}), 201
     except ValueError as e:
@@ -274,86 +454,249 @@ def create_note():
     except Exception as e:
         return jsonify({"success": False, "message": "An error occurred"}), 500
 
-@app.route("/api/receipt")
+@bp.route("/api/receipt")
 @login_required
 def list_receipt():
-    user_receipt = list(receipt.find({
-        "owner_id": ObjectId(current_user.id)
-    }))
-    for r in user_receipt:
-        r["_id"] = str(r["_id"])
-        r["owner_id"] = str(r["owner_id"])
-        if "amount" not in r:
-            r["amount"] = 0
+    # Optional receipt_date range; archived receipts are merged in transparently
+    start, end = request.args.get("from", ""), request.args.get("to", "")
+    for value in filter(None, (start, end)):
+        is_valid, error_msg = validate_date_format(value)
+        if not is_valid:
+            return jsonify({"success": False, "message": error_msg}), 400
+
+    etag = make_etag("receipt", current_user.id, get_receipt_version(current_user.id), start, end)
+    if is_not_modified(etag):
+        return not_modified(etag)
+
+    try:
+        user_receipt = [serialize_receipt(r) for r in find_receipts(
+            ObjectId(current_user.id),
+            datetime.strptime(start, "%Y-%m-%d") if start else None,
+            datetime.strptime(end, "%Y-%m-%d") if end else None
+        )]
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid date format"}), 400
     
-    return jsonify(user_receipt), 200
+    return with_etag(jsonify(user_receipt), etag), 200
+
+@bp.route("/api/receipt/changes")
+@login_required
+def receipt_changes():
+    """
+    Delta sync: receipts modified, removed or archived after change sequence
+    `since`. `since=0` returns the full current set of both tiers, including
+    legacy untracked receipts.
+    """
+    try:
+        since = int(request.args.get("since", 0))
+        limit = min(int(request.args.get("limit", 500)), 1000)
+    except ValueError:
+        return jsonify({"success": False, "message": "since and limit must be integers"}), 400
+    if since < 0 or limit < 1:
+        return jsonify({"success": False, "message": "since and limit must be positive"}), 400
+
+    owner_id = ObjectId(current_user.id)
+    # Sequences are allocated before their write commits; never report past one still in flight
+    horizon, allocated = get_receipt_horizon(current_user.id)
+    if since > allocated:
+        return jsonify({"success": False, "message": "Unknown change sequence, resync with since=0"}), 409
+
+    if since == 0:
+        docs = find_receipts(owner_id)
+        has_more = False
+        seq = horizon
+    else:
+        docs = list(receipt.find(
+            {"owner_id": owner_id, "change_seq": {"$gt": since, "$lte": horizon}}
+        ).sort("change_seq", 1).limit(limit + 1))
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        # Resume from the last returned change rather than the latest one
+        seq = docs[-1]["change_seq"] if docs else since
+
+    changed = [serialize_receipt(d) for d in docs if not d.get("deleted") and not d.get("archived")]
+    removed = [str(d["_id"]) for d in docs if d.get("deleted")]
+    archived = [str(d["_id"]) for d in docs if d.get("archived")]
 
-@app.route("/api/receipt/<receipt_id>/edit", methods=["POST"])
+    return jsonify({
+        "seq": seq,
+        "changed": changed,
+        "removed": removed,
+        "archived": archived,
+        "has_more": has_more
+    }), 200
+
+@bp.route("/api/events")
+@login_required
+def event_stream():
+    """Server-Sent Events stream of the current user's receipt and sync events"""
+    try:
+        sub = event_bus.subscribe(current_user.id)
+    except BusFull:
+        # Another worker may have room when the client reconnects
+        response = jsonify({"success": False, "message": "Event streams are busy, try again shortly"})
+        response.headers["Retry-After"] = "10"
+        return response, 503
+    if sub is None:
+        return jsonify({"success": False, "message": "Too many open event streams"}), 429
+
+    response = Response(stream_events(event_bus, sub), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # disable proxy buffering
+    return response
+
+@bp.route("/api/receipt/<receipt_id>/edit", methods=["POST"])
 @login_required
 def edit_note(receipt_id):
     try:
-        # Get and validate inputs
-        title = request.form.get("title", "").strip()
-        currency = request.form.get("currency", "").strip()
-        amount_str = request.form.get("amount", "0")
-        receipt_date = request.form.get("receipt_date", "").strip()
-        
-        # Validate amount
-        is_valid, error_msg = validate_amount(amount_str)
-        if not is_valid:
-            return jsonify({"success": False, "message": error_msg}), 400
-        
-        # Validate currency
-        is_valid, error_msg = validate_currency(currency)
-        if not is_valid:
-            return jsonify({"success": False, "message": error_msg}), 400
-        
-        # Validate date format
-        is_valid, error_msg = validate_date_format(receipt_date)
-        if not is_valid:
+        fields, error_msg = read_receipt_form(request.form)
+        if error_msg:
             return jsonify({"success": False, "message": error_msg}), 400
-        
-        # Sanitize title
-        title = sanitize_string(title, max_length=200)
-        if not title:
-            return jsonify({"success": False, "message": "Title is required"}), 400
-        
-        amount = float(amount_str)
-        
-        receipt.update_one(
-            {
-                "_id": ObjectId(receipt_id),
-                "owner_id": ObjectId(current_user.id)
-            },
-            {
+        criteria = {
+            "_id": ObjectId(receipt_id),
+            "owner_id": ObjectId(current_user.id),
+            **LIVE
+        }
+        with receipt_write(current_user.id) as seq:
+            update = {
                 "$set": {
-                    "title": title,
-                    "currency": currency.upper(),
-                    "amount": amount,
-                    "receipt_date": datetime.strptime(receipt_date, "%Y-%m-%d")
-                }
+                    **fields,
+                    "change_seq": seq,
+                    "updated_at": datetime.utcnow()
+                },
+                "$unset": {"amount": ""}
             }
-        )
+            result = receipt.update_one(criteria, update)
+            if result.matched_count == 0 and restore_receipt(criteria["owner_id"], criteria["_id"]):
+                result = receipt.update_one(criteria, update)
+        if result.matched_count > 0:
+            publish_receipt_event(current_user.id, receipt_id, seq)
         return jsonify({"success": True, "message": "Receipt updated"}), 200
     except ValueError as e:
         return jsonify({"success": False, "message": "Invalid date format"}), 400
     except Exception as e:
         return jsonify({"success": False, "message": "An error occurred"}), 500
 
-@app.route("/api/receipt/<receipt_id>/delete", methods=["POST"])
+@bp.route("/api/receipt/<receipt_id>/delete", methods=["POST"])
 @login_required
 def delete_note(receipt_id):
-    result = receipt.delete_one({
-        "_id": ObjectId(receipt_id),
-        "owner_id": ObjectId(current_user.id)
-    })
+    # Deletes leave a tombstone so delta sync clients learn about the removal
+    owner_id = ObjectId(current_user.id)
+    if not receipt.count_documents({"_id": ObjectId(receipt_id), "owner_id": owner_id, **LIVE}, limit=1):
+        # Archived receipts come back to the hot collection to carry the tombstone
+        if not restore_receipt(owner_id, ObjectId(receipt_id)):
+            return jsonify({"success": False, "message": "Receipt not found"}), 404
+
+    with receipt_write(current_user.id) as seq:
+        removed = receipt.find_one_and_update(
+            {
+                "_id": ObjectId(receipt_id),
+                "owner_id": owner_id,
+                **LIVE
+            },
+            {
+                "$set": {
+                    "deleted": True,
+                    "change_seq": seq,
+                    "updated_at": datetime.utcnow()
+                },
+                "$unset": {"title": "", "currency": "", "amount": "", "amount_minor": "", "receipt_date": "",
+                           "image_id": "", "thumbnail_id": ""}
+            },
+            projection={"image_id": 1, "thumbnail_id": 1}
+        )
     
-    if result.deleted_count > 0:
+    if removed is not None:
+        delete_images(removed.get("image_id"), removed.get("thumbnail_id"))
+        publish_receipt_event(current_user.id, receipt_id, seq, deleted=True)
         return jsonify({"success": True, "message": "Receipt deleted"}), 200
     else:
         return jsonify({"success": False, "message": "Receipt not found"}), 404
 
-@app.route("/einvoice/invoice_list")
+# ---------- Receipt Photos ----------
+
+@bp.route("/api/receipt/upload", methods=["POST"])
+@login_required
+def upload_receipt_photo():
+    """Store a receipt photo and queue it for OCR; the draft is filled in the background"""
+    if request.content_length and request.content_length > UPLOAD_MAX_BYTES:
+        return jsonify({"success": False, "message": "Image is too large"}), 413
+    photo = request.files.get("image")
+    if photo is None:
+        return jsonify({"success": False, "message": "Image is required"}), 400
+    content_type = sniff_image_type(photo.stream.read(16))
+    photo.stream.seek(0)
+    if content_type is None:
+        return jsonify({"success": False, "message": "Image must be JPEG, PNG or WebP"}), 400
+    # A chunked upload has no Content-Length; measure what was actually received
+    size = photo.stream.seek(0, os.SEEK_END)
+    photo.stream.seek(0)
+    if size > UPLOAD_MAX_BYTES:
+        return jsonify({"success": False, "message": "Image is too large"}), 413
+
+    owner_id = ObjectId(current_user.id)
+    filename = sanitize_string(photo.filename or "", max_length=200)
+    draft_id = store_upload(owner_id, photo.stream, filename, content_type)
+    if not enqueue(draft_id):
+        # Backpressure: refuse rather than queue work this worker cannot get to
+        draft = receipt_drafts.find_one_and_delete({"_id": draft_id})
+        delete_images(draft["image_id"])
+        response = jsonify({"success": False, "message": "Receipt processing is busy, try again shortly"})
+        response.headers["Retry-After"] = "10"
+        return response, 503
+    return jsonify({"success": True, "draft_id": str(draft_id), "status": "queued"}), 202
+
+@bp.route("/api/receipt/drafts")
+@login_required
+def list_receipt_drafts():
+    drafts = receipt_drafts.find({"owner_id": ObjectId(current_user.id)}).sort("created_at", -1)
+    return jsonify([serialize_draft(d) for d in drafts]), 200
+
+@bp.route("/api/receipt/drafts/<draft_id>/confirm", methods=["POST"])
+@login_required
+def confirm_receipt_draft(draft_id):
+    """Create a receipt from a draft; submitted fields override the extracted ones"""
+    owner_id = ObjectId(current_user.id)
+    draft = receipt_drafts.find_one({"_id": ObjectId(draft_id), "owner_id": owner_id})
+    if draft is None:
+        return jsonify({"success": False, "message": "Draft not found"}), 404
+    if draft["status"] in ("queued", "processing"):
+        return jsonify({"success": False, "message": "Draft is still being processed"}), 409
+
+    fields, error_msg = read_receipt_form(request.form, defaults=draft.get("fields"))
+    if error_msg:
+        return jsonify({"success": False, "message": error_msg}), 400
+    # Deleting the draft first makes a double submit create only one receipt
+    if receipt_drafts.delete_one({"_id": draft["_id"]}).deleted_count == 0:
+        return jsonify({"success": False, "message": "Draft not found"}), 404
+    receipt_id = insert_receipt(current_user.id, fields, image_id=draft["image_id"],
+                                thumbnail_id=draft.get("thumbnail_id"))
+    return jsonify({"success": True, "message": "Receipt created", "receipt_id": str(receipt_id)}), 201
+
+@bp.route("/api/receipt/drafts/<draft_id>/discard", methods=["POST"])
+@login_required
+def discard_receipt_draft(draft_id):
+    draft = receipt_drafts.find_one_and_delete({"_id": ObjectId(draft_id), "owner_id": ObjectId(current_user.id)})
+    if draft is None:
+        return jsonify({"success": False, "message": "Draft not found"}), 404
+    delete_images(draft["image_id"], draft.get("thumbnail_id"))
+    return jsonify({"success": True, "message": "Draft discarded"}), 200
+
+@bp.route("/api/receipt/images/<file_id>")
+@login_required
+def receipt_image(file_id):
+    """A stored receipt photo or thumbnail (by image_id / thumbnail_id)"""
+    stream = find_image(ObjectId(current_user.id), ObjectId(file_id))
+    if stream is None:
+        return jsonify({"success": False, "message": "Image not found"}), 404
+    response = Response(iter(lambda: stream.readchunk(), b""),
+                        mimetype=stream.metadata.get("content_type", "application/octet-stream"))
+    response.call_on_close(stream.close)
+    # Stored images never change; their id is a stable validator
+    response.headers["Cache-Control"] = "private, max-age=86400, immutable"
+    return response
+
+@bp.route("/einvoice/invoice_list")
 @login_required
 def invoice_list():
     api = get_user_api(current_user.id)
@@ -366,13 +709,9 @@ def invoice_list():
         mimetype="application/json"
     )
 
-@app.route("/einvoice/carrier/invoices", methods=["GET"])
+@bp.route("/einvoice/carrier/invoices", methods=["GET"])
 @login_required
 def carrier_invoice_list():
-    api = get_user_api(current_user.id)
-    if not api:
-        return jsonify({"error": "No e-invoice credentials found"}), 401
-
     first_day = request.args.get("from")
     last_day = request.args.get("to")
     page = int(request.args.get("page", 0))
@@ -381,36 +720,171 @@ def carrier_invoice_list():
     if not first_day or not last_day:
         return jsonify({"error": "from and to dates are required"}), 400
 
-    result = getCarrierInvoice(
-        api=api,
-        frist_day=first_day,
-        last_day=last_day,
-        size=size,
-        page=page,
-    )
+    cache_key = (current_user.id, "carrier_invoices", first_day, last_day, page, size)
+    cached_etag = einvoice_digests.get(cache_key)
+    if cached_etag and is_not_modified(cached_etag):
+        return not_modified(cached_etag)
 
-    if not result:
-        return jsonify({"error": "Failed to fetch invoices"}), 500
+    accounts = user_accounts(current_user.id)
+    if not accounts:
+        return jsonify({"error": "No e-invoice credentials found"}), 401
 
-    return Response(
-        json_util.dumps(result),
-        mimetype="application/json"
+    try:
+        start_date, end_date = parse_invoice_date(first_day), parse_invoice_date(last_day)
+    except ValueError:
+        return jsonify({"error": "from and to must be YYYY/MM/DD dates"}), 400
+
+    result = fetch_carrier_invoices(current_user.id, accounts, start_date, end_date, size, page)
+    if len(result["errors"]) == len(accounts):
+        return jsonify({"error": "Failed to fetch invoices", "errors": result["errors"]}), 500
+
+    # A partial result must not be answered with 304 once the failed account recovers
+    return einvoice_response(None if result["errors"] else cache_key, result)
+
+@bp.route("/api/einvoice/jobs", methods=["POST"])
+@login_required
+def create_einvoice_job():
+    """
+    Fetch carrier invoices in the background. Returns the job to poll at
+    once; an identical pending job or a recent complete result is reused
+    unless refresh is "true".
+    """
+    first_day = request.form.get("from", "")
+    last_day = request.form.get("to", "")
+    try:
+        start_date, end_date = parse_invoice_date(first_day), parse_invoice_date(last_day)
+    except ValueError:
+        return jsonify({"success": False, "message": "from and to must be YYYY/MM/DD dates"}), 400
+    try:
+        page = max(int(request.form.get("page", 0)), 0)
+        size = min(max(int(request.form.get("size", 50)), 1), EINVOICE_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"success": False, "message": "page and size must be integers"}), 400
+
+    accounts = user_accounts(current_user.id)
+    if not accounts:
+        return jsonify({"success": False, "message": "No e-invoice credentials found"}), 401
+
+    params = {
+        "from": start_date.strftime("%Y/%m/%d"),
+        "to": end_date.strftime("%Y/%m/%d"),
+        "page": page,
+        "size": size
+    }
+    # Accounts are part of the key: after adding one, older results are not reused
+    key = "|".join(["carrier_invoices", params["from"], params["to"], str(page), str(size)]
+                   + [account.account_id for account in accounts])
+    job, created = submit_einvoice_job(
+        ObjectId(current_user.id), key, params, progress={"accounts": len(accounts)},
+        reuse=request.form.get("refresh", "false").lower() != "true"
     )
+    status = 202 if job["status"] in ("queued", "running") else 200
+    return jsonify({"success": True, "created": created, "job": serialize_job(job, include_result=False)}), status
 
-@app.route("/einvoice/carrier/invoice/detail", methods=["GET"])
+@bp.route("/api/einvoice/jobs/<job_id>")
 @login_required
-def carrier_invoice_detail():
-    api = get_user_api(current_user.id)
-    if not api:
-        return jsonify({"error": "No e-invoice credentials found"}), 401
+def get_einvoice_job(job_id):
+    job = find_job(ObjectId(current_user.id), ObjectId(job_id))
+    if job is None:
+        return jsonify({"success": False, "message": "Job not found"}), 404
+    return jsonify({"success": True, "job": serialize_job(job)}), 200
 
+@bp.route("/api/einvoice/qr/import", methods=["POST"])
+@login_required
+def import_invoice_qr():
+    """
+    Read the QR codes of a batch of paper e-invoice photos. Invoice numbers
+    not yet in the local mirror are recorded and, unless create_receipts is
+    "false", turned into receipts.
+    """
+    if request.content_length and request.content_length > QR_IMPORT_MAX_BYTES:
+        return jsonify({"success": False, "message": "Upload is too large"}), 413
+    photos = request.files.getlist("images")
+    if not photos:
+        return jsonify({"success": False, "message": "At least one image is required"}), 400
+    if len(photos) > QR_IMPORT_MAX_IMAGES:
+        return jsonify({"success": False, "message": f"At most {QR_IMPORT_MAX_IMAGES} images per request"}), 400
+    create_receipts = request.form.get("create_receipts", "true").lower() != "false"
+
+    with qr_decode_latency.time():
+        try:
+            decoded = decode_images([photo.read() for photo in photos])
+        except BrokenProcessPool:
+            return jsonify({"success": False, "message": "QR decoding is unavailable, try again shortly"}), 503
+
+    owner_id = ObjectId(current_user.id)
+    results = []
+    counts = {"created": 0, "recorded": 0, "duplicate": 0, "failed": 0}
+    for photo, (payloads, error) in zip(photos, decoded):
+        entry = {"filename": photo.filename, "invoices": []}
+        invoices = []
+        if not error:
+            try:
+                invoices = parse_invoice_qr(payloads)
+                if not invoices:
+                    error = "No e-invoice QR code found"
+            except ValueError as e:
+                error = str(e)
+        if error:
+            entry["error"] = error
+            counts["failed"] += 1
+            qr_images.inc(outcome="failed")
+            results.append(entry)
+            continue
+        qr_images.inc(outcome="decoded")
+
+        for invoice in invoices:
+            summary = {
+                "invoice_number": invoice["invoice_number"],
+                "invoice_date": invoice["invoice_date"].strftime("%Y-%m-%d"),
+                "total_amount": invoice["total_amount"],
+                "seller_ban": invoice["seller_ban"],
+                "status": "duplicate"
+            }
+            if record_scanned_invoice(owner_id, invoice):
+                summary["status"] = "recorded"
+                if create_receipts:
+                    try:
+                        receipt_id = insert_receipt(current_user.id, {
+                            "title": f"Invoice {invoice['invoice_number']}",
+                            "schema_version": RECEIPT_SCHEMA_VERSION,
+                            "currency": "TWD",
+                            "amount_minor": to_minor(invoice["total_amount"], "TWD"),
+                            "receipt_date": invoice["invoice_date"]
+                        }, invoice_number=invoice["invoice_number"])
+                    except Exception:
+                        # Otherwise a retry would report the invoice as a duplicate and never create its receipt
+                        forget_scanned_invoice(owner_id, invoice["invoice_number"])
+                        raise
+                    link_receipt(owner_id, invoice["invoice_number"], receipt_id)
+                    summary["status"] = "created"
+                    summary["receipt_id"] = str(receipt_id)
+            counts[summary["status"]] += 1
+            entry["invoices"].append(summary)
+        results.append(entry)
+
+    return jsonify({"success": True, "counts": counts, "results": results}), 200
+
+@bp.route("/einvoice/carrier/invoice/detail", methods=["GET"])
+@login_required
+def carrier_invoice_detail():
     token = request.args.get("token")
+    account_id = request.args.get("account")
     page = int(request.args.get("page", 0))
     size = int(request.args.get("size", 20))
 
     if not token:
         return jsonify({"error": "token is required"}), 400
 
+    cache_key = (current_user.id, "carrier_invoice_detail", account_id, token, page, size)
+    cached_etag = einvoice_digests.get(cache_key)
+    if cached_etag and is_not_modified(cached_etag):
+        return not_modified(cached_etag)
+
+    api = get_user_api(current_user.id, account_id)
+    if not api:
+        return jsonify({"error": "No e-invoice credentials found"}), 401
+
     data = getCarrierInvoiceDetail(
         api=api,
         token=token,
@@ -422,18 +896,96 @@ def carrier_invoice_detail():
         # handles ("msg", status_code)
         return jsonify({"error": data[0]}), data[1]
 
-    return Response(
-        json_util.dumps(data),
-        mimetype="application/json"
-    )
+    return einvoice_response(cache_key, data)
+
+# ------ Admin -------
+@bp.route("/api/admin/security-log", methods=["GET"])
+@admin_required
+def security_log():
+    """
+    Query security events, e.g. ?since=1h&event=login_failed&group_by=ip
+    Filters (event, status, user, ip) may be repeated to match any of several values.
+    """
+    try:
+        since = parse_time(request.args.get("since"))
+        until = parse_time(request.args.get("until"))
+        limit = min(int(request.args.get("limit", "100")), 1000)
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid since/until/limit"}), 400
+
+    group_by = request.args.get("group_by")
+    if group_by and group_by not in FILTER_FIELDS + ("endpoint",):
+        return jsonify({"success": False, "message": "Invalid group_by"}), 400
+
+    criteria = {field: request.args.getlist(field) or None for field in FILTER_FIELDS}
+    if group_by:
+        counts = aggregate_security_log(SECURITY_LOG_PATH, group_by, since=since, until=until, **criteria)
+        return jsonify({
+            "success": True,
+            "total": sum(counts.values()),
+            "groups": [{"value": value, "count": count} for value, count in counts.most_common(limit)]
+        })
+
+    events = list(query_security_log(SECURITY_LOG_PATH, since=since, until=until, limit=limit,
+                                     newest_first=True, **criteria))
+    return jsonify({"success": True, "count": len(events), "events": events})
+
+@bp.route("/api/admin/profile", methods=["GET"])
+@admin_required
+def profile_status():
+    """Active and recent profiling sessions of the worker serving this request"""
+    return jsonify({"success": True, **profiler.status()})
+
+@bp.route("/api/admin/profile", methods=["POST"])
+@admin_required
+def profile_start():
+    """
+    Profile this worker for `seconds`, or for the next `requests` requests to
+    `endpoint`; `memory=true` adds tracemalloc snapshots.
+    """
+    try:
+        session = profiler.start_profile(
+            seconds=float(request.form["seconds"]) if request.form.get("seconds") else None,
+            requests=int(request.form["requests"]) if request.form.get("requests") else None,
+            endpoint=request.form.get("endpoint") or None,
+            interval=float(request.form.get("interval_ms", "5")) / 1000,
+            memory=request.form.get("memory", "false").lower() == "true"
+        )
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid profiling parameters"}), 400
+    except profiler.ProfilerBusy as e:
+        return jsonify({"success": False, "message": str(e)}), 409
+    log_security_event('profiler_started', user=current_user.email, details=session.describe())
+    return jsonify({"success": True, "profile": session.describe()}), 202
+
+@bp.route("/api/admin/profile/<path:filename>", methods=["GET"])
+@admin_required
+def profile_download(filename):
+    """Download a .folded or .tracemalloc.txt file from PROFILE_DIR"""
+    return send_from_directory(os.path.abspath(profiler.PROFILE_DIR), filename, as_attachment=True)
+
+# ------ Metrics -------
+@bp.route("/metrics", methods=["GET"])
+@limiter.exempt
+def metrics_endpoint():
+    """Prometheus scrape endpoint; requires 'Authorization: Bearer <METRICS_TOKEN>' when set"""
+    token = getenv("METRICS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
 
 # ------ Error Handlers -------
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
     return jsonify({"success": False, "message": "Resource not found"}), 404
 
-@app.errorhandler(429)
+@bp.app_errorhandler(413)
+def too_large(error):
+    """Handle bodies over MAX_CONTENT_LENGTH, with or without a Content-Length"""
+    return jsonify({"success": False, "message": "Upload is too large"}), 413
+
+@bp.app_errorhandler(429)
 def ratelimit_handler(error):
     """Handle rate limit exceeded errors"""
     # Log rate limit violation
@@ -445,55 +997,73 @@ def ratelimit_handler(error):
         "message": "Too many requests. Please try again later."
     }), 429
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     """Handle internal server errors"""
     # Log the error but don't expose details to client
-    app.logger.error(f"Internal error: {error}")
+    current_app.logger.error(f"Internal error: {error}")
     return jsonify({
         "success": False, 
         "message": "An internal error occurred. Please try again later."
     }), 500
 
 # ------ User API -------
-def get_user_api(user_id):
-    """Return a per-user EInvoiceAuthenticator instance."""
-    doc = einvoice_login.find_one({"owner_id": ObjectId(user_id)})
-    if not doc:
-        return None  # or raise exception
-
-    username = doc["einvoice_username"]
-    password = doc["einvoice_password"]  # TEMPORARILY no decryption - crypto disabled
-
-    # Create a new API session for this user
-    api = EInvoiceAuthenticator(username=username, password=password)
-
-    # Optionally, wipe password after initialization
-    password = None
-
-    return api
-
-
-
-
-def getCarrierInvoice(api, frist_day, last_day, size, page):
-    token = api.getSearchCarrierInvoiceListJWT(frist_day, last_day)
-    if not token:
-        return None
-
-    all_items = []
-    while True:
-        data = api.searchCarrierInvoice(token, size=size, page=page)
-        if 'content' not in data:
-            break
-        all_items.extend(data['content'])
-
-        if data.get('last', True):  # When it's the last page
-            break
-        page += 1
-
-    total = sum(int(item['totalAmount']) for item in all_items)
-    return {"content": all_items, "total": total}
+def get_user_api(user_id, account_id=None):
+    """
+    Return the cached EInvoiceAuthenticator of one of the user's accounts:
+    the given account (as listed in the `account` field of carrier invoices),
+    else the first one stored.
+    """
+    accounts = user_accounts(user_id)
+    if account_id:
+        accounts = [account for account in accounts if account.account_id == account_id]
+    return accounts[0].api if accounts else None
+
+
+def einvoice_response(cache_key, data):
+    """
+    Serialize upstream e-invoice data with a content-derived ETag.
+    The digest is remembered so the next matching If-None-Match skips upstream.
+    """
+    body = json_util.dumps(data).encode("utf-8")
+    etag = content_digest(body)
+    if cache_key is not None:
+        einvoice_digests.set(cache_key, etag)
+    if is_not_modified(etag):
+        return not_modified(etag)
+    return with_etag(Response(body, mimetype="application/json"), etag)
+
+
+def parse_invoice_date(value):
+    """Parse a YYYY/MM/DD (or YYYY-MM-DD) query parameter into a datetime"""
+    return datetime.strptime(value.replace("-", "/"), "%Y/%m/%d")
+
+def getCarrierInvoice(api, frist_day, last_day, size, page, on_page=None):
+    with tracing.span("getCarrierInvoice", size=size) as trace_span:
+        token = api.getSearchCarrierInvoiceListJWT(frist_day, last_day)
+        if not token:
+            return None
+
+        all_items = []
+        pages = 0
+        while True:
+            with tracing.span("carrier_invoice_page", page=page):
+                data = api.searchCarrierInvoice(token, size=size, page=page)
+            pages += 1
+            if 'content' not in data:
+                break
+            all_items.extend(data['content'])
+            if on_page:
+                on_page(pages=1, items=len(data['content']))
+
+            if data.get('last', True):  # When it's the last page
+                break
+            page += 1
+
+        if trace_span:
+            trace_span.set(pages=pages, invoices=len(all_items))
+        total = sum(int(item['totalAmount']) for item in all_items)
+        return {"content": all_items, "total": total}
 
 def getCarrierInvoiceDetail(api, token, page, size):
     if not token:
@@ -504,8 +1074,128 @@ def getCarrierInvoiceDetail(api, token, page, size):
         return "No data found for the provided token", 404
     return data
 
+def fetch_carrier_invoices(user_id, accounts, start_date, end_date, size, page, on_page=None):
+    """
+    Fetch the carrier invoices of every account concurrently, each on its own
+    session, merge them and update the local invoice mirror.
+
+    Returns:
+        merge_invoices() result; errors lists the accounts that failed
+    """
+    result = merge_invoices(fetch_all(accounts, lambda api: getCarrierInvoice(
+        api=api,
+        frist_day=start_date,
+        last_day=end_date,
+        size=size,
+        page=page,
+        on_page=on_page,
+    )))
+    if len(result["errors"]) < len(accounts):
+        mirror_carrier_invoices(ObjectId(user_id), result["content"])
+        event_bus.broadcast(str(user_id), "invoice_sync_complete", {
+            "from": start_date.strftime("%Y/%m/%d"),
+            "to": end_date.strftime("%Y/%m/%d"),
+            "count": len(result["content"]),
+            "total": result["total"]
+        })
+    return result
+
+def run_einvoice_job(job, report):
+    """Job runner: the background counterpart of /einvoice/carrier/invoices"""
+    params = job["params"]
+    accounts = user_accounts(job["owner_id"])
+    if not accounts:
+        raise ValueError("No e-invoice credentials found")
+    result = fetch_carrier_invoices(
+        job["owner_id"], accounts, parse_invoice_date(params["from"]), parse_invoice_date(params["to"]),
+        params["size"], params["page"], on_page=report
+    )
+    if len(result["errors"]) == len(accounts):
+        raise RuntimeError("Failed to fetch invoices: " + "; ".join(e["error"] for e in result["errors"]))
+    return result
+
+def publish_job_event(job):
+    """Progress and completion of a background fetch, for the owner's event streams"""
+    event_bus.broadcast(str(job["owner_id"]), "einvoice_job", {
+        "id": str(job["_id"]),
+        "status": job["status"],
+        "progress": job["progress"]
+    })
+
+register_job_runner(run_einvoice_job)
+on_job_update(publish_job_event)
+
+# ---------- Application Factory ----------
+_worker_pid = None
+
+def init_worker():
+    """
+    Per-process startup for things that must not cross a fork
+    (background threads, connections). Runs once per worker process.
+    """
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    metrics.registry.start_flusher()
+    # Only possible from the main thread, i.e. gunicorn's post_worker_init
+    profiler.install_signal_handler()
+    if getenv("EVENT_BUS_CHANGE_STREAMS", "false").lower() == "true":
+        # Cross-process delivery via Mongo change streams (needs a replica set)
+        start_change_stream_relay(receipt, event_bus)
+        start_outbox_relay(event_outbox, event_bus)
+    # Photos and invoice fetches queued in a worker that has since exited
+    resume_pending()
+    resume_einvoice_jobs()
+    if getenv("EINVOICE_PRELOAD", "false").lower() == "true":
+        # Dedicated e-invoice workers load selenium/OCR up front instead of lazily
+        preload_einvoice_stack()
+
+def create_app(config=None):
+    """
+    Build the Flask application.
+
+    Args:
+        config: Optional dict of config overrides (e.g. {"TESTING": True})
+
+    Returns:
+        Configured Flask app
+    """
+    app = Flask(__name__)
+    app.secret_key = getenv("secret_key")
+
+    # Session Security
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
+    app.config['RATELIMIT_ENABLED'] = getenv("RATELIMIT_ENABLED", "true").lower() == "true"
+    # Also caps chunked bodies, which carry no Content-Length; routes check their own smaller limits
+    app.config['MAX_CONTENT_LENGTH'] = max(UPLOAD_MAX_BYTES, QR_IMPORT_MAX_BYTES)
+    if config:
+        app.config.update(config)
+
+    limiter.init_app(app)
+    metrics.init_app(app)
+    tracing.init_app(app)
+    profiler.init_app(app)
+
+    # Security Headers (disabled HTTPS enforcement for development)
+    Talisman(app, 
+        force_https=False,  # Set to True in production with HTTPS
+        content_security_policy=None  # Can be configured for stricter CSP
+    )
+
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    app.before_request(init_worker)
+    return app
+
 #webserver
 
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0")
+    # Development server; production runs: gunicorn -c gunicorn.conf.py "server:create_app()"
+    ensure_indexes()
+    profiler.install_signal_handler()
+    create_app().run(debug=True, host="0.0.0.0")
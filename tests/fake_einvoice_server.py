@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the Taiwan e-invoice platform.
+
+Implements the login flow (login page, captcha, login API) and the carrier
+endpoints EInvoiceAuthenticator uses, serving deterministic synthetic,
+paginated invoices. Latency, error rate, 429 throttling and token expiry are
+configurable so fetch/retry/caching behaviour can be measured repeatably.
+
+Usage:
+    python tests/fake_einvoice_server.py --port 8090 --latency-ms 80 --throttle-rate 0.05
+
+    EINVOICE_WEB_BASE=http://127.0.0.1:8090 \\
+    EINVOICE_SERVICE_BASE=http://127.0.0.1:8090 \\
+    EINVOICE_LOGIN_STRATEGY=http python server.py
+
+Runtime knobs: GET/POST /_config (JSON), counters: GET /_stats.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import secrets
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+CONFIG = {
+    "latency_ms": 0.0,        # mean added latency per request
+    "jitter_ms": 0.0,         # uniform +/- jitter
+    "error_rate": 0.0,        # fraction of API calls answered with 500
+    "throttle_rate": 0.0,     # fraction answered with 429
+    "retry_after": 1,         # Retry-After seconds on 429
+    "token_ttl": 1800,        # seconds an auth token stays valid
+    "invoices_per_day": 3.0,  # average synthetic invoices per day
+    "captcha_digits": 6,
+    "strict_captcha": False,  # require the exact captcha answer
+    "seed": 0,
+}
+
+_tokens = {}      # auth token -> (user, expires_at)
+_captchas = {}    # captcha key -> answer
+_lock = threading.Lock()
+stats = Counter()
+
+# 3x5 bitmap digits, rendered scaled into the captcha PNG
+_FONT = {
+    "0": ["111", "101", "101", "101", "111"], "1": ["010", "110", "010", "010", "111"],
+    "2": ["111", "001", "111", "100", "111"], "3": ["111", "001", "111", "001", "111"],
+    "4": ["101", "101", "111", "001", "001"], "5": ["111", "100", "111", "001", "111"],
+    "6": ["111", "100", "111", "101", "111"], "7": ["111", "001", "010", "010", "010"],
+    "8": ["111", "101", "111", "101", "111"], "9": ["111", "101", "111", "001", "111"],
+}
+
+
+def render_captcha(text: str, scale: int = 6) -> bytes:
+    """Dark digits on a light background as a grayscale PNG"""
+    pad = scale * 2
+    width = pad * 2 + len(text) * 4 * scale
+    height = pad * 2 + 5 * scale
+    rows = []
+    for y in range(height):
+        row = bytearray([235] * width)
+        fy = (y - pad) // scale
+        if 0 <= fy < 5 and y >= pad:
+            for i, ch in enumerate(text):
+                for fx, bit in enumerate(_FONT[ch][fy]):
+                    if bit == "1":
+                        x0 = pad + (i * 4 + fx) * scale
+                        row[x0:x0 + scale] = bytes([30] * scale)
+        rows.append(b"\x00" + bytes(row))
+
+    def chunk(tag, data):
+        return struct.pack("!I", len(data)) + tag + data + struct.pack("!I", zlib.crc32(tag + data))
+
+    header = struct.pack("!IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(b"".join(rows))) + chunk(b"IEND", b""))
+
+
+def _delay():
+    latency = CONFIG["latency_ms"] + random.uniform(-CONFIG["jitter_ms"], CONFIG["jitter_ms"])
+    if latency > 0:
+        time.sleep(latency / 1000)
+
+
+def _fault():
+    """Injected failure response, or None"""
+    roll = random.random()
+    if roll < CONFIG["throttle_rate"]:
+        stats["throttled"] += 1
+        return Response("Too Many Requests", 429, {"Retry-After": str(CONFIG["retry_after"])})
+    if roll < CONFIG["throttle_rate"] + CONFIG["error_rate"]:
+        stats["errors"] += 1
+        return Response("Internal Server Error", 500)
+    return None
+
+
+def _auth_user():
+    """User for the request's bearer token, or None if missing/expired"""
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    with _lock:
+        entry = _tokens.get(token)
+    if entry is None or entry[1] < time.time():
+        stats["unauthorized"] += 1
+        return None
+    return entry[0]
+
+
+def api(endpoint):
+    """Wrap an authenticated API endpoint with latency, faults and auth"""
+    def decorator(f):
+        def wrapped(*args, **kwargs):
+            stats[endpoint] += 1
+            _delay()
+            fault = _fault()
+            if fault is not None:
+                return fault
+            user = _auth_user()
+            if user is None:
+                return jsonify({"msg": "token expired"}), 401
+            return f(user, *args, **kwargs)
+        wrapped.__name__ = f.__name__
+        return wrapped
+    return decorator
+
+
+def _encode(payload: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def _decode(token: str) -> dict:
+    return json.loads(base64.urlsafe_b64decode(token.strip().encode()))
+
+
+def _rng(*parts) -> random.Random:
+    digest = hashlib.sha256("|".join(str(p) for p in (CONFIG["seed"],) + parts).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+SELLERS = ["7-ELEVEN", "全家便利商店", "全聯福利中心", "家樂福", "星巴克", "麥當勞", "誠品書店", "屈臣氏"]
+
+
+def invoices_for(user: str, start: datetime, end: datetime):
+    """Deterministic synthetic invoices for user between start and end (inclusive days)"""
+    items = []
+    day = start.date()
+    while day <= end.date():
+        rng = _rng(user, day.isoformat())
+        count = int(rng.expovariate(1 / CONFIG["invoices_per_day"])) if CONFIG["invoices_per_day"] else 0
+        for n in range(count):
+            seller = rng.choice(SELLERS)
+            number = f"{chr(65 + rng.randrange(26))}{chr(65 + rng.randrange(26))}{rng.randrange(10**8):08d}"
+            amount = rng.randint(20, 3000)
+            items.append({
+                "invoiceNumber": number,
+                "invoiceDate": f"{day.isoformat()}T{rng.randrange(8, 22):02d}:{rng.randrange(60):02d}:00",
+                "sellerName": seller,
+                "sellerBan": f"{rng.randrange(10**8):08d}",
+                "totalAmount": str(amount),
+                "invoiceStatus": "正常",
+                "carrierName": "手機條碼",
+                "token": _encode({"user": user, "number": number, "day": day.isoformat(),
+                                  "amount": amount, "seller": seller}),
+            })
+        day += timedelta(days=1)
+    items.sort(key=lambda i: i["invoiceDate"], reverse=True)
+    return items
+
+
+def page_of(items, page: int, size: int) -> dict:
+    total_pages = max(1, -(-len(items) // size))
+    return {
+        "content": items[page * size:(page + 1) * size],
+        "number": page,
+        "size": size,
+        "totalElements": len(items),
+        "totalPages": total_pages,
+        "first": page == 0,
+        "last": page >= total_pages - 1,
+    }
+
+
+# ---------- Login ----------
+@app.route("/")
+def home():
+    return '<a title="登入" href="/accounts/login/mw">登入</a>'
+
+
+@app.route("/accounts/login/mw")
+def login_page():
+    stats["login_page"] += 1
+    _delay()
+    response = Response("""<!doctype html><html><body>
+<form id="loginForm">
+  <input id="mobile_phone"><input id="password" type="password">
+  <input id="captcha"><span class="input-group-text code_num"><img id="captchaImg"></span>
+  <button type="button" class="btn btn-outline-secondary icon" id="refresh">&#8635;</button>
+  <button type="button" id="submitBtn">登入</button>
+</form>
+<script>
+let key = null;
+async function refresh() {
+  const data = await (await fetch('/btc/cloud/api/common/getCaptcha')).json();
+  key = data.captchaKey;
+  document.getElementById('captchaImg').src = 'data:image/png;base64,' + data.image;
+}
+document.getElementById('refresh').onclick = refresh;
+document.getElementById('submitBtn').onclick = async () => {
+  const res = await fetch('/btc/cloud/api/common/login', {method: 'POST',
+    headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify({mobile_phone: mobile_phone.value, password: password.value,
+                          captcha: captcha.value, captchaKey: key})});
+  if (res.ok) { sessionStorage.setItem('saveToken', (await res.json()).token); location.href = '/'; }
+};
+refresh();
+</script></body></html>""", mimetype="text/html")
+    response.set_cookie("JSESSIONID", secrets.token_hex(16))
+    return response
+
+
+@app.route("/btc/cloud/api/common/getCaptcha")
+def captcha():
+    stats["captcha"] += 1
+    _delay()
+    answer = "".join(random.choice("0123456789") for _ in range(CONFIG["captcha_digits"]))
+    key = secrets.token_hex(8)
+    with _lock:
+        _captchas[key] = answer
+    return jsonify({"captchaKey": key, "image": base64.b64encode(render_captcha(answer)).decode()})
+
+
+@app.route("/btc/cloud/api/common/login", methods=["POST"])
+def login():
+    stats["login"] += 1
+    _delay()
+    data = request.get_json(silent=True) or {}
+    with _lock:
+        answer = _captchas.pop(data.get("captchaKey"), None)
+    if not data.get("mobile_phone") or not data.get("password"):
+        return jsonify({"msg": "帳號或密碼錯誤"}), 401
+    if not data.get("captcha") or (CONFIG["strict_captcha"] and data.get("captcha") != answer):
+        stats["captcha_rejected"] += 1
+        return jsonify({"msg": "驗證碼錯誤"}), 400
+    token = secrets.token_urlsafe(32)
+    with _lock:
+        _tokens[token] = (data["mobile_phone"], time.time() + CONFIG["token_ttl"])
+    return jsonify({"token": token})
+
+
+# ---------- Carrier API ----------
+@app.route("/btc/cloud/api/btc502w/getCarrierList", methods=["GET"])
+@api("getCarrierList")
+def carrier_list(user):
+    return jsonify([{"carrierType": "3J0002", "carrierId2": f"/{user[-7:]:>7}", "carrierName": "手機條碼"}])
+
+
+@app.route("/btc/cloud/api/btc502w/getSearchCarrierInvoiceListJWT", methods=["POST"])
+@api("getSearchCarrierInvoiceListJWT")
+def search_jwt(user):
+    data = request.get_json(silent=True) or {}
+    return _encode({"user": user, "start": data.get("searchStartDate"), "end": data.get("searchEndDate")})
+
+
+@app.route("/btc/cloud/api/btc502w/searchCarrierInvoice", methods=["POST"])
+@api("searchCarrierInvoice")
+def search(user):
+    try:
+        query = _decode((request.get_json(silent=True) or {}).get("token", ""))
+        start = datetime.fromisoformat(query["start"].rstrip("Z"))
+        end = datetime.fromisoformat(query["end"].rstrip("Z"))
+    except (ValueError, KeyError, TypeError):
+        return jsonify({"msg": "invalid token"}), 400
+    page = request.args.get("page", 0, type=int)
+    size = request.args.get("size", 10, type=int)
+    return jsonify(page_of(invoices_for(user, start, end), page, size))
+
+
+def _invoice_from_body():
+    try:
+        return _decode(request.get_data(as_text=True))
+    except (ValueError, TypeError):
+        return None
+
+
+@app.route("/btc/cloud/api/common/getCarrierInvoiceData", methods=["POST"])
+@api("getCarrierInvoiceData")
+def invoice_data(user):
+    invoice = _invoice_from_body()
+    if invoice is None:
+        return jsonify({"msg": "invalid token"}), 400
+    return jsonify({"invoiceNumber": invoice["number"], "invoiceDate": invoice["day"],
+                    "sellerName": invoice["seller"], "totalAmount": str(invoice["amount"])})
+
+
+@app.route("/btc/cloud/api/common/getCarrierInvoiceDetail", methods=["POST"])
+@api("getCarrierInvoiceDetail")
+def invoice_detail(user):
+    invoice = _invoice_from_body()
+    if invoice is None:
+        return jsonify({"msg": "invalid token"}), 400
+    rng = _rng(invoice["number"])
+    remaining, lines = invoice["amount"], []
+    while remaining > 0:
+        price = min(remaining, rng.randint(10, 500))
+        lines.append({"item": f"商品{len(lines) + 1}", "quantity": "1", "unitPrice": str(price), "amount": str(price)})
+        remaining -= price
+    page = request.args.get("page", 0, type=int)
+    size = request.args.get("size", 10, type=int)
+    return jsonify(page_of(lines, page, size))
+
+
+# ---------- Control ----------
+def _config_value(key, value):
+    """value converted to the type of CONFIG[key]; bools accept true/false strings too"""
+    if isinstance(CONFIG[key], bool):
+        return value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "on")
+    return type(CONFIG[key])(value)
+
+
+@app.route("/_config", methods=["GET", "POST"])
+def config():
+    if request.method == "POST":
+        for key, value in (request.get_json(silent=True) or {}).items():
+            if key in CONFIG:
+                try:
+                    CONFIG[key] = _config_value(key, value)
+                except (TypeError, ValueError):
+                    return jsonify({"msg": f"invalid value for {key}"}), 400
+    return jsonify(CONFIG)
+
+
+@app.route("/_stats", methods=["GET", "DELETE"])
+def get_stats():
+    if request.method == "DELETE":
+        stats.clear()
+    return jsonify(dict(stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline fake e-invoice platform")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    for key, value in CONFIG.items():
+        flag = "--" + key.replace("_", "-")
+        if isinstance(value, bool):
+            parser.add_argument(flag, action="store_true", default=value)
+        else:
+            parser.add_argument(flag, type=type(value), default=value)
+    args = parser.parse_args()
+    for key in CONFIG:
+        CONFIG[key] = getattr(args, key)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+HMEICR load-testing harness for the auth and receipt APIs.
+
+Each virtual user registers, logs in, creates receipts, lists, edits,
+deletes and logs out. Latency is recorded per endpoint and summarized as
+throughput and p50/p95/p99 into a JSON report; two reports can be compared
+to flag regressions.
+
+Usage:
+    # Against a running server (start it with RATELIMIT_ENABLED=false)
+    python tests/load_test.py --base-url http://localhost:8080 --users 50 --concurrency 10
+
+    # Start the app in-process against MONGO_URI with the limiter disabled
+    python tests/load_test.py --serve --users 50 --concurrency 10 --out load_report.json
+
+    # Compare with a previous run (exit code 1 on regression)
+    python tests/load_test.py --serve --compare baseline.json --threshold 0.15
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.money import currency_exponent  # noqa: E402
+from utils.validators import validate_amount  # noqa: E402
+
+CURRENCIES = ["TWD", "USD", "JPY", "EUR"]
+
+
+class Recorder:
+    """Thread-safe latency samples per endpoint"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            self.samples[name].append(seconds * 1000)
+            if not ok:
+                self.errors[name] += 1
+
+
+def endpoint_name(method, path):
+    """Collapse ids so /api/receipt/<id>/edit aggregates across receipts"""
+    return f"{method} {re.sub(r'/[0-9a-f]{24}(?=/|$)', '/<id>', path)}"
+
+
+class VirtualUser:
+    def __init__(self, base_url, recorder, run_id, index, receipts, title_length):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.session = requests.Session()
+        self.email = f"load-{run_id}-{index}@example.com"
+        self.password = "LoadTest123"
+        self.receipts = receipts
+        self.title_length = title_length
+
+    def call(self, method, path, expected=(200, 201, 304), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+            ok = response.status_code in expected
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.record(endpoint_name(method, path), time.perf_counter() - start, ok)
+        return response
+
+    def receipt_form(self):
+        day = date.today() - timedelta(days=random.randrange(365))
+        currency = random.choice(CURRENCIES)
+        return {
+            "title": f"Load receipt {uuid.uuid4().hex}".ljust(self.title_length, "x")[:self.title_length],
+            "currency": currency,
+            # As many decimals as the currency has (none for JPY), or the server answers 400
+            "amount": f"{random.uniform(1, 5000):.{currency_exponent(currency)}f}",
+            "receipt_date": day.isoformat(),
+        }
+
+    def list_ids(self):
+        response = self.call("GET", "/api/receipt")
+        if response is None or response.status_code != 200:
+            return []
+        return [r["_id"] for r in response.json()]
+
+    def run(self):
+        self.call("POST", "/api/register", data={"email": self.email, "password": self.password})
+        response = self.call("POST", "/api/login", data={"email": self.email, "password": self.password})
+        if response is None or response.status_code != 200:
+            return
+        # Talisman marks the session cookie Secure; keep sending it over plain HTTP
+        for cookie in self.session.cookies:
+            cookie.secure = False
+
+        for _ in range(self.receipts):
+            self.call("POST", "/api/receipt/create", data=self.receipt_form())
+        ids = self.list_ids()
+
+        for receipt_id in ids[: len(ids) // 2]:
+            self.call("POST", f"/api/receipt/{receipt_id}/edit", data=self.receipt_form())
+        ids = self.list_ids()
+
+        for receipt_id in ids[: len(ids) // 4]:
+            self.call("POST", f"/api/receipt/{receipt_id}/delete")
+        self.list_ids()
+
+        self.call("GET", "/api/logout")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = pct / 100 * (len(ordered) - 1)
+    low, high = int(rank), min(int(rank) + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(recorder, wall_seconds):
+    endpoints = {}
+    for name, samples in sorted(recorder.samples.items()):
+        endpoints[name] = {
+            "count": len(samples),
+            "errors": recorder.errors.get(name, 0),
+            "throughput_rps": len(samples) / wall_seconds if wall_seconds else 0.0,
+            "mean_ms": statistics.mean(samples),
+            "p50_ms": percentile(samples, 50),
+            "p95_ms": percentile(samples, 95),
+            "p99_ms": percentile(samples, 99),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "total_requests": total,
+        "total_errors": sum(e["errors"] for e in endpoints.values()),
+        "wall_seconds": wall_seconds,
+        "throughput_rps": total / wall_seconds if wall_seconds else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def compare(current, baseline, threshold):
+    """
+    Returns:
+        List of human-readable regressions (p95 latency up or throughput down
+        by more than threshold, or new errors)
+    """
+    regressions = []
+    for name, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {now['p95_ms']:.1f} ms")
+        if before["throughput_rps"] and now["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {before['throughput_rps']:.1f} -> {now['throughput_rps']:.1f} req/s")
+        if now["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def serve_in_process(disable_limiter):
+    """Start the app on a free local port in a background thread"""
+    import logging
+    from werkzeug.serving import make_server
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    app = server.create_app({"RATELIMIT_ENABLED": not disable_limiter})
+    httpd = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_port}", httpd
+
+
+def check_receipt_forms(title_length, samples=200):
+    """Fail fast if the harness would send amounts the server rejects as invalid"""
+    user = VirtualUser("http://localhost", Recorder(), "check", 0, 0, title_length)
+    for _ in range(samples):
+        form = user.receipt_form()
+        is_valid, error_msg = validate_amount(form["amount"], form["currency"])
+        assert is_valid, f"Generated amount {form['amount']} {form['currency']} is invalid: {error_msg}"
+
+
+def cleanup(run_id):
+    """Remove the accounts and receipts created by an in-process run"""
+    import server
+    pattern = f"^load-{run_id}-"
+    owner_ids = [u["_id"] for u in server.users.find({"email": {"$regex": pattern}}, {"_id": 1})]
+    server.receipt.delete_many({"owner_id": {"$in": owner_ids}})
+    server.users.delete_many({"_id": {"$in": owner_ids}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the HMEICR auth and receipt APIs")
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--serve", action="store_true", help="run the app in-process against MONGO_URI")
+    parser.add_argument("--keep-limiter", action="store_true", help="with --serve, leave rate limiting on")
+    parser.add_argument("--keep-data", action="store_true", help="with --serve, do not delete test data")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--receipts-per-user", type=int, default=10)
+    parser.add_argument("--title-length", type=int, default=32, help="receipt title size (server caps at 200)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default="load_report.json")
+    parser.add_argument("--compare", help="baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    check_receipt_forms(args.title_length)
+    run_id = uuid.uuid4().hex[:8]
+    base_url, httpd = args.base_url, None
+    if args.serve:
+        base_url, httpd = serve_in_process(disable_limiter=not args.keep_limiter)
+
+    recorder = Recorder()
+    print(f"Run {run_id}: {args.users} users x {args.receipts_per_user} receipts, "
+          f"concurrency {args.concurrency} -> {base_url}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        users = [VirtualUser(base_url, recorder, run_id, i, args.receipts_per_user, args.title_length) for i in range(args.users)]
+        list(pool.map(lambda u: u.run(), users))
+    wall = time.perf_counter() - start
+
+    report = summarize(recorder, wall)
+    report["run"] = {
+        "id": run_id,
+        "timestamp": datetime.utcnow().isoformat(),
+        "base_url": base_url,
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "receipts_per_user": args.receipts_per_user,
+        "title_length": args.title_length,
+        "limiter_disabled": args.serve and not args.keep_limiter,
+    }
+
+    header = f"{'endpoint':<34}{'count':>7}{'err':>5}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, e in report["endpoints"].items():
+        print(f"{name:<34}{e['count']:>7}{e['errors']:>5}{e['throughput_rps']:>9.1f}"
+              f"{e['p50_ms']:>9.1f}{e['p95_ms']:>9.1f}{e['p99_ms']:>9.1f}")
+    print(f"Total: {report['total_requests']} requests, {report['total_errors']} errors, "
+          f"{report['throughput_rps']:.1f} req/s in {wall:.1f}s")
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.out}")
+
+    if httpd is not None:
+        httpd.shutdown()
+        if not args.keep_data:
+            cleanup(run_id)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("Regressions detected:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
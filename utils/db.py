@@ -0,0 +1,69 @@
+"""
+MongoDB Connection Module
+Lazy, fork-safe access to the shared MongoClient.
+
+A MongoClient must not be shared across fork(): the client is created on
+first use and re-created whenever the current process id differs from the
+one that created it, so pre-fork workers each get their own connection pool.
+"""
+
+import os
+import threading
+from os import getenv
+
+from pymongo import MongoClient
+
+from utils.metrics import MongoCommandListener
+from utils.tracing import TracingCommandListener
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    """Return this process's MongoClient, creating it on first use"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                _client = MongoClient(
+                    getenv("MONGO_URI", "mongodb://localhost:27017"),
+                    maxPoolSize=int(getenv("MONGO_MAX_POOL_SIZE", "50")),
+                    event_listeners=[MongoCommandListener(), TracingCommandListener()]
+                )
+                _client_pid = pid
+    return _client
+
+
+def get_db():
+    """Return the application database"""
+    return get_client()[getenv("MONGO_DB", "myapp")]
+
+
+def close_client():
+    """Close the client owned by this process (e.g. in the master before forking)"""
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+class LazyCollection:
+    """
+    Module-level stand-in for a pymongo Collection.
+    Resolves the real collection on each attribute access so importing a
+    module never opens a connection.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
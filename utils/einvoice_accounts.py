@@ -0,0 +1,166 @@
+"""
+E-Invoice Accounts Module
+Every e-invoice login a user has stored, each with its own cached session.
+
+An EInvoiceAuthenticator logs in lazily (HTTP or browser) on its first call,
+so it is kept per worker and reused until EINVOICE_SESSION_TTL expires. The
+cache key includes a digest of the credentials: editing an account makes
+every worker log in again with the new ones. A lock per account lets only
+one request at a time drive (and, when needed, re-authenticate) a session.
+
+Fetches for all accounts of a user run concurrently on a small thread pool;
+each account's result or error is returned separately so one failing login
+never hides the invoices of the others.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from os import getenv
+
+from bson import ObjectId
+
+from api.AuthorizedModules import EInvoiceAuthenticator
+from utils import tracing
+from utils.db import LazyCollection
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = float(getenv("EINVOICE_SESSION_TTL", "1800"))
+FETCH_THREADS = int(getenv("EINVOICE_FETCH_THREADS", "8"))
+
+einvoice_login = LazyCollection("einvoice_login")
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+class Account:
+    """One stored e-invoice login and its (cached) authenticated API"""
+
+    def __init__(self, account_id: str, username: str, api: EInvoiceAuthenticator, lock: threading.Lock):
+        self.account_id = account_id
+        self.username = username
+        self.api = api
+        self.lock = lock
+
+
+def _fingerprint(doc) -> str:
+    raw = f"{doc['einvoice_username']}\0{doc['einvoice_password']}".encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _session_for(doc):
+    key = (str(doc["_id"]), _fingerprint(doc))
+    now = time.monotonic()
+    with _sessions_lock:
+        for stale in [k for k, (_, _, expires_at) in _sessions.items() if expires_at < now]:
+            del _sessions[stale]
+        entry = _sessions.get(key)
+        if entry is None:
+            # TEMPORARILY no decryption - crypto disabled
+            api = EInvoiceAuthenticator(user=doc["einvoice_username"], password=doc["einvoice_password"])
+            entry = _sessions[key] = (api, threading.Lock(), now + SESSION_TTL)
+        return entry[0], entry[1]
+
+
+def user_accounts(user_id) -> list:
+    """
+    All e-invoice accounts of a user, oldest first.
+
+    Returns:
+        List of Account (empty when no credentials are stored)
+    """
+    with tracing.span("user_accounts") as trace_span:
+        accounts = []
+        for doc in einvoice_login.find({"owner_id": ObjectId(user_id)}).sort("_id", 1):
+            api, lock = _session_for(doc)
+            accounts.append(Account(str(doc["_id"]), doc["einvoice_username"], api, lock))
+        if trace_span:
+            trace_span.set(accounts=len(accounts))
+        return accounts
+
+
+def invalidate(account_id):
+    """Drop the cached session of an account in this worker"""
+    with _sessions_lock:
+        for key in [k for k in _sessions if k[0] == str(account_id)]:
+            del _sessions[key]
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _sessions_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(FETCH_THREADS, thread_name_prefix="einvoice-fetch")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _run(account: Account, fetch):
+    with tracing.span("einvoice_account", account=account.account_id):
+        try:
+            with account.lock:
+                result = fetch(account.api)
+        except Exception as e:
+            logger.warning(f"E-invoice fetch failed for account {account.account_id}: {e}")
+            return None, str(e)
+        if not result:
+            return None, "Failed to fetch invoices"
+        return result, None
+
+
+def fetch_all(accounts, fetch) -> list:
+    """
+    Call fetch(api) for every account concurrently.
+
+    Args:
+        accounts: Accounts from user_accounts()
+        fetch: Callable(EInvoiceAuthenticator) returning a falsy value on failure
+
+    Returns:
+        One (account, result, error) tuple per account, in order; result is
+        None whenever error is set
+    """
+    if len(accounts) == 1:
+        return [(accounts[0], *_run(accounts[0], fetch))]
+    # Each task gets a copy of the request context so its spans join the request trace
+    futures = [_get_executor().submit(copy_context().run, _run, account, fetch) for account in accounts]
+    return [(account, *future.result()) for account, future in zip(accounts, futures)]
+
+
+def merge_invoices(results) -> dict:
+    """
+    Merge per-account carrier invoice lists into one stream.
+
+    Invoices are tagged with the account they came from, ordered newest
+    first (then by invoice number) and deduplicated by invoice number, so
+    an invoice visible through two accounts is listed once.
+
+    Returns:
+        {"content", "total", "errors"} where errors lists
+        {"account", "username", "error"} for every account that failed
+    """
+    seen = {}
+    errors = []
+    for account, result, error in results:
+        if error:
+            errors.append({"account": account.account_id, "username": account.username, "error": error})
+            continue
+        for item in result["content"]:
+            number = item.get("invoiceNumber")
+            if number and number in seen:
+                continue
+            item = {**item, "account": account.account_id}
+            seen[number or id(item)] = item
+    content = sorted(seen.values(), key=lambda item: (item.get("invoiceDate") or "", item.get("invoiceNumber") or ""),
+                     reverse=True)
+    total = sum(int(item["totalAmount"]) for item in content if item.get("totalAmount"))
+    return {"content": content, "total": total, "errors": errors}
@@ -0,0 +1,263 @@
+"""
+E-Invoice Jobs Module
+Background carrier invoice fetches with pollable progress.
+
+A job is created by POST /api/einvoice/jobs and run on a per-worker thread
+pool, so a browser login and a long page walk never hold a request open.
+Each job moves queued -> running -> done | failed; it is claimed atomically,
+so after a restart several workers may re-queue the same job but only one
+runs it. The worker holding a job refreshes its updated_at every few
+seconds; an active job without that heartbeat belongs to a dead worker and
+is queued again by whoever next submits or polls it. Progress (pages fetched, invoices so far) is written to the job as
+it happens and the owner's event streams get an `einvoice_job` event.
+
+Jobs are identified by their parameters: while one is queued or running, a
+unique partial index makes every identical submission return that job, and
+a finished complete result is reused for EINVOICE_JOB_REUSE_SECONDS.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from os import getenv
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from utils.db import LazyCollection
+
+logger = logging.getLogger(__name__)
+
+JOB_THREADS = int(getenv("EINVOICE_JOB_THREADS", "4"))
+# Finished complete results answer identical submissions this long
+REUSE_AFTER = timedelta(seconds=int(getenv("EINVOICE_JOB_REUSE_SECONDS", "600")))
+# Jobs (and their results) are removed by a TTL index after this long
+RETENTION = timedelta(seconds=int(getenv("EINVOICE_JOB_RETENTION_SECONDS", "86400")))
+# Active jobs without a heartbeat for this long belong to a worker that died
+STALE_AFTER = timedelta(seconds=int(getenv("EINVOICE_JOB_STALE_SECONDS", "90")))
+HEARTBEAT_INTERVAL = STALE_AFTER.total_seconds() / 3
+
+einvoice_jobs = LazyCollection("einvoice_jobs")
+
+_runner = None
+_on_update = None
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_held = set()  # ids of the jobs queued or running in this process
+
+
+def ensure_indexes():
+    einvoice_jobs.create_index(
+        [("owner_id", 1), ("key", 1)], unique=True, name="active_job",
+        partialFilterExpression={"active": True}
+    )
+    einvoice_jobs.create_index([("owner_id", 1), ("key", 1), ("finished_at", -1)])
+    einvoice_jobs.create_index([("updated_at", 1)], partialFilterExpression={"active": True})
+    einvoice_jobs.create_index([("expires_at", 1)], expireAfterSeconds=0)
+
+
+def register_runner(runner):
+    """
+    Set the function executing jobs: runner(job, report) -> result dict,
+    where report(pages=0, items=0) adds to the job's progress. An exception
+    fails the job with its message.
+    """
+    global _runner
+    _runner = runner
+
+
+def on_update(callback):
+    """Register a callback(job) run after every progress or status change"""
+    global _on_update
+    _on_update = callback
+
+
+def _notify(job):
+    if job is not None and _on_update is not None:
+        try:
+            _on_update(job)
+        except Exception as e:
+            logger.warning(f"E-invoice job update callback failed: {e}")
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(JOB_THREADS, thread_name_prefix="einvoice-job")
+                _executor_pid = os.getpid()
+                _held.clear()
+                threading.Thread(target=_heartbeat, name="einvoice-job-heartbeat", daemon=True).start()
+    return _executor
+
+
+def _heartbeat():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        with _executor_lock:
+            held = list(_held)
+        if not held:
+            continue
+        try:
+            einvoice_jobs.update_many({"_id": {"$in": held}, "active": True},
+                                      {"$set": {"updated_at": datetime.utcnow()}})
+        except Exception as e:
+            logger.warning(f"E-invoice job heartbeat failed: {e}")
+
+
+def _start(job_id):
+    executor = _get_executor()
+    with _executor_lock:
+        _held.add(job_id)
+    executor.submit(_execute, job_id)
+
+
+def _recover(job):
+    """
+    Queue an active job again here when its worker stopped sending
+    heartbeats; returns the job as it is now.
+    """
+    if not job.get("active") or job["updated_at"] >= datetime.utcnow() - STALE_AFTER:
+        return job
+    recovered = einvoice_jobs.find_one_and_update(
+        {"_id": job["_id"], "active": True, "updated_at": job["updated_at"]},
+        {"$set": {"status": "queued", "updated_at": datetime.utcnow(),
+                  "progress.pages": 0, "progress.items": 0}},
+        return_document=ReturnDocument.AFTER
+    )
+    if recovered is None:
+        # Someone else got there first (or it just finished)
+        return einvoice_jobs.find_one({"_id": job["_id"]})
+    logger.warning(f"E-invoice job {job['_id']} lost its worker, running it again")
+    _start(job["_id"])
+    return recovered
+
+
+def submit(owner_id: ObjectId, key: str, params: dict, progress: dict = None, reuse: bool = True):
+    """
+    Return the job for these parameters, creating and starting it if needed.
+
+    Args:
+        owner_id: Owning user
+        key: Canonical form of params; identical keys share a job
+        params: Job parameters passed to the runner
+        progress: Initial progress counters
+        reuse: Whether a recent finished result may be returned
+
+    Returns:
+        (job, created)
+    """
+    now = datetime.utcnow()
+    if reuse:
+        finished = einvoice_jobs.find_one(
+            {"owner_id": owner_id, "key": key, "status": "done", "partial": False,
+             "finished_at": {"$gte": now - REUSE_AFTER}},
+            sort=[("finished_at", -1)]
+        )
+        if finished is not None:
+            return finished, False
+    job = {
+        "owner_id": owner_id,
+        "key": key,
+        "params": params,
+        "status": "queued",
+        "active": True,
+        "progress": {"pages": 0, "items": 0, **(progress or {})},
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + RETENTION
+    }
+    try:
+        job["_id"] = einvoice_jobs.insert_one(job).inserted_id
+    except DuplicateKeyError:
+        active = einvoice_jobs.find_one({"owner_id": owner_id, "key": key, "active": True})
+        if active is not None:
+            return _recover(active), False
+        # Finished in the meantime: start a new one
+        return submit(owner_id, key, params, progress, reuse)
+    _start(job["_id"])
+    return job, True
+
+
+def _claim(job_id):
+    return einvoice_jobs.find_one_and_update(
+        {"_id": job_id, "status": "queued"},
+        {"$set": {"status": "running", "started_at": datetime.utcnow(), "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _execute(job_id):
+    try:
+        _run(job_id)
+    finally:
+        with _executor_lock:
+            _held.discard(job_id)
+
+
+def _run(job_id):
+    job = _claim(job_id)
+    if job is None:
+        return  # claimed by another worker
+    _notify(job)
+
+    def report(pages: int = 0, items: int = 0):
+        _notify(einvoice_jobs.find_one_and_update(
+            {"_id": job_id},
+            {"$inc": {"progress.pages": pages, "progress.items": items},
+             "$set": {"updated_at": datetime.utcnow()}},
+            projection={"result": 0},
+            return_document=ReturnDocument.AFTER
+        ))
+
+    try:
+        result = _runner(job, report)
+        update = {"status": "done", "result": result, "partial": bool(result.get("errors"))}
+    except Exception as e:
+        logger.warning(f"E-invoice job {job_id} failed: {e}")
+        update = {"status": "failed", "error": str(e)}
+    now = datetime.utcnow()
+    update.update(finished_at=now, updated_at=now, expires_at=now + RETENTION)
+    _notify(einvoice_jobs.find_one_and_update(
+        {"_id": job_id},
+        {"$set": update, "$unset": {"active": ""}},
+        projection={"result": 0},
+        return_document=ReturnDocument.AFTER
+    ))
+
+
+def resume_pending():
+    """Start jobs left behind by a previous process (called once per worker)"""
+    try:
+        stale = {"active": True, "updated_at": {"$lt": datetime.utcnow() - STALE_AFTER}}
+        for job in einvoice_jobs.find(stale).limit(JOB_THREADS * 4):
+            _recover(job)
+    except Exception as e:
+        logger.warning(f"Could not resume pending e-invoice jobs: {e}")
+
+
+def find_job(owner_id: ObjectId, job_id: ObjectId):
+    job = einvoice_jobs.find_one({"_id": job_id, "owner_id": owner_id})
+    return _recover(job) if job is not None else None
+
+
+def serialize_job(job, include_result: bool = True) -> dict:
+    """JSON-safe API shape of a job; the result only once it is done"""
+    data = {
+        "_id": str(job["_id"]),
+        "status": job["status"],
+        "params": job["params"],
+        "progress": job["progress"],
+        "error": job.get("error"),
+        "created_at": job["created_at"].isoformat(),
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None
+    }
+    if include_result and job["status"] == "done":
+        data["result"] = job.get("result")
+    return data
@@ -0,0 +1,224 @@
+"""
+In-process publish/subscribe bus for per-user push events.
+Feeds the Server-Sent Events endpoint; every subscriber gets a bounded queue
+so a slow consumer can never grow memory without limit.
+
+An open stream holds a server thread, so each process accepts only a
+limited number of them. publish() reaches the streams of this process only;
+broadcast() goes through an outbox collection relayed by a change stream
+(when one is running) so every worker delivers the event.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """A single consumer's bounded event queue"""
+
+    def __init__(self, user_id, maxsize: int):
+        self.user_id = user_id
+        self._events = deque()
+        self._maxsize = maxsize
+        self._cond = threading.Condition()
+        self.overflowed = False
+        self.closed = False
+
+    def put(self, event: dict):
+        with self._cond:
+            if len(self._events) >= self._maxsize:
+                # Consumer is too slow: drop the backlog and ask it to resync
+                self._events.clear()
+                self.overflowed = True
+            else:
+                self._events.append(event)
+            self._cond.notify()
+
+    def get(self, timeout: float):
+        """
+        Wait up to timeout seconds for the next event.
+
+        Returns:
+            Event dict, {"type": "resync"} after an overflow, or None on timeout
+        """
+        with self._cond:
+            if not self._events and not self.overflowed and not self.closed:
+                self._cond.wait(timeout)
+            if self.overflowed:
+                self.overflowed = False
+                return {"type": "resync", "data": {}}
+            if self._events:
+                return self._events.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class BusFull(Exception):
+    """This process already serves as many streams as it may"""
+
+
+class EventBus:
+    """Per-user fan-out of events to all of that user's open subscriptions"""
+
+    def __init__(self, queue_size: int = 100, max_subscriptions_per_user: int = 5,
+                 max_subscriptions: int = 2):
+        self.queue_size = queue_size
+        self.max_subscriptions_per_user = max_subscriptions_per_user
+        self.max_subscriptions = max_subscriptions
+        self._subscribers = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self.relay_active = False
+        self.outbox = None
+
+    def subscribe(self, user_id):
+        """
+        Register a new subscription for user_id.
+
+        Returns:
+            Subscription, or None when the user already has too many open
+
+        Raises:
+            BusFull: If this process is at max_subscriptions
+        """
+        with self._lock:
+            if self._count >= self.max_subscriptions:
+                raise BusFull()
+            subs = self._subscribers.setdefault(user_id, [])
+            if len(subs) >= self.max_subscriptions_per_user:
+                return None
+            self._count += 1
+            sub = Subscription(user_id, self.queue_size)
+            subs.append(sub)
+            return sub
+
+    def unsubscribe(self, sub: Subscription):
+        sub.close()
+        with self._lock:
+            subs = self._subscribers.get(sub.user_id, [])
+            if sub in subs:
+                subs.remove(sub)
+                self._count -= 1
+            if not subs:
+                self._subscribers.pop(sub.user_id, None)
+
+    def publish(self, user_id, event_type: str, data=None):
+        """Deliver an event to every open subscription of user_id"""
+        with self._lock:
+            subs = list(self._subscribers.get(user_id, ()))
+        event = {"type": event_type, "data": data or {}}
+        for sub in subs:
+            sub.put(event)
+
+    def broadcast(self, user_id, event_type: str, data=None):
+        """
+        Deliver an event to the user's streams in every worker process.
+        Without a running relay this is publish(), i.e. best effort: streams
+        held by other workers miss the event.
+        """
+        if self.outbox is not None:
+            try:
+                self.outbox.insert_one({"owner_id": str(user_id), "type": event_type,
+                                        "data": data or {}, "created_at": datetime.utcnow()})
+                return
+            except Exception as e:
+                logger.warning(f"Could not write event to outbox, delivering locally: {e}")
+        self.publish(user_id, event_type, data)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return self._count
+
+
+def format_sse(event: dict, event_id=None) -> str:
+    """Encode an event as a Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event['data'], default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream_events(bus: EventBus, sub: Subscription, heartbeat: float = 15.0):
+    """
+    Generator yielding SSE messages for a subscription until the client leaves.
+    Comment heartbeats keep proxies from closing idle connections.
+    """
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            event = sub.get(timeout=heartbeat)
+            if event is None:
+                if sub.closed:
+                    break
+                yield f": keepalive {int(time.time())}\n\n"
+                continue
+            yield format_sse(event, event["data"].get("seq"))
+    finally:
+        bus.unsubscribe(sub)
+
+
+def start_change_stream_relay(collection, bus: EventBus, owner_field: str = "owner_id",
+                              event_type: str = "receipt_changed"):
+    """
+    Relay a collection's MongoDB change stream into the local bus.
+    Requires a replica set (a single-node one is enough) and lets every
+    worker process see writes made by the others.
+    """
+    def run():
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        while True:
+            try:
+                with collection.watch(pipeline, full_document="updateLookup") as stream:
+                    for change in stream:
+                        doc = change.get("fullDocument") or {}
+                        owner = doc.get(owner_field)
+                        if owner is None:
+                            continue
+                        bus.publish(str(owner), event_type, {
+                            "id": str(doc["_id"]),
+                            "seq": doc.get("change_seq"),
+                            "deleted": bool(doc.get("deleted"))
+                        })
+            except Exception as e:
+                logger.warning(f"Change stream relay interrupted: {e}")
+                time.sleep(5)
+
+    bus.relay_active = True
+    thread = threading.Thread(target=run, name="change-stream-relay", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_outbox_relay(collection, bus: EventBus):
+    """
+    Relay events written by broadcast() in any worker into the local bus.
+    Needs a replica set like start_change_stream_relay.
+    """
+    def run():
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while True:
+            try:
+                with collection.watch(pipeline) as stream:
+                    for change in stream:
+                        doc = change["fullDocument"]
+                        bus.publish(doc["owner_id"], doc["type"], doc.get("data"))
+            except Exception as e:
+                logger.warning(f"Event outbox relay interrupted: {e}")
+                time.sleep(5)
+
+    bus.outbox = collection
+    thread = threading.Thread(target=run, name="event-outbox-relay", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,92 @@
+"""
+HTTP conditional request helpers.
+Strong ETags and If-None-Match handling so unchanged resources cost a 304.
+"""
+
+import hashlib
+import threading
+import time
+
+from flask import request, make_response
+
+
+def make_etag(*parts) -> str:
+    """
+    Build a strong ETag value from identifying parts.
+
+    Args:
+        parts: Values that change whenever the representation changes
+               (user id, data version, content digest, ...)
+
+    Returns:
+        Opaque ETag string (without quotes)
+    """
+    raw = "|".join(str(p) for p in parts).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def content_digest(body: bytes) -> str:
+    """Digest of a serialized response body, used for upstream-derived data"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def is_not_modified(etag: str) -> bool:
+    """Return True when the request's If-None-Match header matches etag"""
+    return request.if_none_match.contains(etag)
+
+
+def not_modified(etag: str):
+    """Build an empty 304 response carrying the ETag"""
+    response = make_response("", 304)
+    return with_etag(response, etag)
+
+
+def with_etag(response, etag: str):
+    """
+    Attach a strong ETag and revalidation policy to a response.
+    `no-cache` lets the browser keep the body but forces a conditional request.
+    """
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+class DigestCache:
+    """
+    Small in-process cache of response digests keyed by request identity.
+    Lets a matching If-None-Match be answered without calling upstream again
+    while the cached digest is still fresh.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached digest for key, or None if missing/expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            digest, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return digest
+
+    def set(self, key, digest: str):
+        """Store digest for key"""
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                # Drop the entry closest to expiry
+                oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                del self._entries[oldest]
+            self._entries[key] = (digest, time.monotonic() + self.ttl)
+
+    def invalidate_prefix(self, prefix):
+        """Drop every entry whose key tuple starts with prefix"""
+        with self._lock:
+            for key in [k for k in self._entries if k[:len(prefix)] == prefix]:
+                del self._entries[key]
@@ -0,0 +1,83 @@
+"""
+Identity Cache Module
+Small thread-safe TTL + LRU cache for authenticated user objects,
+so Flask-Login's user loader does not hit MongoDB on every request.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdentityCache:
+    """
+    Per-worker cache of user objects keyed by user id.
+
+    Entries expire after `ttl` seconds and the least recently used entry
+    is evicted once `maxsize` is reached.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, enabled: bool = True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, calling loader(key) on a miss.
+        None results are never cached so deleted accounts disappear at once.
+        """
+        if not self.enabled:
+            return loader(key)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = loader(key)
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        """Insert or refresh an entry"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop a single entry (call on any change to the account)"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits / total) if total else 0.0
+            }
@@ -0,0 +1,105 @@
+"""
+Invoice Mirror Module
+Local copy of a user's e-invoices, one document per invoice number.
+
+Invoices arrive from carrier fetches (/einvoice/carrier/invoices) and from
+scanned paper-invoice QR codes. The unique (owner_id, invoice_number) index
+makes every invoice known exactly once, so a QR import never turns an
+invoice into a second receipt, whether it was scanned before or already
+came in through the carrier.
+"""
+
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from utils.db import LazyCollection
+
+einvoice_invoices = LazyCollection("einvoice_invoices")
+
+
+def ensure_indexes():
+    einvoice_invoices.create_index([("owner_id", 1), ("invoice_number", 1)], unique=True)
+    einvoice_invoices.create_index([("owner_id", 1), ("invoice_date", -1)])
+
+
+def _parse_carrier_date(value):
+    try:
+        return datetime.fromisoformat(value[:19]) if value else None
+    except ValueError:
+        return None
+
+
+def mirror_carrier_invoices(owner_id, items) -> int:
+    """
+    Upsert invoices returned by a carrier fetch.
+
+    Returns:
+        Number of invoices not seen before
+    """
+    if not items:
+        return 0
+    now = datetime.utcnow()
+    ops = []
+    for item in items:
+        number = item.get("invoiceNumber")
+        if not number:
+            continue
+        ops.append(UpdateOne(
+            {"owner_id": owner_id, "invoice_number": number},
+            {
+                "$set": {
+                    "invoice_date": _parse_carrier_date(item.get("invoiceDate")),
+                    "seller_name": item.get("sellerName"),
+                    "seller_ban": item.get("sellerBan"),
+                    "total_amount": int(item["totalAmount"]) if item.get("totalAmount") else None,
+                    "carrier": True,
+                    "updated_at": now
+                },
+                "$setOnInsert": {"source": "carrier", "created_at": now}
+            },
+            upsert=True
+        ))
+    if not ops:
+        return 0
+    return einvoice_invoices.bulk_write(ops, ordered=False).upserted_count
+
+
+def record_scanned_invoice(owner_id, invoice: dict) -> bool:
+    """
+    Store an invoice parsed from a paper QR code.
+
+    Returns:
+        False if the invoice number is already known for this owner
+    """
+    now = datetime.utcnow()
+    try:
+        einvoice_invoices.insert_one({
+            "owner_id": owner_id,
+            **invoice,
+            "source": "qr",
+            "created_at": now,
+            "updated_at": now
+        })
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def forget_scanned_invoice(owner_id, invoice_number: str):
+    """Undo record_scanned_invoice when its receipt could not be created"""
+    einvoice_invoices.delete_one({
+        "owner_id": owner_id,
+        "invoice_number": invoice_number,
+        "source": "qr",
+        "receipt_id": {"$exists": False}
+    })
+
+
+def link_receipt(owner_id, invoice_number: str, receipt_id):
+    """Remember which receipt was created for an invoice"""
+    einvoice_invoices.update_one(
+        {"owner_id": owner_id, "invoice_number": invoice_number},
+        {"$set": {"receipt_id": receipt_id}}
+    )
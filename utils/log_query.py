@@ -0,0 +1,305 @@
+"""
+Security Log Query Module
+Indexed scans over the JSON-lines security log and its rotated archives.
+
+Each log file gets a sidecar index in <log dir>/.index/ describing blocks of
+about LOG_INDEX_BLOCK bytes: byte range, first/last timestamp and the event
+types, statuses, users and IPs seen in the block. Queries consult the index
+to skip whole blocks (and archives), memory-map the active file and only
+parse lines inside candidate blocks. The index for the active log is
+extended incrementally as the file grows and rebuilt after rotation.
+"""
+
+import gzip
+import json
+import mmap
+import os
+import re
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from os import getenv
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+INDEX_VERSION = 1
+BLOCK_SIZE = int(getenv("LOG_INDEX_BLOCK", str(1024 * 1024)))
+# Per-block user/IP sets larger than this are not stored (block always scanned)
+MAX_BLOCK_KEYS = 512
+FILTER_FIELDS = ("event", "status", "user", "ip")
+_INDEX_KEYS = {"event": "events", "status": "statuses", "user": "users", "ip": "ips"}
+
+
+def parse_time(value):
+    """
+    Parse an absolute ISO timestamp or a relative age ("90s", "15m", "1h", "7d").
+
+    Returns:
+        Naive UTC datetime, or None for empty input
+
+    Raises:
+        ValueError: If the value is in neither format
+    """
+    if not value:
+        return None
+    match = re.fullmatch(r"(\d+)([smhd])", value.strip())
+    if match:
+        unit = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}[match.group(2)]
+        return datetime.utcnow() - timedelta(**{unit: int(match.group(1))})
+    return datetime.fromisoformat(value.strip())
+
+
+def log_files(path):
+    """Rotated archives (oldest first) followed by the active log"""
+    directory = os.path.dirname(os.path.abspath(path))
+    base = os.path.basename(path)
+    names = set(os.listdir(directory)) if os.path.isdir(directory) else set()
+    archives = sorted(
+        os.path.join(directory, name) for name in names
+        if name.startswith(base + ".") and not name.endswith(".lock")
+        # Still being compressed: the plain rotated file next to it has every line
+        and not (name.endswith(".gz") and name[:-len(".gz")] in names)
+    )
+    return archives + ([path] if os.path.exists(path) else [])
+
+
+def _index_path(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    return os.path.join(directory, ".index", os.path.basename(path) + ".idx")
+
+
+def _read_buffer(path):
+    """Memory-map plain files; archives are decompressed (they are size-capped)"""
+    if path.endswith(".gz"):
+        data = bytearray()
+        with gzip.open(path, "rb") as f:
+            try:
+                while True:
+                    chunk = f.read(BLOCK_SIZE)
+                    if not chunk:
+                        break
+                    data += chunk
+            except (EOFError, OSError, zlib.error):
+                pass  # truncated archive: keep the lines that could be decompressed
+        return bytes(data)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _scan_block(buf, start, end):
+    """Index metadata for the complete lines in buf[start:end]"""
+    block = {"start": start, "end": end, "lines": 0, "min_ts": None, "max_ts": None}
+    keys = {name: set() for name in _INDEX_KEYS.values()}
+    for line in buf[start:end].splitlines():
+        try:
+            record = loads(line)
+        except ValueError:
+            continue
+        block["lines"] += 1
+        ts = record.get("timestamp")
+        if ts:
+            if block["min_ts"] is None or ts < block["min_ts"]:
+                block["min_ts"] = ts
+            if block["max_ts"] is None or ts > block["max_ts"]:
+                block["max_ts"] = ts
+        for field, key in _INDEX_KEYS.items():
+            if keys[key] is not None and record.get(field) is not None:
+                keys[key].add(str(record[field]))
+                if len(keys[key]) > MAX_BLOCK_KEYS:
+                    keys[key] = None
+    for key, values in keys.items():
+        block[key] = sorted(values) if values is not None else None
+    return block
+
+
+def _index_blocks(buf, start, size, block_size):
+    """Split buf[start:size] into line-aligned blocks; the trailing partial line is left out"""
+    blocks = []
+    pos = start
+    while pos < size:
+        target = pos + block_size
+        nl = buf.find(b"\n", target - 1) if target < size else -1
+        end = nl + 1 if nl != -1 else buf.rfind(b"\n", pos, size) + 1
+        if end <= pos:
+            break
+        blocks.append(_scan_block(buf, pos, end))
+        pos = end
+    return blocks
+
+
+def load_index(path, buf, block_size=BLOCK_SIZE, save=True):
+    """
+    Return the block index for a log file, building or extending it as needed.
+
+    Args:
+        path: Log file (plain or .gz archive)
+        buf: File contents (mmap or bytes) as returned by _read_buffer
+        block_size: Target block size for new blocks
+        save: Persist the index sidecar
+
+    Returns:
+        List of block dicts covering every complete line of the file
+    """
+    st = os.stat(path)
+    index_path = _index_path(path)
+    index = None
+    try:
+        with open(index_path, "rb") as f:
+            index = loads(f.read())
+    except (OSError, ValueError):
+        pass
+
+    size = len(buf)
+    if (not index or index.get("version") != INDEX_VERSION or index.get("inode") != st.st_ino
+            or index.get("indexed", 0) > size):
+        index = {"version": INDEX_VERSION, "inode": st.st_ino, "indexed": 0, "blocks": []}
+    if index["indexed"] == size:
+        return index["blocks"]
+
+    blocks = index["blocks"]
+    # Re-scan an undersized last block so frequent queries do not leave many tiny blocks
+    if blocks and blocks[-1]["end"] - blocks[-1]["start"] < block_size:
+        blocks.pop()
+    start = blocks[-1]["end"] if blocks else 0
+    blocks.extend(_index_blocks(buf, start, size, block_size))
+    index["indexed"] = blocks[-1]["end"] if blocks else 0
+    index["blocks"] = blocks
+
+    if save:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tmp = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, index_path)
+    return blocks
+
+
+def prune_indexes(path):
+    """Remove sidecar indexes whose log file no longer exists"""
+    directory = os.path.join(os.path.dirname(os.path.abspath(path)), ".index")
+    if not os.path.isdir(directory):
+        return
+    base = os.path.basename(path)
+    for name in os.listdir(directory):
+        if name.startswith(base) and name.endswith(".idx"):
+            source = os.path.join(os.path.dirname(directory), name[:-len(".idx")])
+            if not os.path.exists(source):
+                os.remove(os.path.join(directory, name))
+
+
+def _block_matches(block, since, until, filters):
+    if block["lines"] == 0:
+        return False
+    if since and block["max_ts"] and block["max_ts"] < since:
+        return False
+    if until and block["min_ts"] and block["min_ts"] > until:
+        return False
+    for field, wanted in filters.items():
+        values = block.get(_INDEX_KEYS[field])
+        if values is not None and not wanted.intersection(values):
+            return False
+    return True
+
+
+def _block_lines(buf, start, end, needles=None):
+    """
+    Lines of buf[start:end]; with needles, only lines containing one of them,
+    located with substring search over the buffer.
+    """
+    if not needles:
+        yield from buf[start:end].splitlines()
+        return
+    starts = set()
+    for needle in needles:
+        pos = buf.find(needle, start, end)
+        while pos != -1:
+            line_start = buf.rfind(b"\n", start, pos) + 1 or start
+            starts.add(line_start)
+            line_end = buf.find(b"\n", pos, end)
+            if line_end == -1:
+                break
+            pos = buf.find(needle, line_end, end)
+    for line_start in sorted(starts):
+        line_end = buf.find(b"\n", line_start, end)
+        yield buf[line_start:line_end if line_end != -1 else end]
+
+
+def query(path, since=None, until=None, limit=None, newest_first=False, **filters):
+    """
+    Stream matching security events, oldest first unless newest_first.
+
+    Args:
+        path: Active security log path (archives are found next to it)
+        since: Only events at or after this datetime
+        until: Only events at or before this datetime
+        limit: Stop after this many matches
+        newest_first: Yield the most recent events first, so limit keeps
+                      the newest matches
+        filters: event/status/user/ip values; each may be a string or a list
+
+    Yields:
+        Event dicts as written by utils.security_logger
+    """
+    since_s = since.isoformat() if since else None
+    until_s = until.isoformat() if until else None
+    wanted = {}
+    for field in FILTER_FIELDS:
+        value = filters.get(field)
+        if value:
+            wanted[field] = {value} if isinstance(value, str) else set(value)
+    # Search the raw bytes for the most selective filter instead of parsing every line
+    needles = None
+    for field in ("user", "ip", "event", "status"):
+        if field in wanted:
+            needles = [json.dumps(v, ensure_ascii=False).encode() for v in wanted[field]]
+            break
+
+    def matches(buf, block):
+        for line in _block_lines(buf, block["start"], block["end"], needles):
+            try:
+                record = loads(line)
+            except ValueError:
+                continue
+            ts = record.get("timestamp") or ""
+            if (since_s and ts < since_s) or (until_s and ts > until_s):
+                continue
+            if any(str(record.get(f)) not in values for f, values in wanted.items()):
+                continue
+            yield record
+
+    prune_indexes(path)
+    order = reversed if newest_first else iter
+    count = 0
+    for file_path in order(log_files(path)):
+        buf = _read_buffer(file_path)
+        try:
+            if not buf:
+                continue
+            for block in order(load_index(file_path, buf)):
+                if not _block_matches(block, since_s, until_s, wanted):
+                    continue
+                records = matches(buf, block)
+                for record in (reversed(list(records)) if newest_first else records):
+                    yield record
+                    count += 1
+                    if limit and count >= limit:
+                        return
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+
+def aggregate(path, group_by, **criteria):
+    """
+    Count matching events per value of a field (e.g. failed logins per IP).
+
+    Returns:
+        collections.Counter keyed by the field value
+    """
+    return Counter(str(record.get(group_by)) for record in query(path, **criteria))
@@ -0,0 +1,250 @@
+"""
+Background Log Writer Module
+Non-blocking, batched writes of JSON lines to rotating, compressed files.
+
+Producers only enqueue; a per-process writer thread drains the queue in
+batches, renders each item and appends the whole batch with one write.
+Files rotate on size and on a fixed time interval, rotated files are
+gzip-compressed and only the newest `backups` archives are kept. Several
+worker processes may share one file: writes are O_APPEND and rotation is
+serialized with a lock file.
+"""
+
+import atexit
+import fcntl
+import glob
+import gzip
+import logging
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+try:
+    import orjson
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj, default=str).decode()
+except ImportError:
+    import json
+
+    def dumps(obj) -> str:
+        return json.dumps(obj, default=str, ensure_ascii=False)
+
+_STOP = object()
+
+
+class RotatingFile:
+    """
+    Append-only log file with size- and time-based rotation.
+
+    Args:
+        path: Active log file path
+        max_bytes: Rotate once the file reaches this size (0 = never)
+        interval: Rotate when the last write was in an earlier interval of
+            this many seconds, counted from the epoch in UTC (0 = never)
+        backups: Number of rotated archives to keep
+        compress: gzip rotated files
+    """
+
+    def __init__(self, path: str, max_bytes: int = 0, interval: int = 0,
+                 backups: int = 7, compress: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backups = backups
+        self.compress = compress
+        self._fd = None
+        self._inode = None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        self._inode = os.fstat(self._fd).st_ino
+
+    def _due(self, st, now) -> bool:
+        if st.st_size == 0:
+            return False
+        if self.max_bytes and st.st_size >= self.max_bytes:
+            return True
+        return bool(self.interval) and int(st.st_mtime // self.interval) < int(now // self.interval)
+
+    def _current_stat(self):
+        """Stat of the file on disk, reopening if another process rotated it"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if self._fd is None or st is None or st.st_ino != self._inode:
+            self.close()
+            self._open()
+            st = os.fstat(self._fd)
+        return st
+
+    def write(self, data: bytes):
+        st = self._current_stat()
+        if self._due(st, time.time()):
+            self.rotate()
+        os.write(self._fd, data)
+
+    def rotate(self):
+        """Move the active file aside (once across processes) and start a new one"""
+        rotated = None
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                st = os.stat(self.path)
+                if st.st_ino == self._inode and self._due(st, time.time()):
+                    stamp = datetime.utcfromtimestamp(st.st_mtime).strftime("%Y%m%d-%H%M%S-%f")
+                    rotated = f"{self.path}.{stamp}"
+                    n = 1
+                    while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+                        rotated = f"{self.path}.{stamp}-{n}"
+                        n += 1
+                    os.rename(self.path, rotated)
+            except FileNotFoundError:
+                pass
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.close()
+        self._open()
+        if rotated:
+            if self.compress:
+                with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(rotated)
+            self._prune()
+
+    def archives(self):
+        """Rotated files, oldest first"""
+        return sorted(p for p in glob.glob(glob.escape(self.path) + ".*") if not p.endswith(".lock"))
+
+    def _prune(self):
+        for old in self.archives()[:-self.backups or None]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class BatchWriter:
+    """
+    Queue plus background thread that renders items to lines and appends
+    them to a RotatingFile in batches.
+
+    Args:
+        file: Destination RotatingFile
+        render: Callable turning a queued item into one line (no newline)
+        batch_size: Maximum items per write
+        flush_interval: Seconds to wait for a batch to fill
+        queue_size: Items buffered before new ones are dropped
+    """
+
+    def __init__(self, file: RotatingFile, render=dumps, batch_size: int = 256,
+                 flush_interval: float = 0.5, queue_size: int = 10000):
+        self.file = file
+        self.render = render
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _ensure_thread(self):
+        # The thread and queue do not survive fork(); start fresh ones per process
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._queue = queue.Queue(self.queue_size)
+                    self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self._pid = pid
+                    self._thread.start()
+
+    def submit(self, item) -> bool:
+        """Enqueue without blocking; returns False if the item was dropped"""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while first is not _STOP and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is _STOP
+            lines = []
+            for item in batch:
+                if item is _STOP:
+                    continue
+                try:
+                    lines.append(self.render(item))
+                except Exception as e:
+                    print(f"[log-writer] could not render item: {e}", file=sys.stderr)
+            if lines:
+                try:
+                    self.file.write(("\n".join(lines) + "\n").encode("utf-8"))
+                except OSError as e:
+                    print(f"[log-writer] write to {self.file.path} failed: {e}", file=sys.stderr)
+            if stop:
+                self.file.close()
+                return
+
+    def close(self, timeout: float = 5.0):
+        """Flush everything queued by this process and stop its thread"""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._pid = None
+
+
+class AsyncBatchHandler(logging.Handler):
+    """
+    logging.Handler that formats and writes records on a BatchWriter thread,
+    so emit() on the calling thread only enqueues the record.
+    """
+
+    def __init__(self, file: RotatingFile, **writer_options):
+        super().__init__()
+        self.writer = BatchWriter(file, render=self.format, **writer_options)
+
+    def emit(self, record):
+        self.writer.submit(record)
+
+    def flush(self):
+        # Records are written in the background; close() drains the queue
+        pass
+
+    def close(self):
+        self.writer.close()
+        super().close()
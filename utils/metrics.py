@@ -0,0 +1,388 @@
+"""
+Metrics Module
+In-process counters, gauges and histograms exposed in Prometheus text format.
+
+Recording only touches a dict under a per-metric lock. With METRICS_DIR set
+(gunicorn.conf.py sets it) every worker process periodically writes its
+values to <METRICS_DIR>/<pid>-<start>.json and a scrape served by any worker
+merges all files: counters and histograms are summed over every process that
+ever ran (so they never go backwards), gauges only over live processes. The
+snapshots of exited workers are folded into one aggregate file and deleted,
+so with recycled workers a scrape still reads one file per live process.
+"""
+
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from os import getenv
+
+from flask import g, request
+from pymongo import monitoring
+
+METRICS_DIR = getenv("METRICS_DIR")
+FLUSH_INTERVAL = float(getenv("METRICS_FLUSH_INTERVAL", "5"))
+# Counters and histograms of every exited process, summed
+AGGREGATE_FILE = "exited.json"
+
+# Seconds; covers fast Mongo commands up to slow e-invoice logins
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(k), v if not isinstance(v, list) else list(v)] for k, v in self._values.items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Fixed-bucket histogram; values are stored as per-bucket counts, then sum and count"""
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[slot] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._started = time.time()
+        self._flusher_pid = None
+
+    def _register(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collect):
+        """Callable run before every snapshot, e.g. to refresh gauges from a cache"""
+        self.collectors.append(collect)
+
+    def reset(self):
+        """Forget values inherited from the parent process after fork()"""
+        for metric in self.metrics.values():
+            metric.reset()
+        self._started = time.time()
+        self._flusher_pid = None
+
+    def snapshot(self) -> dict:
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception:
+                pass
+        return {
+            name: {
+                "type": m.type,
+                "help": m.help,
+                "labels": list(m.labelnames),
+                "buckets": list(getattr(m, "buckets", ())),
+                "samples": m.snapshot(),
+            }
+            for name, m in self.metrics.items()
+        }
+
+    # ----- multi-process -----
+    def _snapshot_path(self):
+        return os.path.join(METRICS_DIR, f"{os.getpid()}-{int(self._started * 1000)}.json")
+
+    def write_snapshot(self):
+        if not METRICS_DIR:
+            return
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = self._snapshot_path()
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"pid": os.getpid(), "metrics": self.snapshot()}, f)
+        os.replace(tmp, path)
+
+    def start_flusher(self):
+        """Write this process's snapshot every FLUSH_INTERVAL seconds (once per process)"""
+        if not METRICS_DIR or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def loop(pid=os.getpid()):
+            while self._flusher_pid == pid:
+                time.sleep(FLUSH_INTERVAL)
+                try:
+                    self.write_snapshot()
+                except OSError:
+                    pass
+
+        threading.Thread(target=loop, name="metrics-flusher", daemon=True).start()
+
+    def collect(self) -> dict:
+        """Merged metrics of every process (just this one without METRICS_DIR)"""
+        if not METRICS_DIR:
+            return self.snapshot()
+        self.write_snapshot()
+        try:
+            _fold_exited()
+        except OSError:
+            pass
+        merged = {}
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            _merge(merged, data["metrics"], gauges=_pid_alive(data.get("pid")))
+        return _listed(merged)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            names = metric["labels"]
+            for labels, value in sorted(metric["samples"]):
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{_format_labels(names, labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(metric["buckets"]) + [float("inf")], value[:-2]):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{name}_bucket{_format_labels(names, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(names, labels)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(names, labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+        return True
+    except (OSError, TypeError):
+        return False
+
+
+def _merge(merged, metrics, gauges=True):
+    """Add snapshot metrics into merged, whose samples are dicts keyed by label tuple"""
+    for name, metric in metrics.items():
+        if metric["type"] == "gauge" and not gauges:
+            continue
+        target = merged.setdefault(name, dict(metric, samples={}))
+        for labels, value in metric["samples"]:
+            key = tuple(labels)
+            if key not in target["samples"]:
+                target["samples"][key] = value
+            elif isinstance(value, list):
+                target["samples"][key] = [a + b for a, b in zip(target["samples"][key], value)]
+            else:
+                target["samples"][key] += value
+
+
+def _listed(merged) -> dict:
+    for metric in merged.values():
+        metric["samples"] = [[list(k), v] for k, v in metric["samples"].items()]
+    return merged
+
+
+def _snapshot_pid(path):
+    try:
+        return int(os.path.basename(path).split("-", 1)[0])
+    except ValueError:
+        return None
+
+
+def _fold_exited():
+    """Add the snapshots of exited processes to the aggregate file and delete them"""
+    aggregate_path = os.path.join(METRICS_DIR, AGGREGATE_FILE)
+    exited = [path for path in glob.glob(os.path.join(METRICS_DIR, "*.json"))
+              if path != aggregate_path and not _pid_alive(_snapshot_pid(path))]
+    if not exited:
+        return
+    with open(os.path.join(METRICS_DIR, "fold.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(aggregate_path) as f:
+                    aggregate = json.load(f)
+            except (OSError, ValueError):
+                aggregate = {"folded": [], "metrics": {}}
+            # Files of an earlier fold that died before deleting them are counted already
+            for name in aggregate["folded"]:
+                _remove(os.path.join(METRICS_DIR, name))
+            merged = {}
+            _merge(merged, aggregate["metrics"])
+            folded = []
+            for path in exited:
+                name = os.path.basename(path)
+                if name in aggregate["folded"]:
+                    continue
+                try:
+                    with open(path) as f:
+                        data = json.load(f)
+                except FileNotFoundError:
+                    continue  # folded by another worker
+                except ValueError:
+                    _remove(path)
+                    continue
+                _merge(merged, data["metrics"], gauges=False)
+                folded.append(name)
+            tmp = aggregate_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"pid": None, "folded": folded, "metrics": _listed(merged)}, f)
+            os.replace(tmp, aggregate_path)
+            for name in folded:
+                _remove(os.path.join(METRICS_DIR, name))
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def clear_snapshots():
+    """Remove snapshot files of a previous server run (called by the gunicorn master)"""
+    if METRICS_DIR:
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            os.remove(path)
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry.reset)
+atexit.register(lambda: METRICS_DIR and registry.write_snapshot())
+
+# ----- HTTP -----
+http_requests = registry.counter(
+    "hmeicr_http_requests_total", "HTTP requests handled", ("method", "endpoint", "status"))
+http_latency = registry.histogram(
+    "hmeicr_http_request_duration_seconds", "HTTP request latency", ("method", "endpoint"))
+
+# ----- MongoDB -----
+mongo_commands = registry.counter(
+    "hmeicr_mongo_commands_total", "MongoDB commands", ("command", "outcome"))
+mongo_latency = registry.histogram(
+    "hmeicr_mongo_command_duration_seconds", "MongoDB command latency", ("command",))
+
+
+def init_app(app):
+    """Record count and latency of every request, labelled by route pattern"""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            # Route patterns, not raw paths, keep label cardinality bounded
+            endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+            http_latency.observe(time.perf_counter() - start, method=request.method, endpoint=endpoint)
+            http_requests.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+        return response
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """pymongo command monitoring feeding the Mongo metrics"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, command=event.command_name)
+        mongo_commands.inc(command=event.command_name, outcome="success")
+
+    def failed(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, command=event.command_name)
+        mongo_commands.inc(command=event.command_name, outcome="failure")
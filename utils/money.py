@@ -0,0 +1,63 @@
+"""
+Money Module
+Exact receipt amounts stored as integer minor units.
+
+Receipts at RECEIPT_SCHEMA_VERSION keep `amount_minor` (an int in the
+currency's smallest unit, e.g. cents) instead of a float `amount`, so sums
+in MongoDB aggregations are exact and need no per-document conversion.
+The API still exposes `amount` as a plain number.
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+RECEIPT_SCHEMA_VERSION = 2
+
+# ISO 4217 minor-unit exponents of the supported currencies (default 2)
+CURRENCY_EXPONENTS = {"JPY": 0}
+DEFAULT_EXPONENT = 2
+
+
+def currency_exponent(currency) -> int:
+    return CURRENCY_EXPONENTS.get((currency or "").upper(), DEFAULT_EXPONENT)
+
+
+def to_minor(amount, currency) -> int:
+    """
+    Convert a decimal amount to integer minor units, rounding half up.
+
+    Args:
+        amount: Amount as a string, int, float or Decimal
+        currency: Currency code deciding the number of decimal places
+
+    Returns:
+        Amount in minor units
+
+    Raises:
+        ValueError: If the amount is not a finite number
+    """
+    try:
+        # str() keeps floats at their shortest repr (12.3, not 12.2999...)
+        value = Decimal(str(amount).strip())
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"Invalid amount: {amount!r}")
+    return int(value.scaleb(currency_exponent(currency)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor: int, currency):
+    """Minor units back to a JSON number (int when the amount is whole)"""
+    value = Decimal(minor).scaleb(-currency_exponent(currency))
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def decimal_places(amount) -> int:
+    """Significant decimal places of an amount ("12.50" -> 1, "100.00" -> 0)"""
+    try:
+        value = Decimal(str(amount).strip())
+        if not value.is_finite():
+            return 0
+        exponent = value.normalize().as_tuple().exponent
+    except InvalidOperation:
+        return 0
+    return -exponent if isinstance(exponent, int) and exponent < 0 else 0
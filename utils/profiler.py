@@ -0,0 +1,291 @@
+"""
+On-Demand Profiler Module
+Sampling CPU profiler and tracemalloc snapshots for a live worker process.
+
+Nothing runs until a session is started, from the admin API or by sending
+the worker PROFILE_SIGNAL (SIGUSR2 by default; gunicorn workers already use
+SIGUSR1 to reopen logs). A session samples every thread's stack with
+sys._current_frames() for N seconds, or only the threads serving the next
+N requests to one endpoint, and writes folded stacks ready for
+flamegraph.pl or speedscope to PROFILE_DIR. With memory enabled it also
+writes the top allocation growth between the start and end of the session.
+
+    kill -USR2 <worker pid>         # profile that worker for PROFILE_SIGNAL_SECONDS
+"""
+
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+from os import getenv
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = getenv("PROFILE_DIR", "logs/profiles")
+PROFILE_SIGNAL = getenv("PROFILE_SIGNAL", "SIGUSR2")
+MAX_SECONDS = float(getenv("PROFILE_MAX_SECONDS", "300"))
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ProfilerBusy(RuntimeError):
+    """A profiling session is already running in this process"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    if path.startswith(_ROOT):
+        path = os.path.relpath(path, _ROOT)
+    else:
+        # Keep site-packages/stdlib paths short: package/module.py
+        path = os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _fold(frame) -> str:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class ProfileSession:
+    """
+    One profiling run.
+
+    Args:
+        seconds: Stop after this long (seconds mode)
+        requests: Stop after this many matching requests finished (requests mode)
+        endpoint: Route pattern or endpoint name to profile in requests mode (None = any)
+        interval: Seconds between stack samples
+        memory: Also record tracemalloc allocation growth
+    """
+
+    def __init__(self, seconds=None, requests=None, endpoint=None, interval=0.005, memory=False):
+        if not seconds and not requests:
+            seconds = 30
+        self.seconds = min(float(seconds), MAX_SECONDS) if seconds else None
+        self.requests = int(requests) if requests else None
+        self.endpoint = endpoint
+        self.interval = max(float(interval), 0.001)
+        self.memory = memory
+        self.samples = Counter()
+        self.sample_count = 0
+        self.requests_done = 0
+        self.started = None
+        self.result = None
+        self._threads = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._baseline = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        self.started = time.time()
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self._started_tracemalloc = True
+            self._baseline = tracemalloc.take_snapshot()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ----- request tracking (requests mode) -----
+    def wants(self, rule, endpoint) -> bool:
+        if self.requests is None or self.requests_done >= self.requests:
+            return False
+        return self.endpoint is None or self.endpoint in (rule, endpoint)
+
+    def request_started(self):
+        with self._lock:
+            self._threads.add(threading.get_ident())
+
+    def request_finished(self):
+        with self._lock:
+            self._threads.discard(threading.get_ident())
+            self.requests_done += 1
+            if self.requests_done >= self.requests:
+                self._stop.set()
+
+    # ----- sampling -----
+    def _sample(self):
+        own = threading.get_ident()
+        if self.requests is not None:
+            with self._lock:
+                threads = set(self._threads)
+            if not threads:
+                return
+        else:
+            threads = None
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (threads is not None and ident not in threads):
+                continue
+            self.samples[_fold(frame)] += 1
+            self.sample_count += 1
+
+    def _run(self):
+        deadline = self.started + (self.seconds or MAX_SECONDS)
+        try:
+            while not self._stop.wait(self.interval) and time.time() < deadline:
+                self._sample()
+        finally:
+            self._finish()
+
+    def _finish(self):
+        files = []
+        try:
+            files = self._write()
+            error = None
+        except OSError as e:
+            error = str(e)
+        self.result = {
+            **self.describe(),
+            "duration": round(time.time() - self.started, 3),
+            "files": [os.path.basename(p) for p in files],
+        }
+        if error:
+            self.result["error"] = error
+        _finished(self)
+        logger.info(f"Profile written: {self.result}")
+
+    def _write(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = datetime.utcfromtimestamp(self.started).strftime("%Y%m%d-%H%M%S-%f")
+        base = os.path.join(PROFILE_DIR, f"{stamp}-{os.getpid()}")
+        files = []
+
+        folded = base + ".folded"
+        with open(folded, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        files.append(folded)
+
+        if self.memory and self._baseline is not None:
+            snapshot = tracemalloc.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            allocations = base + ".tracemalloc.txt"
+            with open(allocations, "w") as f:
+                f.write(f"# pid {os.getpid()}, top allocation growth over the session\n")
+                for stat in snapshot.compare_to(self._baseline, "lineno")[:50]:
+                    f.write(f"{stat}\n")
+                f.write("\n# top allocations at end of session\n")
+                for stat in snapshot.statistics("traceback")[:10]:
+                    f.write(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                    for line in stat.traceback.format(limit=8):
+                        f.write(f"    {line}\n")
+            files.append(allocations)
+        return files
+
+    def describe(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "started": datetime.utcfromtimestamp(self.started).isoformat() if self.started else None,
+            "seconds": self.seconds,
+            "requests": self.requests,
+            "requests_done": self.requests_done,
+            "endpoint": self.endpoint,
+            "interval": self.interval,
+            "memory": self.memory,
+            "samples": self.sample_count,
+        }
+
+
+_session = None
+_session_lock = threading.Lock()
+_recent = deque(maxlen=10)
+
+
+def _finished(session):
+    global _session
+    with _session_lock:
+        if _session is session:
+            _session = None
+        _recent.appendleft(session.result)
+
+
+def start_profile(**options) -> ProfileSession:
+    """
+    Start a profiling session in this process.
+
+    Raises:
+        ProfilerBusy: If a session is already running
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            raise ProfilerBusy("A profiling session is already running")
+        session = ProfileSession(**options)
+        _session = session
+    session.start()
+    return session
+
+
+def status() -> dict:
+    """Active session (if any) and the most recent results of this process"""
+    session = _session
+    return {
+        "pid": os.getpid(),
+        "active": session.describe() if session else None,
+        "recent": list(_recent),
+    }
+
+
+def init_app(app):
+    """Track requests for requests-mode sessions; a single global check when idle"""
+
+    @app.before_request
+    def _profile_request_start():
+        session = _session
+        if session is None:
+            return
+        rule = request.url_rule.rule if request.url_rule else None
+        if session.wants(rule, request.endpoint):
+            session.request_started()
+            g.profile_session = session
+
+    @app.teardown_request
+    def _profile_request_end(error=None):
+        session = g.pop("profile_session", None)
+        if session is not None:
+            session.request_finished()
+
+
+def install_signal_handler():
+    """
+    Start a PROFILE_SIGNAL_SECONDS session when PROFILE_SIGNAL arrives.
+    Must be called from the main thread (e.g. gunicorn post_worker_init).
+    """
+    signum = getattr(signal, PROFILE_SIGNAL, None)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def handler(signum, frame):
+        options = {
+            "seconds": float(getenv("PROFILE_SIGNAL_SECONDS", "30")),
+            "memory": getenv("PROFILE_SIGNAL_MEMORY", "false").lower() == "true",
+        }
+        # Leave the signal handler quickly; start the session from a thread
+        def start():
+            try:
+                start_profile(**options)
+            except ProfilerBusy:
+                logger.warning("Profiler signal ignored: a session is already running")
+        threading.Thread(target=start, daemon=True).start()
+
+    signal.signal(signum, handler)
+    signal.siginterrupt(signum, False)
+    return True
@@ -0,0 +1,181 @@
+"""
+Receipt Archive Module
+Hot/cold tiering of receipts by receipt date.
+
+Receipts dated more than RECEIPT_ARCHIVE_AFTER_DAYS ago are moved by
+scripts/archive_receipts.py from `receipt` into `receipt_archive`, a
+collection created with zstd block compression. Archived receipts are packed
+into one bucket document per owner and month:
+
+    {"owner_id": ObjectId, "month": "2023-04", "receipts": {"<id>": {...}}}
+
+so the hot collection and its indexes only hold recent receipts. Reads go
+through find_receipts(), which merges both tiers (only the month buckets a
+date range touches); editing or deleting an archived receipt first moves it
+back with restore_receipt().
+
+A move is a receipt write like any other: each moved receipt leaves a small
+`{"archived": True, "change_seq"}` stub in `receipt`, so delta sync clients
+are told it moved, and the stubs expire after RECEIPT_ARCHIVE_STUB_DAYS.
+"""
+
+from datetime import datetime, timedelta
+from os import getenv
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+from utils.db import LazyCollection, get_db
+from utils.receipt_seq import receipt_write
+
+ARCHIVE_COLLECTION = "receipt_archive"
+ARCHIVE_AFTER_DAYS = int(getenv("RECEIPT_ARCHIVE_AFTER_DAYS", "365"))
+# Stubs left in `receipt` by a move are removed by a TTL index after this long
+STUB_DAYS = int(getenv("RECEIPT_ARCHIVE_STUB_DAYS", "30"))
+# Hot receipts a reader should see: no tombstones, no archive stubs
+LIVE = {"deleted": {"$ne": True}, "archived": {"$ne": True}}
+
+receipt = LazyCollection("receipt")
+receipt_archive = LazyCollection(ARCHIVE_COLLECTION)
+
+
+def month_key(value: datetime) -> str:
+    return value.strftime("%Y-%m")
+
+
+def ensure_archive_collection():
+    """Create the zstd-compressed archive collection, its bucket index and the stub TTL (idempotent)"""
+    db = get_db()
+    if ARCHIVE_COLLECTION not in db.list_collection_names():
+        try:
+            db.create_collection(
+                ARCHIVE_COLLECTION,
+                storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}}
+            )
+        except CollectionInvalid:
+            pass  # created concurrently
+    receipt_archive.create_index([("owner_id", 1), ("month", 1)], unique=True)
+    receipt.create_index([("archived_at", 1)], expireAfterSeconds=STUB_DAYS * 86400)
+
+
+def _unpack(bucket):
+    for receipt_id, entry in bucket.get("receipts", {}).items():
+        yield {"_id": ObjectId(receipt_id), "owner_id": bucket["owner_id"], **entry}
+
+
+def find_receipts(owner_id: ObjectId, start: datetime = None, end: datetime = None) -> list:
+    """
+    Live receipts of an owner from both tiers, archived (oldest month
+    first) then hot.
+
+    Args:
+        owner_id: Receipt owner
+        start: Only receipts dated on or after this day
+        end: Only receipts dated on or before this day
+
+    Returns:
+        Receipt documents in their stored shape
+    """
+    date_range = {}
+    if start:
+        date_range["$gte"] = start
+    if end:
+        date_range["$lte"] = end
+
+    criteria = {"owner_id": owner_id, **LIVE}
+    bucket_criteria = {"owner_id": owner_id}
+    if date_range:
+        criteria["receipt_date"] = date_range
+        bucket_criteria["month"] = {op: month_key(day) for op, day in date_range.items()}
+    hot = list(receipt.find(criteria))
+
+    # A receipt caught mid-move exists in both tiers; the hot copy wins
+    seen = {r["_id"] for r in hot}
+    archived = []
+    for bucket in receipt_archive.find(bucket_criteria).sort("month", 1):
+        for r in _unpack(bucket):
+            if r["_id"] in seen:
+                continue
+            day = r.get("receipt_date")
+            if day is not None and ((start and day < start) or (end and day > end)):
+                continue
+            archived.append(r)
+    return archived + hot
+
+
+def archive_owner(owner_id: ObjectId, cutoff: datetime, batch_size: int = 500, dry_run: bool = False) -> int:
+    """
+    Move one owner's receipts dated before cutoff into month buckets.
+
+    The bucket is written before the hot copy is replaced by its stub, so
+    an interrupted run leaves a duplicate (hidden by find_receipts) rather
+    than a loss. Hot copies are only replaced if unchanged since they were
+    read; receipts edited meanwhile are taken out of the bucket again.
+
+    Returns:
+        Number of receipts moved (or that would be moved with dry_run)
+    """
+    criteria = {"owner_id": owner_id, "receipt_date": {"$lt": cutoff}, **LIVE}
+    if dry_run:
+        return receipt.count_documents(criteria)
+
+    moved = 0
+    while True:
+        docs = list(receipt.find(criteria).sort("receipt_date", 1).limit(batch_size))
+        if not docs:
+            return moved
+
+        months = {}
+        for doc in docs:
+            entry = {k: v for k, v in doc.items() if k not in ("_id", "owner_id")}
+            months.setdefault(month_key(doc["receipt_date"]), {})[f"receipts.{doc['_id']}"] = entry
+        for month, fields in months.items():
+            receipt_archive.update_one({"owner_id": owner_id, "month": month}, {"$set": fields}, upsert=True)
+
+        with receipt_write(owner_id, count=len(docs)) as seq:
+            now = datetime.utcnow()
+            result = receipt.bulk_write([
+                ReplaceOne({"_id": doc["_id"], "change_seq": doc.get("change_seq")},
+                           {"owner_id": owner_id, "archived": True, "change_seq": seq + i,
+                            "updated_at": now, "archived_at": now})
+                for i, doc in enumerate(docs)
+            ], ordered=False)
+        moved += result.modified_count
+
+        if result.modified_count < len(docs):
+            month_of = {doc["_id"]: month_key(doc["receipt_date"]) for doc in docs}
+            for kept in receipt.find({"_id": {"$in": list(month_of)}, **LIVE}, {"_id": 1}):
+                receipt_archive.update_one({"owner_id": owner_id, "month": month_of[kept["_id"]]},
+                                           {"$unset": {f"receipts.{kept['_id']}": ""}})
+            if result.modified_count == 0:
+                return moved  # every candidate is being edited; leave them for the next run
+
+
+def restore_receipt(owner_id: ObjectId, receipt_id: ObjectId) -> bool:
+    """
+    Move an archived receipt back into the hot collection.
+
+    Returns:
+        True if the receipt was found in the archive
+    """
+    field = f"receipts.{receipt_id}"
+    bucket = receipt_archive.find_one({"owner_id": owner_id, field: {"$exists": True}}, {field: 1})
+    if bucket is None:
+        return False
+    entry = bucket["receipts"][str(receipt_id)]
+    try:
+        # Takes the place of the move's stub, if it has not expired yet
+        receipt.replace_one({"_id": receipt_id, "archived": True},
+                            {"_id": receipt_id, "owner_id": owner_id, **entry}, upsert=True)
+    except DuplicateKeyError:
+        pass  # restored concurrently, or left behind by an interrupted archive run
+    receipt_archive.update_one({"_id": bucket["_id"]}, {"$unset": {field: ""}})
+    receipt_archive.delete_one({"_id": bucket["_id"], "receipts": {}})
+    return True
+
+
+def archive_cutoff(days: int = ARCHIVE_AFTER_DAYS) -> datetime:
+    """Midnight `days` ago; receipts dated before it belong in the archive"""
+    today = datetime.utcnow()
+    return datetime(today.year, today.month, today.day) - timedelta(days=days)
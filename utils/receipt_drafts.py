@@ -0,0 +1,186 @@
+"""
+Receipt Drafts Module
+Uploaded receipt photos and the draft receipts read from them.
+
+Photos are streamed into the `receipt_images` GridFS bucket and a draft in
+`receipt_drafts` follows each one through the OCR pipeline (ocr/pipeline.py):
+queued -> processing -> ready | failed. A draft is claimed atomically, so
+only one worker processes it even when several re-queue pending drafts
+after a restart. Confirming a draft turns its (user-corrected) fields into
+a receipt that keeps a link to the photo.
+"""
+
+import io
+import logging
+from datetime import datetime, timedelta
+from os import getenv
+
+from bson import ObjectId
+from gridfs import GridFSBucket
+from gridfs.errors import NoFile
+from pymongo import ReturnDocument
+
+from ocr.pipeline import ReceiptPipeline
+from utils.db import LazyCollection, get_db
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_BYTES = int(getenv("RECEIPT_UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+# Drafts stuck in "processing" this long (worker died mid-batch) are queued again
+STALE_AFTER = timedelta(seconds=int(getenv("RECEIPT_PIPELINE_STALE_SECONDS", "600")))
+
+receipt_drafts = LazyCollection("receipt_drafts")
+
+_on_finished = None
+
+
+def images_bucket() -> GridFSBucket:
+    return GridFSBucket(get_db(), bucket_name="receipt_images")
+
+
+def sniff_image_type(head: bytes):
+    """Content type of a JPEG, PNG or WebP file from its first bytes, else None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def store_upload(owner_id: ObjectId, stream, filename: str, content_type: str) -> ObjectId:
+    """
+    Stream an uploaded photo into GridFS and create its queued draft.
+
+    Returns:
+        Draft id
+    """
+    now = datetime.utcnow()
+    image_id = images_bucket().upload_from_stream(
+        filename or "receipt", stream,
+        metadata={"owner_id": owner_id, "content_type": content_type}
+    )
+    return receipt_drafts.insert_one({
+        "owner_id": owner_id,
+        "image_id": image_id,
+        "filename": filename,
+        "status": "queued",
+        "created_at": now,
+        "updated_at": now
+    }).inserted_id
+
+
+def enqueue(draft_id) -> bool:
+    """Hand a draft to this worker's pipeline; False when the pipeline is full"""
+    return pipeline.submit(draft_id)
+
+
+def _claim(draft_ids):
+    """Pipeline loader: mark queued drafts as processing and read their photos"""
+    bucket = images_bucket()
+    items = []
+    for draft_id in draft_ids:
+        draft = receipt_drafts.find_one_and_update(
+            {"_id": draft_id, "status": "queued"},
+            {"$set": {"status": "processing", "started_at": datetime.utcnow()}},
+            projection={"image_id": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if draft is None:
+            continue  # discarded, or claimed by another worker
+        try:
+            items.append((draft_id, bucket.open_download_stream(draft["image_id"]).read()))
+        except NoFile:
+            receipt_drafts.update_one({"_id": draft_id}, {"$set": {"status": "failed", "error": "Image missing"}})
+    return items
+
+
+def _save(draft_id, result):
+    """Pipeline sink: store the thumbnail and extracted fields on the draft"""
+    draft = receipt_drafts.find_one({"_id": draft_id}, {"owner_id": 1})
+    if draft is None:
+        return  # discarded while processing
+    update = {
+        "status": "failed" if result["error"] else "ready",
+        "fields": result["fields"],
+        "lines": [text for text, _ in result["lines"]],
+        "error": result["error"],
+        "updated_at": datetime.utcnow()
+    }
+    if result["thumbnail"]:
+        update["thumbnail_id"] = images_bucket().upload_from_stream(
+            f"thumbnail-{draft_id}.jpg", io.BytesIO(result["thumbnail"]),
+            metadata={"owner_id": draft["owner_id"], "content_type": "image/jpeg"}
+        )
+    draft = receipt_drafts.find_one_and_update(
+        {"_id": draft_id}, {"$set": update}, return_document=ReturnDocument.AFTER)
+    if draft is not None and _on_finished is not None:
+        _on_finished(draft)
+
+
+def on_finished(callback):
+    """Register a callback(draft) run when a draft leaves the pipeline"""
+    global _on_finished
+    _on_finished = callback
+
+
+def resume_pending():
+    """Re-queue drafts left behind by a previous process (called once per worker)"""
+    try:
+        receipt_drafts.update_many(
+            {"status": "processing", "started_at": {"$lt": datetime.utcnow() - STALE_AFTER}},
+            {"$set": {"status": "queued"}}
+        )
+        for draft in receipt_drafts.find({"status": "queued"}, {"_id": 1}).limit(pipeline.queue_size // 2):
+            if not enqueue(draft["_id"]):
+                break
+    except Exception as e:
+        logger.warning(f"Could not resume pending receipt drafts: {e}")
+
+
+def delete_images(*file_ids):
+    bucket = images_bucket()
+    for file_id in file_ids:
+        if file_id is None:
+            continue
+        try:
+            bucket.delete(file_id)
+        except NoFile:
+            pass
+
+
+def find_image(owner_id: ObjectId, file_id: ObjectId):
+    """Open a stored photo or thumbnail of this owner, or None"""
+    try:
+        stream = images_bucket().open_download_stream(file_id)
+    except NoFile:
+        return None
+    if (stream.metadata or {}).get("owner_id") != owner_id:
+        stream.close()
+        return None
+    return stream
+
+
+def serialize_draft(draft) -> dict:
+    """JSON-safe API shape of a draft"""
+    return {
+        "_id": str(draft["_id"]),
+        "status": draft["status"],
+        "filename": draft.get("filename"),
+        "image_id": str(draft["image_id"]),
+        "thumbnail_id": str(draft["thumbnail_id"]) if draft.get("thumbnail_id") else None,
+        "fields": draft.get("fields") or {},
+        "lines": draft.get("lines") or [],
+        "error": draft.get("error"),
+        "created_at": draft["created_at"].isoformat()
+    }
+
+
+pipeline = ReceiptPipeline(
+    _claim, _save,
+    processes=int(getenv("RECEIPT_PIPELINE_PROCESSES", "1")),
+    queue_size=int(getenv("RECEIPT_PIPELINE_QUEUE", "64")),
+    max_batch=int(getenv("RECEIPT_PIPELINE_BATCH", "4")),
+    max_wait=float(getenv("RECEIPT_PIPELINE_MAX_WAIT_MS", "200")) / 1000
+)
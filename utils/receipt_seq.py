@@ -0,0 +1,85 @@
+"""
+Receipt Sequence Module
+Per-user change sequences and data versions of receipts.
+
+Every receipt write (including an archive move) takes change sequences from
+the user's `receipt_version` counter and stores them as `change_seq`, so
+GET /api/receipt/changes can return everything after a client's cursor.
+Sequences are allocated before their write commits; until the write block
+exits they are listed in `pending_seqs` and hold delta sync cursors back.
+`receipt_data_version` is bumped after every write and feeds the ETags.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from os import getenv
+
+from bson import ObjectId
+
+from utils.db import LazyCollection
+
+# A receipt write still pending after this long died with its worker
+RECEIPT_WRITE_TIMEOUT = timedelta(seconds=int(getenv("RECEIPT_WRITE_TIMEOUT_SECONDS", "60")))
+
+users = LazyCollection("users")
+
+
+def get_receipt_version(user_id):
+    """Per-user receipt data version for ETags, bumped after every receipt write"""
+    doc = users.find_one({"_id": ObjectId(user_id)}, {"receipt_data_version": 1})
+    return (doc or {}).get("receipt_data_version", 0)
+
+
+def get_receipt_horizon(user_id):
+    """
+    Delta sync bounds of a user's receipts.
+
+    Returns:
+        (horizon, allocated): every change sequence up to horizon has been
+        written (or abandoned), so a sync cursor may advance that far;
+        allocated is the last sequence handed out
+    """
+    doc = users.find_one({"_id": ObjectId(user_id)}, {"receipt_version": 1, "pending_seqs": 1}) or {}
+    allocated = doc.get("receipt_version", 0)
+    cutoff = datetime.utcnow() - RECEIPT_WRITE_TIMEOUT
+    pending = [p["seq"] for p in doc.get("pending_seqs", []) if p["at"] >= cutoff]
+    if len(pending) < len(doc.get("pending_seqs", [])):
+        # Left behind by a worker that died mid-write
+        users.update_one({"_id": ObjectId(user_id)}, {"$pull": {"pending_seqs": {"at": {"$lt": cutoff}}}})
+    return (min(pending) - 1 if pending else allocated), allocated
+
+
+def next_receipt_seq(user_id, count: int = 1):
+    """
+    Allocate the next `count` receipt change sequences for a user and mark
+    them in flight in the same atomic update (compare-and-set on the
+    counter); returns the first one.
+    """
+    while True:
+        doc = users.find_one({"_id": ObjectId(user_id)}, {"receipt_version": 1}) or {}
+        current = doc.get("receipt_version", 0)
+        result = users.update_one(
+            {"_id": ObjectId(user_id), "receipt_version": current if current else {"$in": [0, None]}},
+            {"$set": {"receipt_version": current + count},
+             "$push": {"pending_seqs": {"seq": current + 1, "at": datetime.utcnow()}}}
+        )
+        if result.modified_count:
+            return current + 1
+
+
+@contextmanager
+def receipt_write(user_id, count: int = 1):
+    """
+    Allocate change sequences for a receipt write (`count` consecutive ones
+    starting at the yielded value). Once the block exits (written or not)
+    they stop holding back delta sync cursors and the data version used for
+    ETags is bumped.
+    """
+    seq = next_receipt_seq(user_id, count)
+    try:
+        yield seq
+    finally:
+        users.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$pull": {"pending_seqs": {"seq": seq}}, "$inc": {"receipt_data_version": 1}}
+        )
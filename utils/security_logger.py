@@ -1,38 +1,57 @@
 """
 Security Event Logging Module
 Structured logging for authentication and security events
+
+Events are queued on the request thread and written as JSON lines by a
+background batch writer (see utils.log_writer), with size/time rotation and
+gzip-compressed archives. Pending events are flushed at interpreter exit.
 """
 
 import logging
 from datetime import datetime
 from functools import wraps
+from os import getenv
 from flask import request, g
-import json
+
+from utils.log_writer import AsyncBatchHandler, RotatingFile, dumps
+
+SECURITY_LOG_PATH = getenv("SECURITY_LOG_PATH", "logs/security.log")
 
 # Configure security logger
 security_logger = logging.getLogger('security')
 security_logger.setLevel(logging.INFO)
 
-# File handler for security events
-security_handler = logging.FileHandler('logs/security.log')
-security_handler.setLevel(logging.INFO)
-
 # JSON formatter for structured logs
 class JSONFormatter(logging.Formatter):
     def format(self, record):
         log_data = {
-            'timestamp': datetime.utcnow().isoformat(),
+            # When the event happened, not when the writer thread got to it
+            'timestamp': datetime.utcfromtimestamp(record.created).isoformat(),
             'level': record.levelname,
             'event': record.msg,
             'ip': getattr(record, 'ip', None),
             'user': getattr(record, 'user', None),
             'endpoint': getattr(record, 'endpoint', None),
             'method': getattr(record, 'method', None),
-           'status': getattr(record, 'status', None),
+            'status': getattr(record, 'status', None),
             'details': getattr(record, 'details', {})
         }
-        return json.dumps(log_data)
-
+        return dumps(log_data)
+
+# Non-blocking file handler for security events
+security_handler = AsyncBatchHandler(
+    RotatingFile(
+        SECURITY_LOG_PATH,
+        max_bytes=int(getenv("SECURITY_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        interval=int(getenv("SECURITY_LOG_ROTATE_SECONDS", "86400")),
+        backups=int(getenv("SECURITY_LOG_BACKUPS", "14")),
+        compress=getenv("SECURITY_LOG_COMPRESS", "true").lower() == "true"
+    ),
+    batch_size=int(getenv("SECURITY_LOG_BATCH_SIZE", "256")),
+    flush_interval=float(getenv("SECURITY_LOG_FLUSH_INTERVAL", "0.5")),
+    queue_size=int(getenv("SECURITY_LOG_QUEUE_SIZE", "10000"))
+)
+security_handler.setLevel(logging.INFO)
 security_handler.setFormatter(JSONFormatter())
 security_logger.addHandler(security_handler)
 
@@ -172,10 +191,6 @@ def log_session_event(event, user):
     )
 
 
-# Initialize logs directory
-import os
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-    # Create initial security log file
-    with open('logs/security.log', 'w') as f:
-        f.write('')  # Create empty file
+def flush_security_log():
+    """Write out every queued event (e.g. from a worker_exit hook)"""
+    security_handler.writer.close()
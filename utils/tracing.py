@@ -0,0 +1,213 @@
+"""
+Tracing Module
+Lightweight per-request trace spans with a local JSON-lines exporter.
+
+A sampled request opens a root span; nested `span()` blocks (get_user_api,
+e-invoice logins and upstream calls, MongoDB commands via a pymongo
+listener) attach to it through a contextvar, so code never passes spans
+around. Each finished trace is written as one line to TRACE_LOG_PATH by the
+background log writer. Unsampled requests only pay for one contextvar
+lookup per span.
+
+    python scripts/trace_view.py          # waterfall of the slowest traces
+"""
+
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import getenv
+
+from flask import g, request
+from pymongo import monitoring
+
+from utils.log_writer import BatchWriter, RotatingFile
+
+TRACE_SAMPLE_RATE = float(getenv("TRACE_SAMPLE_RATE", "0"))
+# When > 0 every request is recorded and also kept if it took at least this long
+TRACE_SLOW_MS = float(getenv("TRACE_SLOW_MS", "0"))
+TRACE_LOG_PATH = getenv("TRACE_LOG_PATH", "logs/traces.jsonl")
+
+_current = ContextVar("trace_span", default=None)
+
+_exporter = BatchWriter(
+    RotatingFile(
+        TRACE_LOG_PATH,
+        max_bytes=int(getenv("TRACE_LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+        interval=86400,
+        backups=int(getenv("TRACE_LOG_BACKUPS", "7"))
+    ),
+    batch_size=64,
+    flush_interval=1.0
+)
+
+
+class Trace:
+    def __init__(self, sampled: bool):
+        self.trace_id = os.urandom(8).hex()
+        self.sampled = sampled
+        self.spans = []
+        self.start = time.time()
+        self.start_perf = time.perf_counter()
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "start_perf", "duration", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id=None, attrs=None):
+        self.trace = trace
+        self.span_id = os.urandom(4).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs or {}
+        self.start_perf = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, end_perf=None):
+        self.duration = (end_perf or time.perf_counter()) - self.start_perf
+        self.trace.spans.append(self)
+
+    def to_dict(self) -> dict:
+        data = {
+            "id": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start_perf - self.trace.start_perf) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+def current_span():
+    """The innermost open span of this request, or None when not tracing"""
+    return _current.get()
+
+
+def current_trace_id():
+    span = _current.get()
+    return span.trace.trace_id if span else None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time a block as a child of the current span. A no-op (yields None)
+    outside a recorded trace.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attrs)
+    token = _current.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def start_trace(name: str, **attrs):
+    """
+    Open a root span for this context if the trace is sampled (or slow
+    tracing is on). Returns (root span, contextvar token), or (None, None).
+    """
+    sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    if not sampled and TRACE_SLOW_MS <= 0:
+        return None, None
+    root = Span(Trace(sampled), name, attrs=attrs)
+    return root, _current.set(root)
+
+
+def end_trace(root: Span, token, **attrs):
+    """Close the root span and export the trace if it is sampled or slow"""
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Closed from another context (e.g. after a streamed response)
+        _current.set(None)
+    root.set(**attrs)
+    root.finish()
+    trace = root.trace
+    if not trace.sampled and root.duration * 1000 < TRACE_SLOW_MS:
+        return
+    _exporter.submit({
+        "trace_id": trace.trace_id,
+        "name": root.name,
+        "timestamp": trace.start,
+        "duration_ms": round(root.duration * 1000, 3),
+        "sampled": trace.sampled,
+        "spans": [s.to_dict() for s in sorted(trace.spans, key=lambda s: s.start_perf)],
+    })
+
+
+def init_app(app):
+    """Open a root span per request, closed when the request context is torn down"""
+
+    @app.before_request
+    def _start_request_trace():
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        root, token = start_trace(f"{request.method} {rule}", path=request.path)
+        if root is not None:
+            g.trace = (root, token)
+
+    @app.after_request
+    def _trace_headers(response):
+        trace = g.get("trace")
+        if trace is not None:
+            trace[0].set(status=response.status_code)
+            if trace[0].trace.sampled:
+                response.headers["X-Trace-Id"] = trace[0].trace.trace_id
+        return response
+
+    @app.teardown_request
+    def _end_request_trace(error=None):
+        trace = g.pop("trace", None)
+        if trace is not None:
+            root, token = trace
+            if error is not None:
+                root.error = f"{type(error).__name__}: {error}"
+            end_trace(root, token)
+
+
+class TracingCommandListener(monitoring.CommandListener):
+    """Records MongoDB commands as spans of the trace that issued them"""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        parent = _current.get()
+        if parent is not None:
+            collection = event.command.get(event.command_name)
+            self._pending[(event.request_id, event.connection_id)] = (
+                parent, time.perf_counter(), collection if isinstance(collection, str) else None)
+
+    def _finish(self, event, error=None):
+        pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        parent, start, collection = pending
+        child = Span(parent.trace, f"mongo.{event.command_name}", parent.span_id,
+                     {"collection": collection} if collection else None)
+        child.start_perf = start
+        child.error = error
+        child.finish()
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, error=str(event.failure))
@@ -5,6 +5,8 @@ Provides functions to validate and sanitize user inputs.
 import re
 from typing import Tuple
 
+from utils.money import currency_exponent, decimal_places
+
 
 def validate_email(email: str) -> Tuple[bool, str]:
     """
@@ -63,12 +65,13 @@ def validate_password_strength(password: str) -> Tuple[bool, str]:
     return True, ""
 
 
-def validate_amount(amount) -> Tuple[bool, str]:
+def validate_amount(amount, currency: str = None) -> Tuple[bool, str]:
     """
     Validate receipt amount.
     
     Args:
         amount: Amount to validate (can be string or number)
+        currency: When given, reject more decimals than its minor unit allows
         
     Returns:
         Tuple of (is_valid, error_message)
@@ -84,6 +87,12 @@ def validate_amount(amount) -> Tuple[bool, str]:
     if amount_float > 999999999:  # Reasonable upper limit
         return False, "Amount is too large"
     
+    if amount_float != amount_float:  # NaN
+        return False, "Amount must be a valid number"
+    
+    if currency and decimal_places(amount) > currency_exponent(currency):
+        return False, f"Amount has too many decimal places for {currency.upper().strip()}"
+    
     return True, ""
 
 